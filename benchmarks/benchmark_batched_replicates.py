@@ -0,0 +1,123 @@
+"""_summary_
+
+This Python script benchmarks the throughput per core of replicates of a simulation advanced together (run_replicates, engine="vectorized",
+and engine="numba" if numba is installed) against the same replicates run one after the other with run_simulation (engine="vectorized"),
+i.e. as separate processes would run them on one core each, reporting replicate steps per second and the speedup of the batches.
+The tumour sizes of the batches are checked to be the same as those of the separate runs.
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_batched_replicates --n-replicates 16 --T 40 --output benchmark_batched_replicates.csv
+
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+import numpy as np
+import pandas as pd
+
+from classes_and_functions.lattice_classes import ArrayLattice
+from classes_and_functions.settings import get_simulation_parameters
+from classes_and_functions.sweep_functions import run_simulation, run_replicates, copy_lattice_for_run, read_lattice
+from classes_and_functions.random_functions import get_replicate_rngs
+from classes_and_functions.numba_functions import NUMBA_AVAILABLE
+
+from typing import List
+
+def benchmark_batched_replicates(
+    base_lattice: ArrayLattice,
+    model_types: List[str],
+    seeding_density: float,
+    n_replicates: int=16,
+    T: int=40,
+    seed: int=0
+) -> pd.DataFrame:
+    """_summary_
+
+    This function times n_replicates replicates of T steps for every model type, run separately and in batches.
+
+    Args:
+        base_lattice (ArrayLattice): the lattice without cancer cells
+        model_types (List[str]): the model types
+        seeding_density (float): number of cancer cells initialised per CV
+        n_replicates (int, optional): the number of replicates. Defaults to 16.
+        T (int, optional): the number of time steps. Defaults to 40.
+        seed (int, optional): the seed of the random number generators of the replicates. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: a DataFrame containing model_type, mode (separate, batched_vectorized, batched_numba), time_s, replicate_steps_per_s,
+            speedup (against separate) and is_same (whether the tumour sizes are those of the separate runs)
+    """
+
+    engines = ["vectorized"] + (["numba"] if NUMBA_AVAILABLE else [])
+    snapshot_times = [T]
+    results = []
+    for model_type in model_types:
+        parameters = get_simulation_parameters(model_type)
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            separate_tumour_sizes = []
+            for replicate, rng in enumerate(get_replicate_rngs(seed, n_replicates)):
+                tumour_sizes = run_simulation(
+                    copy_lattice_for_run(base_lattice), model_type, seeding_density, T, parameters,
+                    snapshot_times=snapshot_times, engine="vectorized", rng=rng
+                )
+                separate_tumour_sizes.append(tumour_sizes.assign(replicate=replicate))
+        time_s = time.perf_counter() - start
+        separate_tumour_sizes = pd.concat(separate_tumour_sizes, ignore_index=True)
+        results.append({"model_type": model_type, "mode": "separate", "time_s": time_s, "is_same": True})
+
+        for engine in engines:
+            if engine == "numba": # compile before timing
+                with contextlib.redirect_stdout(io.StringIO()):
+                    run_replicates(base_lattice, model_type, seeding_density, 1, parameters, get_replicate_rngs(seed, 1), engine=engine)
+
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                tumour_sizes = run_replicates(
+                    base_lattice, model_type, seeding_density, T, parameters, get_replicate_rngs(seed, n_replicates),
+                    snapshot_times=snapshot_times, engine=engine
+                )
+            time_s = time.perf_counter() - start
+            # the numba engine follows the rules of the loop engine, with other random numbers
+            is_same = tumour_sizes.equals(separate_tumour_sizes[tumour_sizes.columns]) if engine == "vectorized" else np.nan
+            results.append({"model_type": model_type, "mode": f"batched_{engine}", "time_s": time_s, "is_same": is_same})
+
+        for result in results[-1-len(engines):]:
+            print(f"> {model_type} {result['mode']}: {result['time_s']:.2f} s")
+
+    results = pd.DataFrame(results)
+    results["replicate_steps_per_s"] = n_replicates * T / results["time_s"]
+    results["speedup"] = results.groupby("model_type")["time_s"].transform("first") / results["time_s"]
+    return results[["model_type", "mode", "time_s", "replicate_steps_per_s", "speedup", "is_same"]]
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark replicates advanced together against separate runs")
+    parser.add_argument("--lattice", default="./files/lattice_with_CVs_PTs_2025-06-23_annotated_without_tumour.csv",
+                        help="path to a lattice directory (see lattice_io_functions.py) or CSV file without tumour")
+    parser.add_argument("--lattice-settings", default=None, help="path to lattice settings, to generate the lattice instead of reading --lattice")
+    parser.add_argument("--lattice-size", type=int, default=None, help="lattice size of the generated lattice")
+    parser.add_argument("--model-types", nargs="+", default=["model_1", "model_2", "model_3", "model_4"])
+    parser.add_argument("--seeding-density", type=float, default=1)
+    parser.add_argument("--n-replicates", type=int, default=16)
+    parser.add_argument("--T", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="path to a CSV file to save the results")
+    args = parser.parse_args()
+
+    base_lattice = read_lattice(
+        path_to_lattice=None if args.lattice_settings is not None else args.lattice,
+        path_to_lattice_settings=args.lattice_settings,
+        lattice_size=args.lattice_size
+    )
+    results = benchmark_batched_replicates(
+        base_lattice, args.model_types, args.seeding_density, n_replicates=args.n_replicates, T=args.T, seed=args.seed
+    )
+    print(results.to_string(index=False))
+
+    if args.output is not None:
+        results.to_csv(args.output, index=False)
@@ -0,0 +1,110 @@
+"""_summary_
+
+This Python script benchmarks the strong scaling of DomainDecomposedSimulation: the same simulation, on a lattice generated with generate_lattice,
+with increasing numbers of subdomains, one worker process per subdomain, reporting the time per step, the speedup and the parallel efficiency
+against a single subdomain, and the number of halo sites read across subdomain boundaries.
+
+Run from the root of the repository, on a machine with at least as many cores as the largest number of subdomains:
+    python -m benchmarks.benchmark_domain_decomposition --lattice-size 960 --n-domains 1 8 16 32 --output benchmark_domain_decomposition.csv
+
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from classes_and_functions.cell_classes import CancerCell, Hepatocyte
+from classes_and_functions.lattice_classes import ArrayLattice
+from classes_and_functions.lattice_generation_functions import generate_lattice
+from classes_and_functions.settings import get_simulation_parameters
+from classes_and_functions.initialisation_functions import init_cell_dictionaries
+from classes_and_functions.sweep_functions import copy_lattice_for_run
+from classes_and_functions.domain_functions import DomainDecomposedSimulation, partition_lattice, get_halo_site_ids
+
+from typing import List
+
+def benchmark_domain_decomposition(
+    base_lattice: ArrayLattice,
+    model_type: str,
+    seeding_density: float,
+    n_domains: List[int],
+    n_steps: int=20,
+    seed: int=0
+) -> pd.DataFrame:
+    """_summary_
+
+    This function times n_steps steps of DomainDecomposedSimulation for every number of subdomains, from the same initial lattice and seed.
+
+    Args:
+        base_lattice (ArrayLattice): the lattice before initialisation of CancerCell objects, see generate_lattice
+        model_type (str): model type to implement in the simulation
+        seeding_density (float): number of cancer cells initialised per CV
+        n_domains (List[int]): the numbers of subdomains, the first being the reference of speedups
+        n_steps (int, optional): the number of time steps. Defaults to 20.
+        seed (int, optional): the seed of the random number generators. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: a DataFrame containing n_domains, n_sites, n_halo_sites, time_s (excluding the start of the worker processes),
+            time_per_step_ms, speedup, efficiency and n_cancer_cells (after n_steps steps)
+    """
+
+    parameters = get_simulation_parameters(model_type)
+    n_CVs = int((base_lattice.site_type == 0).sum())
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, lattice = init_cell_dictionaries(
+            lattice=copy_lattice_for_run(base_lattice), n_cancer_cells_init=int(seeding_density * n_CVs),
+            CancerCell=CancerCell, Hepatocyte=Hepatocyte, rng=np.random.default_rng(seed)
+        )
+
+    results = []
+    for n in n_domains:
+        domain_of_site = partition_lattice(lattice, n)
+        n_halo_sites = sum(get_halo_site_ids(lattice, domain_of_site, domain).size for domain in range(n))
+
+        with DomainDecomposedSimulation(lattice, parameters, model_type=model_type, n_domains=n, n_workers=n, rng=seed) as simulation:
+            simulation.step() # the worker processes start on the first step
+            start = time.perf_counter()
+            simulation.run(n_steps)
+            time_s = time.perf_counter() - start
+            n_cancer_cells = int(np.count_nonzero(simulation.lattice.site_type == 4))
+
+        results.append({
+            "n_domains": n, "n_sites": lattice.n_sites, "n_halo_sites": n_halo_sites,
+            "time_s": time_s, "time_per_step_ms": time_s / n_steps * 1e3, "n_cancer_cells": n_cancer_cells
+        })
+        print(f"> {n} subdomains: {time_s / n_steps * 1e3:.1f} ms per step, {n_halo_sites} halo sites")
+
+    results = pd.DataFrame(results)
+    results["speedup"] = results["time_s"].iloc[0] / results["time_s"]
+    results["efficiency"] = results["speedup"] * results["n_domains"].iloc[0] / results["n_domains"]
+    return results
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the strong scaling of the domain decomposed simulation")
+    parser.add_argument("--lattice-settings", default="./files/lattice_settings_2025-06-23.json")
+    parser.add_argument("--lattice-size", type=int, default=960, help="lattice size of the generated lattice")
+    parser.add_argument("--model-type", default="model_1")
+    parser.add_argument("--seeding-density", type=float, default=1)
+    parser.add_argument("--n-domains", type=int, nargs="+", default=[1, 8, 16, 32])
+    parser.add_argument("--n-steps", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="path to a CSV file to save the results")
+    args = parser.parse_args()
+
+    with open(args.lattice_settings) as json_file:
+        lattice_settings = json.load(json_file)
+
+    base_lattice = generate_lattice(lattice_settings, lattice_size=args.lattice_size)
+    results = benchmark_domain_decomposition(
+        base_lattice, args.model_type, args.seeding_density, args.n_domains, n_steps=args.n_steps, seed=args.seed
+    )
+    print(results.to_string(index=False))
+
+    if args.output is not None:
+        results.to_csv(args.output, index=False)
@@ -0,0 +1,130 @@
+"""_summary_
+
+This Python script checks that sample_killed_site_ids draws the cancer cells killed by implicit immune predation with the same distribution
+as sampling K sites out of the whole lattice (as described for model_3 in README.md), and benchmarks both against lattice size.
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_immune_predation --n-sites 10000 100000 1000000 --n-tumour-sites 1000 --output benchmark_immune_predation.csv
+
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from classes_and_functions.vectorized_functions import sample_killed_site_ids
+
+from typing import List
+
+def sample_killed_site_ids_over_lattice(tumour_site_ids: np.ndarray, n_sites: int, p_cc_killed: float, rng: np.random.Generator) -> np.ndarray:
+    # the sampling described in README.md: K sites out of the N lattice sites are attacked, and cancer cells under attack are killed with a probability
+    site_ids_immune_attack = rng.choice(n_sites, size=tumour_site_ids.size, replace=False)
+    attacked_site_ids = tumour_site_ids[np.isin(tumour_site_ids, site_ids_immune_attack)]
+    return attacked_site_ids[rng.random(attacked_site_ids.size) < p_cc_killed]
+
+def check_equivalence(n_sites: int, n_tumour_sites: int, p_cc_killed: float, n_samples: int=20000, seed: int=0) -> pd.DataFrame:
+    """_summary_
+
+    This function compares the number of cancer cells killed, and how often each cancer cell is killed, between both samplings.
+
+    Args:
+        n_sites (int): the number N of lattice sites
+        n_tumour_sites (int): the number K of sites occupied by cancer cells
+        p_cc_killed (float): the probability of a cancer cell under attack being killed
+        n_samples (int, optional): the number of predation steps sampled with each sampling. Defaults to 20000.
+        seed (int, optional): the seed of the random number generator. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: a DataFrame containing the test, its statistic and p-value
+    """
+
+    rng = np.random.default_rng(seed)
+    tumour_site_ids = np.sort(rng.choice(n_sites, size=n_tumour_sites, replace=False))
+
+    n_killed = {}
+    n_times_killed = {}
+    for name, sample in (("over_lattice", sample_killed_site_ids_over_lattice), ("over_tumour", sample_killed_site_ids)):
+        killed_site_ids = [sample(tumour_site_ids, n_sites, p_cc_killed, rng=rng) for _ in range(n_samples)]
+        n_killed[name] = np.array([site_ids.size for site_ids in killed_site_ids])
+        n_times_killed[name] = np.bincount(np.searchsorted(tumour_site_ids, np.concatenate(killed_site_ids)), minlength=n_tumour_sites)
+
+    # the number of cancer cells killed follows the same distribution
+    values = np.union1d(n_killed["over_lattice"], n_killed["over_tumour"])
+    counts = np.array([[np.count_nonzero(n_killed[name] == value) for value in values] for name in n_killed])
+    chi2, p_value_n_killed, _, _ = stats.chi2_contingency(counts)
+
+    # every cancer cell is killed with the same probability, p_cc_killed * K/N
+    p_killed = p_cc_killed * n_tumour_sites / n_sites
+    chi2_uniform, p_value_uniform = stats.chisquare(n_times_killed["over_tumour"])
+
+    return pd.DataFrame([
+        {"test": "n_killed, chi2 two-sample", "statistic": chi2, "p_value": p_value_n_killed},
+        {"test": "mean n_killed, over_lattice", "statistic": n_killed["over_lattice"].mean(), "p_value": np.nan},
+        {"test": "mean n_killed, over_tumour", "statistic": n_killed["over_tumour"].mean(), "p_value": np.nan},
+        {"test": "mean n_killed, expected", "statistic": n_tumour_sites * p_killed, "p_value": np.nan},
+        {"test": "killed cells uniform over tumour, chi2", "statistic": chi2_uniform, "p_value": p_value_uniform}
+    ])
+
+def benchmark_immune_predation(n_sites_list: List[int], n_tumour_sites: int, p_cc_killed: float, n_repeats: int=20, seed: int=0) -> pd.DataFrame:
+    """_summary_
+
+    This function times both samplings for a tumour of fixed size on lattices of increasing sizes.
+
+    Args:
+        n_sites_list (List[int]): the numbers N of lattice sites
+        n_tumour_sites (int): the number K of sites occupied by cancer cells
+        p_cc_killed (float): the probability of a cancer cell under attack being killed
+        n_repeats (int, optional): the number of repeats, of which the median is reported. Defaults to 20.
+        seed (int, optional): the seed of the random number generator. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: a DataFrame containing n_sites, n_tumour_sites, time_over_lattice_ms, time_over_tumour_ms
+    """
+
+    rng = np.random.default_rng(seed)
+
+    results = []
+    for n_sites in n_sites_list:
+        tumour_site_ids = np.sort(rng.choice(n_sites, size=n_tumour_sites, replace=False))
+
+        times = {}
+        for name, sample in (("over_lattice", sample_killed_site_ids_over_lattice), ("over_tumour", sample_killed_site_ids)):
+            times[name] = []
+            for _ in range(n_repeats):
+                start = time.perf_counter()
+                sample(tumour_site_ids, n_sites, p_cc_killed, rng=rng)
+                times[name].append(time.perf_counter() - start)
+
+        results.append({
+            "n_sites": n_sites,
+            "n_tumour_sites": n_tumour_sites,
+            "time_over_lattice_ms": np.median(times["over_lattice"]) * 1e3,
+            "time_over_tumour_ms": np.median(times["over_tumour"]) * 1e3
+        })
+        print(f"> n_sites = {n_sites}: {results[-1]['time_over_lattice_ms']:.3f} ms over the lattice, {results[-1]['time_over_tumour_ms']:.3f} ms over the tumour")
+
+    return pd.DataFrame(results)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Check and benchmark the sampling of cancer cells killed by implicit immune predation")
+    parser.add_argument("--n-sites", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--n-tumour-sites", type=int, default=1000)
+    parser.add_argument("--p-cc-killed", type=float, default=0.5)
+    parser.add_argument("--n-samples", type=int, default=20000, help="number of predation steps sampled to check the distribution")
+    parser.add_argument("--n-repeats", type=int, default=20)
+    parser.add_argument("--output", default=None, help="path to a CSV file to save the benchmark results")
+    args = parser.parse_args()
+
+    # a tumour covering a sizeable part of a small lattice, so that many cells are killed per step
+    equivalence = check_equivalence(n_sites=2000, n_tumour_sites=600, p_cc_killed=args.p_cc_killed, n_samples=args.n_samples)
+    print(equivalence.to_string(index=False))
+
+    results = benchmark_immune_predation(args.n_sites, args.n_tumour_sites, args.p_cc_killed, n_repeats=args.n_repeats)
+    print(results.to_string(index=False))
+
+    if args.output is not None:
+        results.to_csv(args.output, index=False)
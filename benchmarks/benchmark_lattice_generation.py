@@ -0,0 +1,90 @@
+"""_summary_
+
+This Python script benchmarks the generation of lattices of increasing sizes with generate_lattice,
+reporting the generation time and the peak memory allocated.
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_lattice_generation --lattice-sizes 60 120 240 480 960 --output benchmark_lattice_generation.csv
+
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+import pandas as pd
+
+from classes_and_functions.lattice_generation_functions import generate_lattice
+
+from typing import Dict, List
+
+def benchmark_lattice_generation(lattice_settings: Dict, lattice_sizes: List[int], n_repeats: int=3) -> pd.DataFrame:
+    """_summary_
+
+    This function times the generation of lattices of the given sizes, and traces the peak memory allocated.
+
+    Args:
+        lattice_settings (Dict): settings of the lattice, including spacing, lobule_size, lattice_size, spacing_CV_CV, spacing_CV_PT
+        lattice_sizes (List[int]): the numbers of rings of sites around the origin
+        n_repeats (int, optional): the number of repeats, of which the fastest is reported. Defaults to 3.
+
+    Returns:
+        pd.DataFrame: a DataFrame containing lattice_size, n_sites, n_CVs, time_s, peak_memory_MB, lattice_memory_MB, bytes_per_site
+    """
+
+    results = []
+    for lattice_size in lattice_sizes:
+
+        times = []
+        for _ in range(n_repeats):
+            start = time.perf_counter()
+            lattice = generate_lattice(lattice_settings, lattice_size=lattice_size)
+            times.append(time.perf_counter() - start)
+            del lattice
+
+        # peak memory is traced in a separate run, as tracing slows down allocations
+        tracemalloc.start()
+        lattice = generate_lattice(lattice_settings, lattice_size=lattice_size)
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        lattice_memory = sum(
+            array.nbytes for array in (
+                lattice.x, lattice.y, lattice.site_type, lattice.cell_id,
+                lattice.cell_state, lattice.zonation_type, lattice.adjacent_site_ids
+            )
+        )
+
+        results.append({
+            "lattice_size": lattice_size,
+            "n_sites": lattice.n_sites,
+            "n_CVs": int((lattice.site_type == 0).sum()),
+            "time_s": min(times),
+            "peak_memory_MB": peak_memory / 2**20,
+            "lattice_memory_MB": lattice_memory / 2**20,
+            "bytes_per_site": peak_memory / lattice.n_sites
+        })
+        print(f"> lattice_size = {lattice_size}: {lattice.n_sites} sites in {min(times):.3f} s, peak memory {peak_memory / 2**20:.1f} MB")
+
+        del lattice
+
+    return pd.DataFrame(results)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark lattice generation against lattice size")
+    parser.add_argument("--lattice-settings", default="./files/lattice_settings_2025-06-23.json")
+    parser.add_argument("--lattice-sizes", type=int, nargs="+", default=[60, 120, 240, 480, 960])
+    parser.add_argument("--n-repeats", type=int, default=3)
+    parser.add_argument("--output", default=None, help="path to a CSV file to save the results")
+    args = parser.parse_args()
+
+    with open(args.lattice_settings) as json_file:
+        lattice_settings = json.load(json_file)
+
+    results = benchmark_lattice_generation(lattice_settings, args.lattice_sizes, n_repeats=args.n_repeats)
+    print(results.to_string(index=False))
+
+    if args.output is not None:
+        results.to_csv(args.output, index=False)
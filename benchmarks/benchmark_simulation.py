@@ -0,0 +1,296 @@
+"""_summary_
+
+This Python script benchmarks the simulation over model types, lattice sizes and seeding densities, with fixed seeds:
+    - init_lattice_in_simulation, on the shipped lattice and on larger lattices generated with generate_lattice
+    - init_cell_dictionaries, at seeding densities as the SeedDen_0.25 ... SeedDen_1 conditions of combined_results_tumour_sizes.csv
+    - the first step and n_steps steps of update_cell_states, for model_1 to model_4
+    - implicit_immune_predation, for model_3
+    - get_tumour_sizes, after n_steps steps
+reporting the fastest of n_repeats runs of every benchmark, its throughput in site updates per second (sites of the lattice times calls per second),
+and the peak resident memory of the process so far (benchmarks run in order of lattice size).
+
+Results are saved as a JSON baseline with --save-baseline, and compared with a baseline with --baseline, flagging the benchmarks slower
+than the baseline by more than --tolerance (the script then exits with status 1).
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_simulation --lattice-sizes 120 240 --save-baseline benchmark_simulation_baseline.json
+    python -m benchmarks.benchmark_simulation --lattice-sizes 120 240 --baseline benchmark_simulation_baseline.json
+
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from classes_and_functions.cell_classes import CancerCell, Hepatocyte
+from classes_and_functions.lattice_classes import ArrayLattice
+from classes_and_functions.lattice_generation_functions import generate_lattice
+from classes_and_functions.settings import get_simulation_parameters
+from classes_and_functions.initialisation_functions import init_lattice_in_simulation, init_cell_dictionaries
+from classes_and_functions.simulation_functions import update_cell_states, implicit_immune_predation
+from classes_and_functions.sweep_functions import copy_lattice_for_run, get_snapshot_tumour_sizes
+from classes_and_functions.profiling_functions import get_peak_rss_MB
+
+from typing import Dict, List
+
+BENCHMARK_FORMAT_VERSION = 1
+BENCHMARK_KEYS = ["lattice", "benchmark", "model_type", "seeding_density", "engine"] # the columns identifying a benchmark
+
+def get_lattices(path_to_csv: str, lattice_settings: Dict, lattice_sizes: List[int]) -> Dict[str, pd.DataFrame]:
+    """_summary_
+
+    This function returns the lattices to benchmark, before annotation by init_lattice_in_simulation.
+
+    Args:
+        path_to_csv (str): the path to the shipped lattice CSV file
+        lattice_settings (Dict): settings of the lattice, including spacing, lobule_size, lattice_size, spacing_CV_CV, spacing_CV_PT
+        lattice_sizes (List[int]): the lattice sizes of the larger lattices generated with generate_lattice
+
+    Returns:
+        Dict[str, pd.DataFrame]: DataFrames containing site_id, x, y, site_type, keyed by the name of the lattice (shipped, or generated_<lattice_size>)
+    """
+
+    lattices = {"shipped": pd.read_csv(path_to_csv, usecols=["site_id", "x", "y", "site_type"])}
+    for lattice_size in lattice_sizes:
+        lattice = generate_lattice(lattice_settings, lattice_size=lattice_size)
+        lattices[f"generated_{lattice_size}"] = pd.DataFrame({
+            "site_id": np.arange(lattice.n_sites), "x": lattice.x, "y": lattice.y, "site_type": lattice.site_type
+        })
+    return lattices
+
+def run_benchmark_case(
+    base_lattice: ArrayLattice,
+    model_type: str,
+    seeding_density: float,
+    engine: str,
+    n_steps: int,
+    seed: int
+) -> Dict[str, float]:
+    # the times of the benchmarks of one simulation from the base lattice, and the final number of cancer cells
+    rng = np.random.default_rng(seed)
+    parameters = get_simulation_parameters(model_type)
+    lattice = copy_lattice_for_run(base_lattice)
+    n_CVs = int((lattice.site_type == 0).sum())
+
+    times = {"update_cell_states": 0.0, "implicit_immune_predation": 0.0}
+    start = time.perf_counter()
+    cell_dictionaries, lattice = init_cell_dictionaries(
+        lattice=lattice, n_cancer_cells_init=int(seeding_density * n_CVs), CancerCell=CancerCell, Hepatocyte=Hepatocyte, rng=rng
+    )
+    times["init_cell_dictionaries"] = time.perf_counter() - start
+
+    for t in range(n_steps):
+        start = time.perf_counter()
+        cell_dictionaries, lattice = update_cell_states(
+            cell_dictionaries=cell_dictionaries, lattice=lattice, parameters=parameters,
+            CancerCell=CancerCell, Hepatocyte=Hepatocyte, model_type=model_type, engine=engine, rng=rng
+        )
+        step_time = time.perf_counter() - start
+        times["update_cell_states"] += step_time
+        if t == 0:
+            times["update_cell_states_first_step"] = step_time
+
+        if model_type == "model_3":
+            start = time.perf_counter()
+            cell_dictionaries, lattice = implicit_immune_predation(
+                cell_dictionaries=cell_dictionaries, lattice=lattice, parameters=parameters,
+                model_type=model_type, engine=engine, rng=rng
+            )
+            times["implicit_immune_predation"] += time.perf_counter() - start
+
+    # the snapshot of run_simulation
+    start = time.perf_counter()
+    get_snapshot_tumour_sizes(lattice, lattice.site_type, lattice.cell_id, n_steps)
+    times["get_tumour_sizes"] = time.perf_counter() - start
+
+    if model_type != "model_3":
+        del times["implicit_immune_predation"]
+    times["n_cancer_cells"] = len(cell_dictionaries["CancerCell"])
+    return times
+
+def benchmark_simulation(
+    lattices: Dict[str, pd.DataFrame],
+    lattice_settings: Dict,
+    model_types: List[str],
+    seeding_densities: List[float],
+    engines: List[str],
+    n_steps: int=20,
+    n_repeats: int=3,
+    seed: int=0
+) -> pd.DataFrame:
+    """_summary_
+
+    This function runs the benchmarks on every lattice, for every model type, seeding density and engine.
+    Every repeat of a simulation uses the same seed, so that repeats time the same events.
+
+    Args:
+        lattices (Dict[str, pd.DataFrame]): the lattices, see get_lattices
+        lattice_settings (Dict): settings of the lattice, including spacing
+        model_types (List[str]): model types to benchmark
+        seeding_densities (List[float]): numbers of cancer cells initialised per CV
+        engines (List[str]): engines of update_cell_states and implicit_immune_predation, "loop", "vectorized" or "numba"
+        n_steps (int, optional): the number of time steps of every simulation. Defaults to 20.
+        n_repeats (int, optional): the number of repeats, of which the fastest is reported. Defaults to 3.
+        seed (int, optional): the seed of the random number generators. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: a DataFrame containing lattice, n_sites, benchmark, model_type, seeding_density, engine, n_calls, time_s, time_per_call_ms,
+            site_updates_per_s, n_cancer_cells (after n_steps steps) and peak_rss_MB
+    """
+
+    results = []
+    for lattice_name, lattice in sorted(lattices.items(), key=lambda item: len(item[1])):
+        n_sites = len(lattice)
+
+        def add_result(benchmark: str, time_s: float, n_calls: int=1, **keys):
+            results.append({
+                "lattice": lattice_name, "n_sites": n_sites, "benchmark": benchmark,
+                "model_type": keys.get("model_type"), "seeding_density": keys.get("seeding_density"), "engine": keys.get("engine"),
+                "n_calls": n_calls, "time_s": time_s, "time_per_call_ms": time_s / n_calls * 1e3,
+                "site_updates_per_s": n_sites * n_calls / time_s,
+                "n_cancer_cells": keys.get("n_cancer_cells"), "peak_rss_MB": get_peak_rss_MB()
+            })
+
+        times = []
+        for _ in range(n_repeats):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                base_lattice = init_lattice_in_simulation(lattice, lattice_settings, as_array=True)
+            times.append(time.perf_counter() - start)
+        add_result("init_lattice_in_simulation", min(times))
+        print(f"> {lattice_name}: {n_sites} sites annotated in {min(times):.3f} s")
+
+        for model_type in model_types:
+            for seeding_density in seeding_densities:
+                for engine in engines:
+                    repeats = []
+                    for _ in range(n_repeats):
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            repeats.append(run_benchmark_case(base_lattice, model_type, seeding_density, engine, n_steps, seed))
+                    keys = {
+                        "model_type": model_type, "seeding_density": seeding_density, "engine": engine,
+                        "n_cancer_cells": repeats[0]["n_cancer_cells"]
+                    }
+
+                    for benchmark in repeats[0]:
+                        if benchmark == "n_cancer_cells":
+                            continue
+                        n_calls = n_steps if benchmark in ("update_cell_states", "implicit_immune_predation") else 1
+                        add_result(benchmark, min(repeat[benchmark] for repeat in repeats), n_calls=n_calls, **keys)
+
+                    step_time = min(repeat["update_cell_states"] for repeat in repeats)
+                    print(
+                        f"> {lattice_name}, {model_type}, SeedDen_{seeding_density:g}, {engine}: "
+                        f"{n_steps} steps in {step_time:.3f} s ({n_sites * n_steps / step_time:.3g} site updates/s)"
+                    )
+
+    return pd.DataFrame(results)
+
+def save_baseline(results: pd.DataFrame, path: str, parameters: Dict):
+    """_summary_
+
+    This function saves the results of the benchmarks as a JSON baseline, with the parameters of the benchmarks and the environment.
+
+    Args:
+        results (pd.DataFrame): the results, see benchmark_simulation
+        path (str): the path to the JSON file
+        parameters (Dict): the parameters of the benchmarks, e.g. n_steps, n_repeats, seed
+    """
+
+    baseline = {
+        "format_version": BENCHMARK_FORMAT_VERSION,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+            "machine": platform.machine(), "processor": platform.processor()
+        },
+        "parameters": parameters,
+        # NaN of benchmarks without model type, seeding density or engine are saved as null
+        "results": json.loads(results.to_json(orient="records"))
+    }
+    with open(path, "w") as json_file:
+        json.dump(baseline, json_file, indent=4)
+
+def compare_with_baseline(results: pd.DataFrame, path: str, tolerance: float=0.2) -> pd.DataFrame:
+    """_summary_
+
+    This function compares the results of the benchmarks with a JSON baseline, see save_baseline.
+
+    Args:
+        results (pd.DataFrame): the results, see benchmark_simulation
+        path (str): the path to the JSON baseline
+        tolerance (float, optional): the relative slowdown above which a benchmark is flagged as a regression. Defaults to 0.2, i.e. 20% slower.
+
+    Returns:
+        pd.DataFrame: a DataFrame containing the benchmarks in both the results and the baseline, with time_s, baseline_time_s, ratio (of time_s to baseline_time_s),
+            site_updates_per_s, baseline_site_updates_per_s and is_regression
+    """
+
+    with open(path) as json_file:
+        baseline = json.load(json_file)
+    if baseline["format_version"] > BENCHMARK_FORMAT_VERSION:
+        raise ValueError(f"benchmark format version {baseline['format_version']} is not supported")
+
+    baseline_results = pd.DataFrame(baseline["results"])
+    columns = ["time_s", "site_updates_per_s"]
+    # missing keys are compared as "", since NaN never equals NaN in a merge
+    comparison = results[BENCHMARK_KEYS + columns].fillna("").merge(
+        baseline_results[BENCHMARK_KEYS + columns].fillna(""), on=BENCHMARK_KEYS, suffixes=("", "_baseline")
+    )
+    comparison = comparison.rename(columns={f"{name}_baseline": f"baseline_{name}" for name in columns})
+    comparison["ratio"] = comparison["time_s"] / comparison["baseline_time_s"]
+    comparison["is_regression"] = comparison["ratio"] > 1 + tolerance
+    return comparison
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the simulation over model types, lattice sizes and seeding densities")
+    parser.add_argument("--lattice", default="./files/lattice_with_CVs_PTs_2025-06-23_annotated_without_tumour.csv",
+                        help="path to the shipped lattice CSV file")
+    parser.add_argument("--lattice-settings", default="./files/lattice_settings_2025-06-23.json")
+    parser.add_argument("--lattice-sizes", type=int, nargs="*", default=[120, 240], help="lattice sizes of the generated lattices")
+    parser.add_argument("--model-types", nargs="+", default=["model_1", "model_2", "model_3", "model_4"])
+    parser.add_argument("--seeding-densities", type=float, nargs="+", default=[0.25, 0.5, 1])
+    parser.add_argument("--engines", nargs="+", default=["vectorized"], help="loop, vectorized and/or numba")
+    parser.add_argument("--n-steps", type=int, default=20)
+    parser.add_argument("--n-repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="path to a CSV file to save the results")
+    parser.add_argument("--save-baseline", default=None, help="path to a JSON file to save the results as a baseline")
+    parser.add_argument("--baseline", default=None, help="path to a JSON baseline to compare the results with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown flagged as a regression")
+    args = parser.parse_args()
+
+    with open(args.lattice_settings) as json_file:
+        lattice_settings = json.load(json_file)
+
+    lattices = get_lattices(args.lattice, lattice_settings, args.lattice_sizes)
+    results = benchmark_simulation(
+        lattices, lattice_settings, args.model_types, args.seeding_densities, args.engines,
+        n_steps=args.n_steps, n_repeats=args.n_repeats, seed=args.seed
+    )
+    print(results.to_string(index=False))
+
+    if args.output is not None:
+        results.to_csv(args.output, index=False)
+
+    if args.save_baseline is not None:
+        parameters = {"lattice_sizes": args.lattice_sizes, "n_steps": args.n_steps, "n_repeats": args.n_repeats, "seed": args.seed}
+        save_baseline(results, args.save_baseline, parameters)
+
+    if args.baseline is not None:
+        comparison = compare_with_baseline(results, args.baseline, tolerance=args.tolerance)
+        print(comparison.to_string(index=False))
+        regressions = comparison[comparison["is_regression"]]
+        if len(regressions) > 0:
+            print(f"> {len(regressions)} regressions of more than {args.tolerance:.0%} against {args.baseline}")
+            sys.exit(1)
+        print(f"> no regression of more than {args.tolerance:.0%} against {args.baseline}")
@@ -1,36 +1,261 @@
 """_summary_
 
-This Python script contains a function to detect tumours using the DBSCAN algorithm 
+This Python script contains functions to detect tumours, as connected components of cancer cells over adjacent lattice sites
+or using the DBSCAN algorithm, and the TumourLabeller class to update tumour labels incrementally during a simulation.
 
 """
 
+import numpy as np
 import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 from sklearn.cluster import DBSCAN
-from typing import Tuple 
+from classes_and_functions.lattice_classes import ArrayLattice, N_ADJACENT_SITES, NO_ADJACENT_SITE_ID
+from classes_and_functions.profiling_functions import profiled
+from typing import Tuple
 
-def get_tumour_sizes(
-    tumour_t: pd.DataFrame
-) -> Tuple[pd.DataFrame, pd.DataFrame]:
+METHODS = ["connected_components", "dbscan"]
+
+NO_LABEL = -1 # label of sites not occupied by cancer cells
+
+def get_labels_in_order_of_first_occurrence(labels: np.ndarray) -> np.ndarray:
+    # renumber labels 0, 1, ... in order of their first occurrence, as DBSCAN does
+    _, first_occurrences, inverse = np.unique(labels, return_index=True, return_inverse=True)
+    ranks = np.empty(first_occurrences.size, dtype=np.int64)
+    ranks[np.argsort(first_occurrences, kind='stable')] = np.arange(first_occurrences.size)
+    return ranks[inverse.ravel()]
+
+def get_connected_components(site_ids: np.ndarray, adjacent_site_ids: np.ndarray) -> np.ndarray:
     """_summary_
-    
-    This function detects tumours using the DBSCAN algorithm.
+
+    This function labels the connected components of a set of sites, two sites being connected if they are adjacent.
 
     Args:
-        tumour_t (pd.DataFrame): a DataFrame containing information about site_id, x, y, site_type, cell_id, adjacent_site_ids_str, zonation_type
+        site_ids (np.ndarray): the ids of M distinct sites
+        adjacent_site_ids (np.ndarray): the adjacent site ids of these sites, of shape (M, 6) padded with NO_ADJACENT_SITE_ID
 
     Returns:
-        Tuple[pd.DataFrame, pd.DataFrame]: A Tuple of DataFrame objects including
-            tumour_t_sizes - a DataFrame object containing information about DBSCAN cluster ids and sizes
-            tumour_t_labelled - a DataFrame object containing information as in tumour_t and further including annotated DBSCAN cluster ids that cells belong to
+        np.ndarray: the labels of the M sites, numbered 0, 1, ... in order of the first site of each component
     """
-    
-    
-    dbs = DBSCAN(eps=1.05, min_samples=1) # spacing = 1 in simulation
-    dbs.fit(tumour_t[['x','y']].values)
+
+    site_ids = np.asarray(site_ids, dtype=np.int64)
+    n_sites = site_ids.size
+    if n_sites == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # position of each adjacent site among site_ids, -1 if not among them
+    order = np.argsort(site_ids)
+    sorted_site_ids = site_ids[order]
+    positions = np.minimum(np.searchsorted(sorted_site_ids, adjacent_site_ids), n_sites-1)
+    is_in_set = (adjacent_site_ids != NO_ADJACENT_SITE_ID) & (sorted_site_ids[positions] == adjacent_site_ids)
+
+    rows, cols = np.nonzero(is_in_set)
+    graph = coo_matrix(
+        (np.ones(rows.size, dtype=np.int8), (rows, order[positions[rows, cols]])),
+        shape=(n_sites, n_sites)
+    )
+    _, labels = connected_components(graph, directed=False)
+
+    return get_labels_in_order_of_first_occurrence(labels)
+
+def get_adjacent_site_ids_from_strs(adjacent_site_ids_strs: np.ndarray) -> np.ndarray:
+    # adjacent site ids from the comma-joined strings of a lattice_in_simulation DataFrame
+    adjacent_site_ids = np.full((len(adjacent_site_ids_strs), N_ADJACENT_SITES), NO_ADJACENT_SITE_ID, dtype=np.int64)
+    for i, adjacent_site_ids_str in enumerate(adjacent_site_ids_strs):
+        if not isinstance(adjacent_site_ids_str, str) or adjacent_site_ids_str in ("", "n/a"):
+            continue
+        adjacent_site_ids_of_site = [int(str) for str in adjacent_site_ids_str.split(',')]
+        adjacent_site_ids[i, :len(adjacent_site_ids_of_site)] = adjacent_site_ids_of_site
+    return adjacent_site_ids
+
+def get_tumour_labels_and_sizes(tumour_t: pd.DataFrame, labels: np.ndarray) -> Tuple[pd.DataFrame, pd.DataFrame]:
     tumour_t_labelled = tumour_t.copy()
-    tumour_t_labelled['label'] = dbs.labels_
+    tumour_t_labelled['label'] = labels
     tumour_t_sizes = tumour_t_labelled.groupby('label', as_index=False).agg({'cell_id':'count'})
     tumour_t_sizes.rename(columns={'cell_id': 'size'}, inplace=True)
-    
     return tumour_t_sizes, tumour_t_labelled
-    
\ No newline at end of file
+
+@profiled("get_tumour_sizes")
+def get_tumour_sizes(
+    tumour_t: pd.DataFrame,
+    lattice: ArrayLattice=None,
+    method: str="connected_components"
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """_summary_
+
+    This function detects tumours, as connected components of cancer cells over adjacent sites (by default), or using the DBSCAN algorithm.
+    On a lattice of spacing 1, both methods give the same labels.
+
+    Args:
+        tumour_t (pd.DataFrame): a DataFrame containing information about site_id, x, y, site_type, cell_id, adjacent_site_ids_str, zonation_type
+        lattice (ArrayLattice, optional): the lattice, whose adjacent site ids are used instead of parsing adjacent_site_ids_str. Defaults to None.
+        method (str, optional): "connected_components" or "dbscan". Defaults to "connected_components".
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: A Tuple of DataFrame objects including
+            tumour_t_sizes - a DataFrame object containing information about cluster ids and sizes
+            tumour_t_labelled - a DataFrame object containing information as in tumour_t and further including annotated cluster ids that cells belong to
+    """
+
+    if method not in METHODS:
+        raise ValueError(f"method should be one of {METHODS}, got {method}")
+
+    if method == "dbscan":
+        dbs = DBSCAN(eps=1.05, min_samples=1) # spacing = 1 in simulation
+        dbs.fit(tumour_t[['x','y']].values)
+        return get_tumour_labels_and_sizes(tumour_t, dbs.labels_)
+
+    site_ids = tumour_t['site_id'].values.astype(np.int64)
+    if lattice is not None:
+        adjacent_site_ids = lattice.adjacent_site_ids[site_ids]
+    else:
+        adjacent_site_ids = get_adjacent_site_ids_from_strs(tumour_t['adjacent_site_ids_str'].values)
+
+    return get_tumour_labels_and_sizes(tumour_t, get_connected_components(site_ids, adjacent_site_ids))
+
+class TumourLabeller:
+    """_summary_
+
+    Labels tumours as connected components of the sites occupied by cancer cells, and updates the labels incrementally
+    from the sites gained and lost by cancer cells since the last update:
+        - gained sites are merged with the tumours they are adjacent to, with a union-find over labels
+        - tumours that lost sites are labelled again, from the sites adjacent to the lost ones, as they may have split
+    so that the cost of an update depends on the sites changed and the tumours that lost sites, rather than on the lattice size.
+    """
+
+    def __init__(self, lattice: ArrayLattice):
+        self.lattice = lattice
+        self.relabel()
+
+    def relabel(self):
+        # label all tumours from scratch
+        tumour_site_ids = np.flatnonzero(self.lattice.site_type == 4)
+        labels = get_connected_components(tumour_site_ids, self.lattice.adjacent_site_ids[tumour_site_ids])
+
+        self.label_of_site = np.full(self.lattice.n_sites, NO_LABEL, dtype=np.int64)
+        self.label_of_site[tumour_site_ids] = labels
+        self.n_tumour_sites = tumour_site_ids.size
+        self.parent = np.arange(max(labels.max()+1 if labels.size else 0, 16), dtype=np.int64)
+        self.n_labels = labels.max()+1 if labels.size else 0
+
+    def new_labels(self, n_labels: int) -> np.ndarray:
+        if self.n_labels + n_labels > self.parent.size:
+            parent = np.arange(max(self.n_labels + n_labels, 2*self.parent.size), dtype=np.int64)
+            parent[:self.n_labels] = self.parent[:self.n_labels]
+            self.parent = parent
+        labels = np.arange(self.n_labels, self.n_labels + n_labels, dtype=np.int64)
+        self.n_labels += n_labels
+        return labels
+
+    def find(self, labels: np.ndarray) -> np.ndarray:
+        # roots of the labels, with path compression
+        roots = self.parent[labels]
+        while True:
+            parents_of_roots = self.parent[roots]
+            if np.array_equal(parents_of_roots, roots):
+                break
+            self.parent[labels] = parents_of_roots
+            roots = parents_of_roots
+        return roots
+
+    def get_tumour_adjacent_site_ids(self, site_ids: np.ndarray) -> np.ndarray:
+        adjacent_site_ids = self.lattice.adjacent_site_ids[site_ids].ravel()
+        adjacent_site_ids = adjacent_site_ids[adjacent_site_ids != NO_ADJACENT_SITE_ID]
+        return np.unique(adjacent_site_ids[self.lattice.site_type[adjacent_site_ids] == 4]).astype(np.int64)
+
+    def get_tumour_containing(self, seed_site_ids: np.ndarray) -> np.ndarray:
+        # all sites of the tumours containing the seed sites, by breadth-first search over adjacent tumour sites
+        visited = np.unique(seed_site_ids)
+        frontier = visited
+        while frontier.size:
+            adjacent_site_ids = self.get_tumour_adjacent_site_ids(frontier)
+            frontier = np.setdiff1d(adjacent_site_ids, visited, assume_unique=True)
+            visited = np.union1d(visited, frontier)
+        return visited
+
+    def update(self, gained_site_ids: np.ndarray=None, lost_site_ids: np.ndarray=None):
+        """_summary_
+
+        This function updates the labels after the lattice has been updated.
+
+        Args:
+            gained_site_ids (np.ndarray, optional): the sites occupied by cancer cells since the last update (births, moves). Defaults to None.
+            lost_site_ids (np.ndarray, optional): the sites no longer occupied by cancer cells since the last update (deaths, moves). Defaults to None.
+                If both are None, they are found by comparing the labels with the lattice.
+        """
+
+        lattice = self.lattice
+        if gained_site_ids is None and lost_site_ids is None:
+            is_tumour = lattice.site_type == 4
+            is_labelled = self.label_of_site != NO_LABEL
+            gained_site_ids, lost_site_ids = np.flatnonzero(is_tumour & ~is_labelled), np.flatnonzero(~is_tumour & is_labelled)
+        gained_site_ids = np.unique(np.asarray(gained_site_ids if gained_site_ids is not None else [], dtype=np.int64))
+        lost_site_ids = np.unique(np.asarray(lost_site_ids if lost_site_ids is not None else [], dtype=np.int64))
+
+        # sites both lost and gained (e.g. a cell killed and another born) are treated as lost, then gained
+        lost_site_ids = lost_site_ids[self.label_of_site[lost_site_ids] != NO_LABEL]
+        gained_site_ids = gained_site_ids[lattice.site_type[gained_site_ids] == 4]
+        self.label_of_site[lost_site_ids] = NO_LABEL
+        self.label_of_site[gained_site_ids] = NO_LABEL
+        self.n_tumour_sites += gained_site_ids.size - lost_site_ids.size
+
+        # relabel from scratch when labels are no longer compact, to bound the memory of the union-find
+        if self.n_labels > 2 * max(self.n_tumour_sites, 1024):
+            self.relabel()
+            return
+
+        # [1] tumours that lost sites may have split: label them again, from the sites adjacent to the lost ones
+        if lost_site_ids.size:
+            seed_site_ids = self.get_tumour_adjacent_site_ids(lost_site_ids)
+            if seed_site_ids.size:
+                site_ids = self.get_tumour_containing(seed_site_ids)
+                labels = get_connected_components(site_ids, lattice.adjacent_site_ids[site_ids])
+                self.label_of_site[site_ids] = self.new_labels(labels.max()+1)[labels]
+
+        # [2] gained sites not labelled in [1] get new labels, merged with the labels of adjacent tumour sites
+        gained_site_ids = gained_site_ids[self.label_of_site[gained_site_ids] == NO_LABEL]
+        if gained_site_ids.size:
+            self.label_of_site[gained_site_ids] = self.new_labels(gained_site_ids.size)
+
+            adjacent_site_ids = lattice.adjacent_site_ids[gained_site_ids]
+            rows, cols = np.nonzero(adjacent_site_ids != NO_ADJACENT_SITE_ID)
+            adjacent_labels = self.label_of_site[adjacent_site_ids[rows, cols]]
+            is_adjacent_tumour = adjacent_labels != NO_LABEL
+
+            # connected components of the graph of labels, each merged into its smallest root
+            labels_a = self.find(self.label_of_site[gained_site_ids[rows[is_adjacent_tumour]]])
+            labels_b = self.find(adjacent_labels[is_adjacent_tumour])
+            involved_labels, inverse = np.unique(np.concatenate([labels_a, labels_b]), return_inverse=True)
+            inverse = inverse.ravel()
+            graph = coo_matrix(
+                (np.ones(labels_a.size, dtype=np.int8), (inverse[:labels_a.size], inverse[labels_a.size:])),
+                shape=(involved_labels.size, involved_labels.size)
+            )
+            _, components = connected_components(graph, directed=False)
+            smallest_roots = np.full(components.max()+1 if components.size else 0, np.iinfo(np.int64).max, dtype=np.int64)
+            np.minimum.at(smallest_roots, components, involved_labels)
+            self.parent[involved_labels] = smallest_roots[components]
+
+    def get_labels(self, site_ids: np.ndarray) -> np.ndarray:
+        # labels of the given tumour sites, numbered 0, 1, ... in order of the first site of each tumour
+        return get_labels_in_order_of_first_occurrence(self.find(self.label_of_site[np.asarray(site_ids, dtype=np.int64)]))
+
+    def get_tumour_sizes(self, tumour_t: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """_summary_
+
+        This function returns the same outputs as get_tumour_sizes, from the current labels.
+
+        Args:
+            tumour_t (pd.DataFrame): a DataFrame containing information about site_id, x, y, site_type, cell_id of the sites occupied by cancer cells
+
+        Returns:
+            Tuple[pd.DataFrame, pd.DataFrame]: A Tuple of DataFrame objects including
+                tumour_t_sizes - a DataFrame object containing information about cluster ids and sizes
+                tumour_t_labelled - a DataFrame object containing information as in tumour_t and further including annotated cluster ids that cells belong to
+        """
+
+        site_ids = tumour_t['site_id'].values.astype(np.int64)
+        if (self.label_of_site[site_ids] == NO_LABEL).any():
+            raise ValueError("tumour_t contains sites not labelled as tumour; update the labeller first")
+
+        return get_tumour_labels_and_sizes(tumour_t, self.get_labels(site_ids))
@@ -2,10 +2,19 @@
 
 This script contains the definition of Cell, CancerCell, Hepatocyte classes.
 Main methods of the classes are for getting and setting attributes.
+It also contains the definition of the CellIdAllocator class, which hands out ids to new cells,
+the CellStore and CellDictionary classes, which keep the attributes of many cells in NumPy columns
+behind the same Dict-like interface as a dict of CancerCell or Hepatocyte objects, and
+the LineageTable class, which keeps the genealogy and the sizes of the lineages (clones) of cells in a CellStore.
     
 """
 
-from typing import Dict
+import functools
+from collections.abc import MutableMapping
+
+import numpy as np
+
+from typing import Dict, Iterator, Tuple, Type
 
 class Cell:
     def __init__(self, cell_attributes: Dict):
@@ -23,4 +32,624 @@ class CancerCell(Cell):
 
 class Hepatocyte(Cell):
     def __init__(self, cell_attributes: Dict):
-        super().__init__(cell_attributes)
\ No newline at end of file
+        super().__init__(cell_attributes)
+
+class CellIdAllocator:
+    """_summary_
+    
+    Hands out monotonically increasing cell ids in O(1), so that ids of dead cells are never reused.
+    """
+    
+    def __init__(self, next_cell_id: int):
+        self.next_cell_id = int(next_cell_id)
+        
+    def allocate(self) -> int:
+        cell_id = self.next_cell_id
+        self.next_cell_id += 1
+        return cell_id
+    
+    def allocate_many(self, n_cells: int) -> np.ndarray:
+        cell_ids = np.arange(self.next_cell_id, self.next_cell_id + n_cells, dtype=np.int64)
+        self.next_cell_id += int(n_cells)
+        return cell_ids
+    
+    def get_state(self) -> Dict:
+        return {"next_cell_id": self.next_cell_id}
+    
+    def set_state(self, state: Dict):
+        self.next_cell_id = int(state["next_cell_id"])
+
+NO_LINEAGE_ID = -1 # lineage_id of cells not in any lineage, and parent_lineage_id of founding lineages
+
+class LineageTable:
+    """_summary_
+    
+    An append-only table of lineages (clones), with lineage ids 0, 1, ... in order of founding, and
+        parent_lineage_id (np.int64, NO_LINEAGE_ID for lineages founded from no lineage), birth_time (np.float64),
+        founder_cell_id (np.int64) and p_cc_killed (np.float64, the kill probability of the cells of the lineage in implicit immune predation,
+        NaN for P_CC_KILLED) as arrays indexed by lineage_id, and
+        n_cells (np.int64) the number of living cells of every lineage, updated in O(1) per cell as cells are added to or removed from
+        the CellStore the table is attached to,
+    so that clone sizes can be read at every step without scanning the cells.
+    """
+    
+    COLUMNS = {
+        "parent_lineage_id": (np.int64, NO_LINEAGE_ID),
+        "birth_time": (np.float64, np.nan),
+        "founder_cell_id": (np.int64, -1),
+        "p_cc_killed": (np.float64, np.nan),
+        "n_cells": (np.int64, 0)
+    }
+    
+    def __init__(self, capacity: int=0):
+        self.columns = {name: np.full(capacity, fill_value, dtype=dtype) for name, (dtype, fill_value) in self.COLUMNS.items()}
+        self.n_lineages = 0
+        self.history = [] # (t, n_cells) recorded by record
+        
+    def __len__(self) -> int:
+        return self.n_lineages
+    
+    def __getattr__(self, name: str) -> np.ndarray:
+        # columns of the lineages founded so far as attributes, e.g. lineages.n_cells
+        columns = self.__dict__.get("columns", {})
+        if name in columns:
+            return columns[name][:self.n_lineages]
+        raise AttributeError(name)
+    
+    def reserve(self, capacity: int):
+        if capacity <= self.columns["n_cells"].size:
+            return
+        capacity = max(capacity, 2 * self.columns["n_cells"].size, 16)
+        for name, column in self.columns.items():
+            new_column = np.full(capacity, self.COLUMNS[name][1], dtype=column.dtype)
+            new_column[:self.n_lineages] = column[:self.n_lineages]
+            self.columns[name] = new_column
+    
+    def add_lineages(self, founder_cell_ids: np.ndarray, parent_lineage_ids=NO_LINEAGE_ID, birth_time: float=0.) -> np.ndarray:
+        """_summary_
+
+        This function founds new lineages, without cells; they inherit the kill probabilities of their parent lineages.
+
+        Args:
+            founder_cell_ids (np.ndarray): the ids of the n cells founding the lineages
+            parent_lineage_ids (optional): the lineages the founders belonged to, as an array of shape (n,) or a scalar. Defaults to NO_LINEAGE_ID.
+            birth_time (float, optional): the time the lineages are founded. Defaults to 0.
+
+        Returns:
+            np.ndarray: the ids of the new lineages
+        """
+        
+        founder_cell_ids = np.atleast_1d(np.asarray(founder_cell_ids, dtype=np.int64))
+        parent_lineage_ids = np.broadcast_to(np.asarray(parent_lineage_ids, dtype=np.int64), founder_cell_ids.shape)
+        if ((parent_lineage_ids < NO_LINEAGE_ID) | (parent_lineage_ids >= self.n_lineages)).any():
+            raise ValueError("parent lineage ids not in the table")
+        
+        lineage_ids = np.arange(self.n_lineages, self.n_lineages + founder_cell_ids.size, dtype=np.int64)
+        self.reserve(self.n_lineages + lineage_ids.size)
+        columns = self.columns
+        columns["parent_lineage_id"][lineage_ids] = parent_lineage_ids
+        columns["birth_time"][lineage_ids] = birth_time
+        columns["founder_cell_id"][lineage_ids] = founder_cell_ids
+        columns["p_cc_killed"][lineage_ids] = np.where(
+            parent_lineage_ids != NO_LINEAGE_ID, columns["p_cc_killed"][np.maximum(parent_lineage_ids, 0)], np.nan
+        )
+        self.n_lineages += lineage_ids.size
+        
+        return lineage_ids
+    
+    def count_cells(self, lineage_ids: np.ndarray, n: int):
+        # n cells added to (n=1) or removed from (n=-1) each of the given lineages, cells of no lineage ignored
+        lineage_ids = np.asarray(lineage_ids)
+        lineage_ids = lineage_ids[lineage_ids != NO_LINEAGE_ID]
+        np.add.at(self.columns["n_cells"], lineage_ids, n)
+    
+    def set_kill_probabilities(self, lineage_ids: np.ndarray, p_cc_killed):
+        # NaN restores P_CC_KILLED; lineages founded later from these inherit their kill probabilities
+        self.columns["p_cc_killed"][np.asarray(lineage_ids, dtype=np.int64)] = p_cc_killed
+    
+    def has_kill_probabilities(self) -> bool:
+        return bool(np.isfinite(self.p_cc_killed).any())
+    
+    def get_kill_probabilities(self, lineage_ids: np.ndarray, p_cc_killed: float) -> np.ndarray:
+        # the kill probabilities of cells of the given lineages, p_cc_killed where the lineage has none
+        p_cc_killed_of_lineages = np.where(np.asarray(lineage_ids) != NO_LINEAGE_ID, self.columns["p_cc_killed"][lineage_ids], np.nan)
+        return np.where(np.isnan(p_cc_killed_of_lineages), p_cc_killed, p_cc_killed_of_lineages)
+    
+    def get_descendant_lineage_ids(self, lineage_id: int) -> np.ndarray:
+        # the lineage and all lineages founded from it, directly or not; parents are founded before their children
+        is_descendant = np.zeros(self.n_lineages, dtype=bool)
+        is_descendant[lineage_id] = True
+        parent_lineage_ids = self.parent_lineage_id
+        for child_lineage_id in range(lineage_id + 1, self.n_lineages):
+            parent_lineage_id = parent_lineage_ids[child_lineage_id]
+            is_descendant[child_lineage_id] = parent_lineage_id != NO_LINEAGE_ID and is_descendant[parent_lineage_id]
+        return np.flatnonzero(is_descendant)
+    
+    def record(self, t: float):
+        # the sizes of all lineages at time t, for get_trajectories
+        self.history.append((t, self.n_cells.copy()))
+    
+    def get_trajectories(self) -> Dict[str, np.ndarray]:
+        # the recorded sizes as a tidy table of t, lineage_id and n_cells, one row per lineage founded by t
+        t = np.concatenate([np.full(n_cells.size, t, dtype=np.float64) for t, n_cells in self.history] or [np.zeros(0)])
+        lineage_ids = np.concatenate([np.arange(n_cells.size, dtype=np.int64) for _, n_cells in self.history] or [np.zeros(0, dtype=np.int64)])
+        n_cells = np.concatenate([n_cells for _, n_cells in self.history] or [np.zeros(0, dtype=np.int64)])
+        return {"t": t, "lineage_id": lineage_ids, "n_cells": n_cells}
+    
+    def get_table(self) -> Dict[str, np.ndarray]:
+        # the columns of the lineages founded so far, with lineage_id
+        table = {"lineage_id": np.arange(self.n_lineages, dtype=np.int64)}
+        table.update({name: column[:self.n_lineages].copy() for name, column in self.columns.items()})
+        return table
+    
+    def get_state(self) -> Dict[str, np.ndarray]:
+        # the columns and the recorded sizes, as arrays
+        state = {name: column[:self.n_lineages].copy() for name, column in self.columns.items()}
+        state["history_t"] = np.array([t for t, _ in self.history], dtype=np.float64)
+        state["history_n_lineages"] = np.array([n_cells.size for _, n_cells in self.history], dtype=np.int64)
+        state["history_n_cells"] = np.concatenate([n_cells for _, n_cells in self.history] or [np.zeros(0, dtype=np.int64)])
+        return state
+    
+    def set_state(self, state: Dict[str, np.ndarray]):
+        n_lineages = state["n_cells"].size
+        self.columns = {name: np.array(state[name], dtype=dtype) for name, (dtype, _) in self.COLUMNS.items()}
+        self.n_lineages = n_lineages
+        bounds = np.cumsum(np.concatenate([[0], state["history_n_lineages"]])).astype(np.int64)
+        self.history = [
+            (t, np.array(state["history_n_cells"][start:end], dtype=np.int64))
+            for t, start, end in zip(state["history_t"].tolist(), bounds[:-1], bounds[1:])
+        ]
+    
+    def copy(self) -> "LineageTable":
+        lineages = LineageTable()
+        lineages.set_state(self.get_state())
+        return lineages
+
+NO_ROW = -1 # row of cell ids not in a CellStore
+
+class CellAttributes(dict):
+    """_summary_
+    
+    The attributes of one row of a CellStore, as returned by CellView.attributes: a Dict whose items are written through to the store when assigned,
+    so that mutating the attributes of a view updates the cell, as it would for a Cell. Copies (e.g. attributes.copy()) are plain Dicts.
+    """
+    
+    def __init__(self, store: "CellStore", row: int):
+        super().__init__(store.get_attributes(row))
+        self.store = store
+        self.row = row
+    
+    def __setitem__(self, name: str, value):
+        self.store.set_attributes(self.row, {name: value}) # raises for unknown attributes before the Dict changes
+        super().__setitem__(name, value)
+    
+    def update(self, *args, **kwargs):
+        for name, value in dict(*args, **kwargs).items():
+            self[name] = value
+    
+    def __ior__(self, other: Dict) -> "CellAttributes":
+        self.update(other)
+        return self
+    
+    def setdefault(self, name: str, value=None):
+        if name not in self:
+            self[name] = value
+        return self[name]
+    
+    def __delitem__(self, name: str):
+        raise TypeError("attributes of a stored cell cannot be removed")
+    
+    def pop(self, name: str, *default):
+        raise TypeError("attributes of a stored cell cannot be removed")
+    
+    def popitem(self):
+        raise TypeError("attributes of a stored cell cannot be removed")
+    
+    def clear(self):
+        raise TypeError("attributes of a stored cell cannot be removed")
+
+class CellView:
+    """_summary_
+    
+    A lightweight view of one row of a CellStore, with the same attributes API as Cell.
+    Attributes are read from and written to the store, either with set_attributes or by assigning items of the returned Dict (see CellAttributes).
+    A view is valid until its cell is removed from the store.
+    """
+    
+    def __init__(self, store: "CellStore", row: int):
+        self.store = store
+        self.row = row
+        
+    @property
+    def attributes(self) -> "CellAttributes":
+        return CellAttributes(self.store, self.row)
+    
+    @attributes.setter
+    def attributes(self, updated_attributes: Dict):
+        self.store.set_attributes(self.row, updated_attributes)
+
+@functools.lru_cache(maxsize=None)
+def get_view_class(cell_class: Type[Cell]) -> Type[CellView]:
+    # views are instances of the given cell class, e.g. CancerCell, so that isinstance checks keep working
+    return type(f"{cell_class.__name__}View", (CellView, cell_class), {})
+
+class CellStore:
+    """_summary_
+    
+    A struct-of-arrays store of cells of one class, with
+        cell_id (np.int64), site_id (np.int64), cell_state (np.int8), x, y (np.float64) and extra columns (e.g. lineage_id) as arrays indexed by row,
+        is_alive (bool) marking the rows in use, a free-list of the rows of removed cells, and
+        row_of_cell_id (np.int64) mapping cell ids to rows (NO_ROW if not in the store), and
+        lineages (LineageTable, optional) counting the cells of every lineage in the lineage_id column,
+    so that adding and removing a cell costs O(1) (amortised), and queries over all cells are vectorized.
+    """
+    
+    COLUMNS = {
+        "cell_id": (np.int64, -1),
+        "site_id": (np.int64, -1),
+        "cell_state": (np.int8, -1),
+        "x": (np.float64, np.nan),
+        "y": (np.float64, np.nan)
+    }
+    
+    def __init__(
+        self, cell_class: Type[Cell]=Cell, capacity: int=0, extra_columns: Dict[str, Tuple]=None, lineages: LineageTable=None
+    ):
+        """_summary_
+
+        Args:
+            cell_class (Type[Cell], optional): the class of cells stored, e.g. CancerCell, used for the views. Defaults to Cell.
+            capacity (int, optional): the number of rows allocated initially. Defaults to 0.
+            extra_columns (Dict[str, Tuple], optional): extra attributes as {name: (dtype, fill_value)}, e.g. {"lineage_id": (np.int64, -1)}. Defaults to None.
+            lineages (LineageTable, optional): the lineages of the cells, tracked in a lineage_id column added if needed. Defaults to None.
+        """
+        
+        self.cell_class = cell_class
+        self.view_class = get_view_class(cell_class)
+        
+        self.columns = {}
+        self.fill_values = {}
+        for name, (dtype, fill_value) in self.COLUMNS.items():
+            self.columns[name] = np.full(capacity, fill_value, dtype=dtype)
+            self.fill_values[name] = fill_value
+        self.is_alive = np.zeros(capacity, dtype=bool)
+        
+        self.extra_column_names = []
+        for name, (dtype, fill_value) in (extra_columns or {}).items():
+            self.add_column(name, dtype, fill_value)
+        
+        self.n_rows = 0 # rows in use or in the free-list
+        self.n_cells = 0
+        self.free_rows = np.zeros(0, dtype=np.int64) # stack of the rows of removed cells
+        self.n_free_rows = 0
+        self.row_of_cell_id = np.full(0, NO_ROW, dtype=np.int64)
+        
+        self.lineages = lineages
+        if lineages is not None and "lineage_id" not in self.columns:
+            self.add_column("lineage_id", np.int64, NO_LINEAGE_ID)
+        
+    def __len__(self) -> int:
+        return self.n_cells
+    
+    def __getattr__(self, name: str) -> np.ndarray:
+        # columns as attributes, e.g. store.cell_state
+        columns = self.__dict__.get("columns", {})
+        if name in columns:
+            return columns[name]
+        raise AttributeError(name)
+    
+    @property
+    def capacity(self) -> int:
+        return self.is_alive.size
+    
+    def add_column(self, name: str, dtype: np.dtype, fill_value):
+        if name in self.columns or name == "cell_position":
+            raise ValueError(f"column {name} already exists")
+        self.columns[name] = np.full(self.capacity, fill_value, dtype=dtype)
+        self.fill_values[name] = fill_value
+        self.extra_column_names.append(name)
+        
+    def reserve(self, capacity: int):
+        # grow the columns geometrically, so that adding cells costs O(1) amortised
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, 2 * self.capacity, 16)
+        for name, column in self.columns.items():
+            new_column = np.full(capacity, self.fill_values[name], dtype=column.dtype)
+            new_column[:self.n_rows] = column[:self.n_rows]
+            self.columns[name] = new_column
+        is_alive = np.zeros(capacity, dtype=bool)
+        is_alive[:self.n_rows] = self.is_alive[:self.n_rows]
+        self.is_alive = is_alive
+        
+    def reserve_cell_ids(self, max_cell_id: int):
+        if max_cell_id < self.row_of_cell_id.size:
+            return
+        size = max(max_cell_id + 1, 2 * self.row_of_cell_id.size, 16)
+        row_of_cell_id = np.full(size, NO_ROW, dtype=np.int64)
+        row_of_cell_id[:self.row_of_cell_id.size] = self.row_of_cell_id
+        self.row_of_cell_id = row_of_cell_id
+        
+    def contains(self, cell_id: int) -> bool:
+        return 0 <= cell_id < self.row_of_cell_id.size and self.row_of_cell_id[cell_id] != NO_ROW
+    
+    def get_row(self, cell_id: int) -> int:
+        row = self.row_of_cell_id[cell_id] if 0 <= cell_id < self.row_of_cell_id.size else NO_ROW
+        if row == NO_ROW:
+            raise KeyError(cell_id)
+        return int(row)
+    
+    def get_rows(self, cell_ids: np.ndarray) -> np.ndarray:
+        cell_ids = np.asarray(cell_ids, dtype=np.int64)
+        if cell_ids.size == 0:
+            return np.zeros(0, dtype=np.int64)
+        if cell_ids.min() < 0 or cell_ids.max() >= self.row_of_cell_id.size:
+            raise KeyError("cell ids not in the store")
+        rows = self.row_of_cell_id[cell_ids]
+        if (rows == NO_ROW).any():
+            raise KeyError(f"cell ids not in the store: {cell_ids[rows == NO_ROW][:10].tolist()}")
+        return rows
+    
+    def get_alive_rows(self) -> np.ndarray:
+        # rows in order of cell_id, i.e. the order in which cells were added when ids come from a CellIdAllocator
+        rows = np.flatnonzero(self.is_alive[:self.n_rows])
+        return rows[np.argsort(self.columns["cell_id"][rows], kind='stable')]
+    
+    def get_cell_ids(self, cell_state: int=None) -> np.ndarray:
+        rows = self.get_alive_rows()
+        if cell_state is not None:
+            rows = rows[self.columns["cell_state"][rows] == cell_state]
+        return self.columns["cell_id"][rows]
+    
+    def count_cell_state(self, cell_state: int) -> int:
+        n_rows = self.n_rows
+        return int(np.count_nonzero(self.is_alive[:n_rows] & (self.columns["cell_state"][:n_rows] == cell_state)))
+        
+    def add_many(self, cell_ids: np.ndarray, **columns) -> np.ndarray:
+        """_summary_
+
+        This function adds cells to the store, reusing the rows of removed cells first.
+
+        Args:
+            cell_ids (np.ndarray): the ids of the n cells to add, not already in the store
+            **columns: the values of other columns, as arrays of shape (n,) or scalars, e.g. site_id=..., cell_state=1, x=..., y=...
+
+        Returns:
+            np.ndarray: the rows of the added cells
+        """
+        
+        cell_ids = np.atleast_1d(np.asarray(cell_ids)).astype(np.int64)
+        n_cells = cell_ids.size
+        if n_cells == 0:
+            return np.zeros(0, dtype=np.int64)
+        
+        unknown_columns = set(columns) - set(self.columns)
+        if unknown_columns:
+            raise ValueError(f"unknown columns {sorted(unknown_columns)}; add them with add_column first")
+        if cell_ids.min() < 0:
+            raise ValueError("cell ids should be non-negative")
+        
+        self.reserve_cell_ids(int(cell_ids.max()))
+        if (self.row_of_cell_id[cell_ids] != NO_ROW).any() or np.unique(cell_ids).size != n_cells:
+            raise ValueError("cell ids already in the store")
+        
+        # rows from the free-list first, then new rows
+        n_reused = min(n_cells, self.n_free_rows)
+        reused_rows = self.free_rows[self.n_free_rows-n_reused:self.n_free_rows][::-1]
+        self.n_free_rows -= n_reused
+        n_new = n_cells - n_reused
+        self.reserve(self.n_rows + n_new)
+        rows = np.concatenate([reused_rows, np.arange(self.n_rows, self.n_rows + n_new, dtype=np.int64)])
+        self.n_rows += n_new
+        
+        for name, column in self.columns.items():
+            column[rows] = columns.get(name, self.fill_values[name]) if name != "cell_id" else cell_ids
+        self.is_alive[rows] = True
+        self.row_of_cell_id[cell_ids] = rows
+        self.n_cells += n_cells
+        if self.lineages is not None:
+            self.lineages.count_cells(self.columns["lineage_id"][rows], 1)
+        
+        return rows
+    
+    def remove_many(self, cell_ids: np.ndarray):
+        rows = self.get_rows(np.atleast_1d(cell_ids))
+        if rows.size == 0:
+            return
+        
+        if self.lineages is not None:
+            self.lineages.count_cells(self.columns["lineage_id"][rows], -1)
+        self.is_alive[rows] = False
+        self.row_of_cell_id[self.columns["cell_id"][rows]] = NO_ROW
+        for name, column in self.columns.items():
+            column[rows] = self.fill_values[name]
+        self.n_cells -= rows.size
+        
+        # push the rows onto the free-list
+        if self.n_free_rows + rows.size > self.free_rows.size:
+            free_rows = np.zeros(max(self.n_free_rows + rows.size, 2 * self.free_rows.size), dtype=np.int64)
+            free_rows[:self.n_free_rows] = self.free_rows[:self.n_free_rows]
+            self.free_rows = free_rows
+        self.free_rows[self.n_free_rows:self.n_free_rows + rows.size] = rows
+        self.n_free_rows += rows.size
+        
+    def set_many(self, cell_ids: np.ndarray, **columns):
+        rows = self.get_rows(np.atleast_1d(cell_ids))
+        for name, values in columns.items():
+            if name not in self.columns or name == "cell_id":
+                raise ValueError(f"column {name} cannot be set")
+            if name == "lineage_id" and self.lineages is not None:
+                self.lineages.count_cells(self.columns[name][rows], -1)
+                self.columns[name][rows] = values
+                self.lineages.count_cells(self.columns[name][rows], 1)
+                continue
+            self.columns[name][rows] = values
+    
+    def get_attributes(self, row: int) -> Dict:
+        columns = self.columns
+        attributes = {
+            "cell_id": columns["cell_id"][row].item(), "site_id": columns["site_id"][row].item(),
+            "cell_position": (columns["x"][row].item(), columns["y"][row].item()),
+            "cell_state": columns["cell_state"][row].item()
+        }
+        for name in self.extra_column_names:
+            attributes[name] = columns[name][row].item()
+        return attributes
+    
+    def set_attributes(self, row: int, updated_attributes: Dict):
+        columns = self.columns
+        for name, value in updated_attributes.items():
+            if name == "cell_position":
+                columns["x"][row], columns["y"][row] = value
+            elif name == "cell_id":
+                if int(value) != columns["cell_id"][row]:
+                    raise ValueError("cell_id of a stored cell cannot be changed")
+            elif name == "lineage_id" and self.lineages is not None:
+                self.set_many([columns["cell_id"][row]], lineage_id=value)
+            elif name in columns:
+                columns[name][row] = value
+            else:
+                raise ValueError(f"unknown attribute {name}; add it with add_column first")
+    
+    def add(self, cell_attributes: Dict) -> int:
+        attributes = dict(cell_attributes)
+        cell_id = attributes.pop("cell_id")
+        if "cell_position" in attributes:
+            attributes["x"], attributes["y"] = attributes.pop("cell_position")
+        return int(self.add_many([cell_id], **attributes)[0])
+    
+    def get_view(self, cell_id: int) -> CellView:
+        return self.view_class(self, self.get_row(cell_id))
+    
+    def get_lineage_ids(self, cell_ids: np.ndarray) -> np.ndarray:
+        return self.columns["lineage_id"][self.get_rows(cell_ids)]
+    
+    def found_lineages(self, cell_ids: np.ndarray, birth_time: float=0.) -> np.ndarray:
+        """_summary_
+
+        This function moves cells into new lineages, one per cell, founded from their current lineages (e.g. subclones acquiring a mutation);
+        cells born from them later belong to the new lineages.
+
+        Args:
+            cell_ids (np.ndarray): the ids of the founding cells
+            birth_time (float, optional): the time the lineages are founded. Defaults to 0.
+
+        Returns:
+            np.ndarray: the ids of the new lineages
+        """
+        
+        if self.lineages is None:
+            raise ValueError("lineages are not tracked in this store")
+        cell_ids = np.atleast_1d(np.asarray(cell_ids, dtype=np.int64))
+        lineage_ids = self.lineages.add_lineages(cell_ids, parent_lineage_ids=self.get_lineage_ids(cell_ids), birth_time=birth_time)
+        self.set_many(cell_ids, lineage_id=lineage_ids)
+        return lineage_ids
+    
+    def copy(self) -> "CellStore":
+        store = CellStore(cell_class=self.cell_class)
+        store.columns = {name: column.copy() for name, column in self.columns.items()}
+        store.fill_values = dict(self.fill_values)
+        store.extra_column_names = list(self.extra_column_names)
+        store.is_alive = self.is_alive.copy()
+        store.n_rows, store.n_cells, store.n_free_rows = self.n_rows, self.n_cells, self.n_free_rows
+        store.free_rows = self.free_rows.copy()
+        store.row_of_cell_id = self.row_of_cell_id.copy()
+        store.lineages = self.lineages.copy() if self.lineages is not None else None
+        return store
+
+class CellDictionary(MutableMapping):
+    """_summary_
+    
+    A Dict-like interface of a CellStore, keyed by cell_id, with CancerCell or Hepatocyte views as values,
+    so that code written for a dict of CancerCell or Hepatocyte objects keeps working.
+    Cells are iterated in order of cell_id, over a snapshot taken when the iteration starts, so cells can be added while iterating
+    (views of cells removed while iterating are not valid). Cells are updated in place, and copy() copies the whole store.
+    """
+    
+    def __init__(self, store: CellStore):
+        self.store = store
+        
+    @classmethod
+    def from_dictionary(cls, dict_of_cells: Dict, cell_class: Type[Cell]) -> "CellDictionary":
+        dict_of_cells_in_store = cls(CellStore(cell_class=cell_class, capacity=len(dict_of_cells)))
+        dict_of_cells_in_store.update(dict_of_cells)
+        return dict_of_cells_in_store
+    
+    def to_dictionary(self) -> Dict:
+        return {
+            cell_id: self.store.cell_class(cell_attributes=cell.get_attributes())
+            for cell_id, cell in self.items()
+        }
+        
+    def __len__(self) -> int:
+        return len(self.store)
+    
+    def __contains__(self, cell_id) -> bool:
+        try:
+            return self.store.contains(int(cell_id))
+        except (TypeError, ValueError):
+            return False
+    
+    def __getitem__(self, cell_id: int) -> CellView:
+        try:
+            return self.store.get_view(int(cell_id))
+        except (TypeError, ValueError):
+            raise KeyError(cell_id)
+    
+    def __setitem__(self, cell_id: int, cell: Cell):
+        cell_id = int(cell_id)
+        if isinstance(cell, CellView) and cell.store is self.store and self.store.contains(cell_id) \
+            and self.store.get_row(cell_id) == cell.row:
+            return
+        cell_attributes = cell.get_attributes()
+        if int(cell_attributes["cell_id"]) != cell_id:
+            raise ValueError("cells should be keyed by their cell_id")
+        if self.store.contains(cell_id):
+            self.store.set_attributes(self.store.get_row(cell_id), cell_attributes)
+        else:
+            self.store.add(cell_attributes)
+            
+    def __delitem__(self, cell_id: int):
+        if cell_id not in self:
+            raise KeyError(cell_id)
+        self.store.remove_many([int(cell_id)])
+        
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.store.get_cell_ids().tolist())
+    
+    def items(self) -> Iterator[Tuple[int, CellView]]:
+        # views of a snapshot of the rows, without looking the cell ids up again
+        store = self.store
+        rows = store.get_alive_rows()
+        return zip(store.cell_id[rows].tolist(), [store.view_class(store, row) for row in rows.tolist()])
+    
+    def values(self) -> Iterator[CellView]:
+        store = self.store
+        return (store.view_class(store, row) for row in store.get_alive_rows().tolist())
+    
+    def __ior__(self, other: Dict) -> "CellDictionary":
+        self.update(other)
+        return self
+    
+    def __repr__(self) -> str:
+        return f"CellDictionary({self.store.cell_class.__name__}, {len(self)} cells)"
+    
+    def copy(self) -> "CellDictionary":
+        return CellDictionary(self.store.copy())
+    
+    def count_cell_state(self, cell_state: int) -> int:
+        return self.store.count_cell_state(cell_state)
+    
+    @property
+    def lineages(self) -> LineageTable:
+        return self.store.lineages
+
+def get_lineages(dict_of_cells: Dict) -> LineageTable:
+    # the lineages tracked for the cells, None if not tracked (e.g. for a dict of objects)
+    return dict_of_cells.lineages if isinstance(dict_of_cells, CellDictionary) else None
+
+def copy_cell_dictionary(dict_of_cells: Dict) -> Dict:
+    # cells in a CellDictionary are updated in place, a plain dict is shallow-copied
+    if isinstance(dict_of_cells, CellDictionary):
+        return dict_of_cells
+    return dict_of_cells.copy()
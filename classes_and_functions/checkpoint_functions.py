@@ -0,0 +1,177 @@
+"""_summary_
+
+This Python script contains functions to save the full state of a simulation at time t to a checkpoint file, and to restore it,
+so that the simulation continues exactly as if it had not been interrupted (e.g. to extend T, or to resume a preempted job).
+
+A checkpoint is an uncompressed .npz file, read without pickle, containing
+    - metadata: the format version, t, the next cell id, the state of the random number generator and the columns of the cell tables
+    - lattice_<array>: the arrays of the ArrayLattice
+    - <CancerCell|Hepatocyte>_<column>: the cells as tables of columns (cell_id, site_id, cell_state, x, y and extra columns of a CellStore),
+      in order of cell_id
+    - <CancerCell|Hepatocyte>_lineages_<array>: the state of the LineageTable of a CellStore tracking lineages
+Checkpoints are taken between time steps of update_cell_states and implicit_immune_predation, which keep no other state.
+
+"""
+
+import json
+import os
+
+import numpy as np
+
+from classes_and_functions.cell_classes import CancerCell, Hepatocyte, CellStore, CellDictionary, LineageTable, get_lineages
+from classes_and_functions.lattice_classes import ArrayLattice
+from classes_and_functions.lattice_io_functions import LATTICE_ARRAYS
+
+from typing import Dict, Tuple, Union
+
+CHECKPOINT_FORMAT_VERSION = 1
+
+def get_rng_state(rng: Union[np.random.Generator, None]=None) -> Dict:
+    # the state of the generator, or of the global np.random state, as JSON-serialisable values
+    if rng is None:
+        name, key, pos, has_gauss, cached_gaussian = np.random.get_state()
+        return {
+            "bit_generator": "global", "name": name, "key": key.tolist(), "pos": pos,
+            "has_gauss": has_gauss, "cached_gaussian": cached_gaussian
+        }
+    return rng.bit_generator.state
+
+def set_rng_state(state: Dict) -> Union[np.random.Generator, None]:
+    # a generator in the given state, or None after restoring the global np.random state
+    if state["bit_generator"] == "global":
+        np.random.set_state((
+            state["name"], np.array(state["key"], dtype=np.uint32), state["pos"], state["has_gauss"], state["cached_gaussian"]
+        ))
+        return None
+    bit_generator = getattr(np.random, state["bit_generator"])()
+    bit_generator.state = state
+    return np.random.Generator(bit_generator)
+
+def get_cell_table(dict_of_cells: Dict) -> Tuple[Dict[str, np.ndarray], Dict]:
+    # the columns of the cells in order of cell_id, and the dtypes and fill values of extra columns of a CellStore
+    if isinstance(dict_of_cells, CellDictionary):
+        store = dict_of_cells.store
+        rows = store.get_alive_rows()
+        table = {name: column[rows] for name, column in store.columns.items()}
+        extra_columns = {name: store.fill_values[name] for name in store.extra_column_names}
+        return table, {name: np.asarray(fill_value).item() for name, fill_value in extra_columns.items()}
+
+    cell_attributes = [dict_of_cells[cell_id].get_attributes() for cell_id in sorted(dict_of_cells)]
+    table = {
+        name: np.array([attributes[name] for attributes in cell_attributes], dtype=dtype)
+        for name, (dtype, _) in CellStore.COLUMNS.items() if name not in ("x", "y")
+    }
+    table["x"] = np.array([attributes['cell_position'][0] for attributes in cell_attributes], dtype=np.float64)
+    table["y"] = np.array([attributes['cell_position'][1] for attributes in cell_attributes], dtype=np.float64)
+    return table, None
+
+def get_dict_of_cells(table: Dict[str, np.ndarray], extra_columns: Union[Dict, None], cell_class: type) -> Dict:
+    # the cells from their columns, in a CellDictionary if they were saved from one (extra_columns not None), in a dict otherwise
+    if extra_columns is not None:
+        store = CellStore(
+            cell_class=cell_class, capacity=table["cell_id"].size,
+            extra_columns={name: (table[name].dtype, fill_value) for name, fill_value in extra_columns.items()}
+        )
+        store.add_many(table["cell_id"], **{name: column for name, column in table.items() if name != "cell_id"})
+        return CellDictionary(store)
+
+    dict_of_cells = {}
+    for cell_id, site_id, cell_state, x, y in zip(*(table[name].tolist() for name in ["cell_id", "site_id", "cell_state", "x", "y"])):
+        dict_of_cells[cell_id] = cell_class(cell_attributes={
+            "cell_id": cell_id, "site_id": site_id, "cell_position": (x, y), "cell_state": cell_state
+        })
+    return dict_of_cells
+
+def save_checkpoint(
+    path: str,
+    t: int,
+    cell_dictionaries: Dict[str, Dict],
+    lattice: ArrayLattice,
+    rng: np.random.Generator=None
+):
+    """_summary_
+
+    This function saves the state of a simulation at time t, i.e. before the step from t to t+1, to a checkpoint file.
+    The file is written next to path first and then renamed, so that an interrupted save leaves the previous checkpoint intact.
+
+    Args:
+        path (str): the path to the checkpoint file, e.g. checkpoint.npz
+        t (int): the time of the simulation
+        cell_dictionaries (Dict[str, Dict]): a Dict of Dict containing the CancerCell and Hepatocyte objects
+        lattice (ArrayLattice): the lattice
+        rng (np.random.Generator, optional): the random number generator of the simulation. Defaults to None, i.e. the global np.random state.
+    """
+
+    arrays = {f"lattice_{name}": getattr(lattice, name) for name in LATTICE_ARRAYS}
+    cell_tables = {}
+    for cell_type, dict_of_cells in cell_dictionaries.items():
+        table, extra_columns = get_cell_table(dict_of_cells)
+        arrays.update({f"{cell_type}_{name}": column for name, column in table.items()})
+        cell_tables[cell_type] = {"columns": list(table), "extra_columns": extra_columns, "lineages": None}
+
+        lineages = get_lineages(dict_of_cells)
+        if lineages is not None:
+            lineage_state = lineages.get_state()
+            arrays.update({f"{cell_type}_lineages_{name}": array for name, array in lineage_state.items()})
+            cell_tables[cell_type]["lineages"] = list(lineage_state)
+
+    metadata = {
+        "format_version": CHECKPOINT_FORMAT_VERSION,
+        "t": int(t),
+        "next_cell_id": lattice.cell_id_allocator.get_state()["next_cell_id"],
+        "rng_state": get_rng_state(rng),
+        "cell_tables": cell_tables
+    }
+    arrays["metadata"] = np.array(json.dumps(metadata))
+
+    path_to_temporary_file = f"{path}.tmp"
+    with open(path_to_temporary_file, "wb") as file:
+        np.savez(file, **arrays)
+    os.replace(path_to_temporary_file, path)
+
+def load_checkpoint(
+    path: str,
+    CancerCell: CancerCell=CancerCell,
+    Hepatocyte: Hepatocyte=Hepatocyte
+) -> Tuple[int, Dict[str, Dict], ArrayLattice, Union[np.random.Generator, None]]:
+    """_summary_
+
+    This function restores the state of a simulation from a checkpoint file.
+
+    Args:
+        path (str): the path to the checkpoint file
+        CancerCell (CancerCell, optional): the CancerCell class used for the restored CancerCell objects. Defaults to CancerCell.
+        Hepatocyte (Hepatocyte, optional): the Hepatocyte class used for the restored Hepatocyte objects. Defaults to Hepatocyte.
+
+    Returns:
+        Tuple[int, Dict[str, Dict], ArrayLattice, Union[np.random.Generator, None]]: a Tuple of objects including
+            t - the time of the simulation
+            cell_dictionaries - a Dict of Dict containing the CancerCell and Hepatocyte objects, keyed by cell_id
+            lattice - the lattice
+            rng - the random number generator in its saved state, or None if the global np.random state was saved (and is now restored)
+    """
+
+    with np.load(path, allow_pickle=False) as checkpoint:
+        metadata = json.loads(checkpoint["metadata"].item())
+        if metadata["format_version"] > CHECKPOINT_FORMAT_VERSION:
+            raise ValueError(f"checkpoint format version {metadata['format_version']} is not supported")
+
+        lattice = ArrayLattice(
+            **{name: checkpoint[f"lattice_{name}"] for name in LATTICE_ARRAYS},
+            next_cell_id=metadata["next_cell_id"]
+        )
+
+        cell_classes = {"CancerCell": CancerCell, "Hepatocyte": Hepatocyte}
+        cell_dictionaries = {}
+        for cell_type, cell_table in metadata["cell_tables"].items():
+            table = {name: checkpoint[f"{cell_type}_{name}"] for name in cell_table["columns"]}
+            cell_dictionaries[cell_type] = get_dict_of_cells(table, cell_table["extra_columns"], cell_classes[cell_type])
+
+            if cell_table.get("lineages") is not None: # attached after the cells are added, as the state holds their counts
+                lineages = LineageTable()
+                lineages.set_state({name: checkpoint[f"{cell_type}_lineages_{name}"] for name in cell_table["lineages"]})
+                cell_dictionaries[cell_type].store.lineages = lineages
+
+    rng = set_rng_state(metadata["rng_state"])
+
+    return metadata["t"], cell_dictionaries, lattice, rng
@@ -0,0 +1,293 @@
+"""_summary_
+
+This Python script contains DomainDecomposedSimulation, which advances the lattice of a simulation partitioned into spatial subdomains,
+each updated in its own worker process, for lattices too large for one process (e.g. tissue sections tiled with generate_lattice).
+
+The lattice is cut into stripes of x with equal numbers of sites. Its arrays are shared by all processes, as .npy files memory-mapped from
+a temporary directory (in /dev/shm if available): the arrays updated during a simulation (site types, cell ids, cell states) read-write,
+the others read-only as in sweep_functions.py. The halo of a subdomain, i.e. the sites adjacent to it that other subdomains own, is read in place
+rather than copied as ghost rows; every site is only written by the worker of one subdomain in each phase.
+A step follows the synchronous rules of the vectorized engine (see vectorized_functions.py), in phases separated by barriers:
+    1. every subdomain draws the claims of its proliferative cancer cells on adjacent NO sites (growth or, in model_4, moves) and lists their adjacent
+       hepatocytes, sending both to the subdomains owning the claimed sites and the hepatocytes
+    2. every subdomain resolves the claims on its sites, the claim of the cell with the smallest cell_id winning, and applies the births and moves
+       (cancer cells moving across the boundary empty a site of another subdomain, which no other claim writes);
+       unlike in the vectorized engine, the sites vacated by moves in model_4 are not claimed again within the step
+    3. every subdomain draws the fates of its hepatocytes, processed once per adjacent proliferative cancer cell
+    4. in model_3, the number of cancer cells killed is drawn over the whole lattice and split between subdomains with a multivariate
+       hypergeometric distribution, each subdomain killing a uniform sample of its cancer cells
+so that the lattice evolves with the same distribution as with a single domain. Cells are tracked on the lattice only, not as Cell objects;
+born cells get ids unique over the lattice, but with gaps where claims lost a conflict.
+
+"""
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from classes_and_functions.lattice_classes import ArrayLattice, NO_CELL_ID, NO_CELL_STATE
+from classes_and_functions.lattice_io_functions import LATTICE_ARRAYS, READ_ONLY_ARRAY_NAMES, save_lattice
+from classes_and_functions.vectorized_functions import get_adjacent_site_types, get_growth_claims, get_hepatocyte_fates
+
+from typing import Dict, List
+
+# the lattice and subdomains of a worker process, see attach_domains
+WORKER_LATTICE = None
+WORKER_DOMAIN_OF_SITE = None
+WORKER_DOMAIN_SITE_IDS = None
+
+def partition_lattice(lattice: ArrayLattice, n_domains: int) -> np.ndarray:
+    # the subdomain of every site, as stripes of x (then y) with equal numbers of sites
+    order = np.lexsort((lattice.y, lattice.x))
+    domain_of_site = np.empty(lattice.n_sites, dtype=np.int32)
+    domain_of_site[order] = np.arange(lattice.n_sites) * n_domains // lattice.n_sites
+    return domain_of_site
+
+def get_halo_site_ids(lattice: ArrayLattice, domain_of_site: np.ndarray, domain: int) -> np.ndarray:
+    # the sites adjacent to a subdomain, owned by other subdomains
+    adjacent_site_ids = lattice.adjacent_site_ids[domain_of_site == domain].ravel()
+    adjacent_site_ids = np.unique(adjacent_site_ids[adjacent_site_ids >= 0])
+    return adjacent_site_ids[domain_of_site[adjacent_site_ids] != domain]
+
+def load_shared_lattice(directory: str) -> ArrayLattice:
+    # the lattice of a directory (see save_lattice), with the arrays updated during a simulation memory-mapped read-write
+    arrays = {
+        name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r' if name in READ_ONLY_ARRAY_NAMES else 'r+')
+        for name in LATTICE_ARRAYS
+    }
+    return ArrayLattice(**arrays, next_cell_id=0)
+
+def attach_domains(directory: str, n_domains: int):
+    # initializer of worker processes
+    global WORKER_LATTICE, WORKER_DOMAIN_OF_SITE, WORKER_DOMAIN_SITE_IDS
+    WORKER_LATTICE = load_shared_lattice(directory)
+    WORKER_DOMAIN_OF_SITE = np.load(os.path.join(directory, "domain_of_site.npy"), mmap_mode='r')
+    WORKER_DOMAIN_SITE_IDS = [np.load(os.path.join(directory, f"domain_{domain}_site_ids.npy"), mmap_mode='r') for domain in range(n_domains)]
+
+def split_by_domain(domains: np.ndarray, n_domains: int, **arrays) -> List[Dict[str, np.ndarray]]:
+    # the arrays split by the subdomain of their entries
+    order = np.argsort(domains, kind='stable')
+    bounds = np.searchsorted(domains[order], np.arange(n_domains+1))
+    return [{name: array[order[start:end]] for name, array in arrays.items()} for start, end in zip(bounds[:-1], bounds[1:])]
+
+def get_domain_claims(domain: int, parameters: Dict[str, float], model_type: str, seed: int) -> Dict:
+    # phase 1: the claims of the proliferative cancer cells of a subdomain, and their adjacent hepatocytes, split by the subdomain owning them
+    lattice, n_domains = WORKER_LATTICE, len(WORKER_DOMAIN_SITE_IDS)
+    rng = np.random.default_rng(seed)
+
+    site_ids = WORKER_DOMAIN_SITE_IDS[domain]
+    cancer_cell_site_ids = site_ids[(lattice.site_type[site_ids] == 4) & (lattice.cell_state[site_ids] == 1)]
+    adjacent_site_ids, adjacent_site_types = get_adjacent_site_types(lattice, cancer_cell_site_ids)
+
+    claim_rows, claim_cols, claim_is_move = get_growth_claims(adjacent_site_types, parameters['P_CC_GROW'], model_type, rng=rng)
+    target_site_ids = adjacent_site_ids[claim_rows, claim_cols].astype(np.int64)
+    birth_indices = np.cumsum(~claim_is_move) - 1 # the ids of born cells are allocated in the order of the claims
+
+    claims = split_by_domain(
+        WORKER_DOMAIN_OF_SITE[target_site_ids], n_domains,
+        source_site_ids=cancer_cell_site_ids[claim_rows], target_site_ids=target_site_ids, is_move=claim_is_move,
+        birth_indices=birth_indices, source_domains=np.full(claim_rows.size, domain, dtype=np.int32),
+        keys=lattice.cell_id[cancer_cell_site_ids[claim_rows]] # conflicts are resolved in favour of the smallest key
+    )
+
+    hep_site_ids = adjacent_site_ids[adjacent_site_types == 2].astype(np.int64) # once per adjacent proliferative cancer cell
+    hepatocytes = split_by_domain(WORKER_DOMAIN_OF_SITE[hep_site_ids], n_domains, hep_site_ids=hep_site_ids)
+
+    return {"claims": claims, "hepatocytes": hepatocytes, "n_birth_claims": int(np.count_nonzero(~claim_is_move))}
+
+def apply_domain_claims(domain: int, claims: List[Dict[str, np.ndarray]], first_cell_ids: np.ndarray) -> Dict[str, int]:
+    # phase 2: the claims on the sites of a subdomain resolved and applied, the cells born in subdomain s getting ids from first_cell_ids[s]
+    lattice = WORKER_LATTICE
+    claims = {name: np.concatenate([domain_claims[name] for domain_claims in claims]) for name in claims[0]}
+
+    order = np.lexsort((claims["keys"], claims["target_site_ids"]))
+    target_site_ids = claims["target_site_ids"][order]
+    is_first_claim = np.r_[True, target_site_ids[1:] != target_site_ids[:-1]] if order.size else np.zeros(0, dtype=bool)
+    winning_claims = order[is_first_claim]
+    is_move = claims["is_move"][winning_claims]
+    source_site_ids, target_site_ids = claims["source_site_ids"][winning_claims], claims["target_site_ids"][winning_claims]
+
+    # ... moves: previous sites to be emptied, new sites to be filled
+    moving_cell_site_ids, moving_cell_new_site_ids = source_site_ids[is_move], target_site_ids[is_move]
+    moving_cell_ids = lattice.cell_id[moving_cell_site_ids]
+    lattice.site_type[moving_cell_site_ids] = 3 # sitetype = not occupied
+    lattice.cell_id[moving_cell_site_ids] = NO_CELL_ID
+    lattice.cell_state[moving_cell_site_ids] = NO_CELL_STATE
+    lattice.site_type[moving_cell_new_site_ids] = 4 # sitetype = cancer cell
+    lattice.cell_id[moving_cell_new_site_ids] = moving_cell_ids
+    lattice.cell_state[moving_cell_new_site_ids] = 1
+
+    # ... births: new cancer cells on the claimed sites
+    new_cancer_cell_site_ids = target_site_ids[~is_move]
+    lattice.site_type[new_cancer_cell_site_ids] = 4 # sitetype = cancer cell
+    lattice.cell_id[new_cancer_cell_site_ids] = \
+        first_cell_ids[claims["source_domains"][winning_claims][~is_move]] + claims["birth_indices"][winning_claims][~is_move]
+    lattice.cell_state[new_cancer_cell_site_ids] = 1
+
+    return {"births": int(new_cancer_cell_site_ids.size), "moves": int(moving_cell_site_ids.size)}
+
+def update_domain_hepatocytes(domain: int, hepatocytes: List[Dict[str, np.ndarray]], parameters: Dict[str, float], model_type: str, seed: int) -> Dict[str, int]:
+    # phase 3: the fates of the hepatocytes of a subdomain adjacent to proliferative cancer cells, and the number of cancer cells of the subdomain
+    lattice = WORKER_LATTICE
+    rng = np.random.default_rng(seed)
+
+    hep_site_ids, n_rounds = np.unique(np.concatenate([domain_hepatocytes["hep_site_ids"] for domain_hepatocytes in hepatocytes]), return_counts=True)
+    is_damaged, is_cleared, is_fibrotic = get_hepatocyte_fates(
+        lattice, hep_site_ids, n_rounds, parameters['P_HEP_DAMAGED'], parameters['P_HEP_CLEARED'], model_type, rng=rng
+    )
+
+    lattice.cell_state[hep_site_ids[is_damaged]] = 2
+    for is_removed, site_type in ((is_cleared, 3), (is_fibrotic, 5)): # change to Not Occupied or ECM
+        lattice.site_type[hep_site_ids[is_removed]] = site_type
+        lattice.cell_id[hep_site_ids[is_removed]] = NO_CELL_ID
+        lattice.cell_state[hep_site_ids[is_removed]] = NO_CELL_STATE
+
+    site_ids = WORKER_DOMAIN_SITE_IDS[domain]
+    return {
+        "apoptosis": int(np.count_nonzero(is_damaged)), "clearances": int(np.count_nonzero(is_cleared)),
+        "ecm_conversions": int(np.count_nonzero(is_fibrotic)),
+        "n_cancer_cells": int(np.count_nonzero(lattice.site_type[site_ids] == 4))
+    }
+
+def kill_domain_cancer_cells(domain: int, n_killed: int, seed: int) -> Dict[str, int]:
+    # phase 4: a uniform sample of n_killed cancer cells of a subdomain killed
+    lattice = WORKER_LATTICE
+    rng = np.random.default_rng(seed)
+
+    site_ids = WORKER_DOMAIN_SITE_IDS[domain]
+    tumour_site_ids = site_ids[lattice.site_type[site_ids] == 4]
+    killed_site_ids = tumour_site_ids[rng.choice(tumour_site_ids.size, size=n_killed, replace=False)]
+
+    lattice.site_type[killed_site_ids] = 3 # change to Not Occupied
+    lattice.cell_id[killed_site_ids] = NO_CELL_ID
+    lattice.cell_state[killed_site_ids] = NO_CELL_STATE
+
+    return {"kills": int(killed_site_ids.size)}
+
+class DomainDecomposedSimulation:
+    """_summary_
+
+    Advances a lattice partitioned into spatial subdomains, each updated by a pool of worker processes sharing the lattice arrays.
+    Use as a context manager, so that the worker processes and the shared arrays are released:
+
+        with DomainDecomposedSimulation(lattice, parameters, model_type="model_1", n_domains=8, rng=rng) as simulation:
+            simulation.run(T)
+            lattice = simulation.get_lattice()
+    """
+
+    def __init__(
+        self,
+        lattice: ArrayLattice,
+        parameters: Dict[str, float],
+        model_type: str="model_1",
+        n_domains: int=8,
+        n_workers: int=None,
+        rng: np.random.Generator=None
+    ):
+        """_summary_
+
+        Args:
+            lattice (ArrayLattice): the lattice following initialisation of CancerCell objects (see init_cell_dictionaries), not updated
+            parameters (Dict[str, float]): parameters to be used in the simulation (see settings.py)
+            model_type (str, optional): model type to implement in the simulation. Defaults to "model_1".
+            n_domains (int, optional): the number of subdomains. Defaults to 8.
+            n_workers (int, optional): the number of worker processes. Defaults to None, i.e. the smaller of n_domains and the number of CPUs.
+            rng (np.random.Generator, optional): the random number generator of the simulation, drawing the seeds of the workers in every phase.
+                Defaults to None, i.e. a generator seeded from fresh entropy.
+        """
+
+        self.parameters = parameters
+        self.model_type = model_type
+        self.n_domains = n_domains
+        self.rng = np.random.default_rng(rng)
+        self.t = 0
+        self.next_cell_id = lattice.cell_id_allocator.next_cell_id
+        self.events = [] # the events of every step
+
+        # the shared arrays, in memory rather than on disk where possible
+        self.directory = tempfile.TemporaryDirectory(dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+        save_lattice(lattice, self.directory.name)
+        domain_of_site = partition_lattice(lattice, n_domains)
+        np.save(os.path.join(self.directory.name, "domain_of_site.npy"), domain_of_site)
+        for domain in range(n_domains):
+            np.save(os.path.join(self.directory.name, f"domain_{domain}_site_ids.npy"), np.flatnonzero(domain_of_site == domain))
+        self.lattice = load_shared_lattice(self.directory.name)
+
+        if n_workers is None:
+            n_workers = min(n_domains, os.cpu_count() or 1)
+        self.executor = ProcessPoolExecutor(max_workers=n_workers, initializer=attach_domains, initargs=(self.directory.name, n_domains))
+
+    def __enter__(self) -> "DomainDecomposedSimulation":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown()
+        self.lattice = self.get_lattice() # a copy, as the shared arrays are deleted
+        self.directory.cleanup()
+
+    def map_domains(self, function, *args) -> List:
+        # calls function(domain, *args[domain]) for every subdomain in the worker processes, and waits for all of them
+        return list(self.executor.map(function, range(self.n_domains), *args))
+
+    def step(self) -> Dict[str, int]:
+        """_summary_
+
+        This function advances the lattice by one time step: cancer cell proliferation and migration, hepatocyte death, and immune predation in model_3.
+
+        Returns:
+            Dict[str, int]: the numbers of births, moves, apoptosis, clearances, ecm_conversions and kills in the step
+        """
+
+        n_domains = self.n_domains
+        seeds = self.rng.integers(2**63, size=(3, n_domains))
+
+        claims = self.map_domains(get_domain_claims, [self.parameters]*n_domains, [self.model_type]*n_domains, seeds[0])
+
+        # cells born in subdomain s get the ids first_cell_ids[s], first_cell_ids[s]+1, ..., one per claimed birth
+        n_birth_claims = np.array([domain_claims["n_birth_claims"] for domain_claims in claims], dtype=np.int64)
+        first_cell_ids = self.next_cell_id + np.concatenate([[0], np.cumsum(n_birth_claims)[:-1]])
+        self.next_cell_id += int(n_birth_claims.sum())
+
+        growth = self.map_domains(
+            apply_domain_claims,
+            [[domain_claims["claims"][domain] for domain_claims in claims] for domain in range(n_domains)],
+            [first_cell_ids]*n_domains
+        )
+        hepatocytes = self.map_domains(
+            update_domain_hepatocytes,
+            [[domain_claims["hepatocytes"][domain] for domain_claims in claims] for domain in range(n_domains)],
+            [self.parameters]*n_domains, [self.model_type]*n_domains, seeds[1]
+        )
+
+        events = {name: sum(result[name] for result in growth) for name in ["births", "moves"]}
+        events.update({name: sum(result[name] for result in hepatocytes) for name in ["apoptosis", "clearances", "ecm_conversions"]})
+        events["kills"] = 0
+
+        if self.model_type == "model_3":
+            # K sites out of N are attacked, K being the number of cancer cells, and cancer cells under attack are killed with a probability,
+            # as in sample_killed_site_ids; the cancer cells killed are a uniform sample over the subdomains
+            n_cancer_cells = np.array([result["n_cancer_cells"] for result in hepatocytes], dtype=np.int64)
+            n_tumour_sites = int(n_cancer_cells.sum())
+            if n_tumour_sites > 0:
+                n_attacked = self.rng.hypergeometric(n_tumour_sites, self.lattice.n_sites - n_tumour_sites, n_tumour_sites)
+                n_killed = self.rng.binomial(n_attacked, self.parameters['P_CC_KILLED'])
+                kills = self.map_domains(kill_domain_cancer_cells, self.rng.multivariate_hypergeometric(n_cancer_cells, n_killed), seeds[2])
+                events["kills"] = sum(result["kills"] for result in kills)
+
+        self.t += 1
+        self.events.append(events)
+        return events
+
+    def run(self, n_steps: int):
+        for _ in range(n_steps):
+            self.step()
+
+    def get_lattice(self) -> ArrayLattice:
+        # a copy of the lattice at the current time
+        lattice = ArrayLattice(**{name: np.array(getattr(self.lattice, name)) for name in LATTICE_ARRAYS}, next_cell_id=self.next_cell_id)
+        return lattice
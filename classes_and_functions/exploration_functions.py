@@ -0,0 +1,429 @@
+"""_summary_
+
+This Python script contains the data layer of the Dash apps of 2_notebook_exploration.ipynb:
+    - prepare_model_conditions derives categorical model_type and seeding_density columns from model_condition, splitting each distinct
+      model condition once instead of every row
+    - IndexedTable sorts a DataFrame once by its key columns, so that the rows of a selection of keys are a contiguous slice found in a dict,
+      instead of boolean masks over the whole DataFrame on every callback
+    - SnapshotExplorer loads combined snapshots once, indexed by (model_type, seeding_density, pid, time), optionally downsamples or rasterizes
+      the background hepatocytes, which make most of the points of a snapshot, and caches the figures with LRU eviction
+
+Figures are built as plotly figure dicts, without importing plotly; dash is an optional dependency, imported only to build the app.
+
+"""
+
+import functools
+
+import numpy as np
+import pandas as pd
+
+from classes_and_functions.settings import get_cell_configurations
+
+from typing import Dict, List, Tuple, Union
+
+SNAPSHOT_KEYS = ["model_type", "seeding_density", "pid", "time"]
+BACKGROUND_MODES = ["all", "downsample", "raster"]
+BACKGROUND_SITE_TYPE = 2 # hepatocytes, untouched by the tumours in most of the lattice
+
+def prepare_model_conditions(table: pd.DataFrame) -> pd.DataFrame:
+    """_summary_
+
+    This function adds the model_type and seeding_density columns of a DataFrame containing model_condition, e.g. model_1 and SeedDen_0.25
+    for model_1_SeedDen_0.25, as categorical columns. Only the distinct model conditions are split, and the rows get the codes.
+
+    Args:
+        table (pd.DataFrame): a DataFrame containing model_condition, modified in place
+
+    Returns:
+        pd.DataFrame: the DataFrame, with model_condition, model_type and seeding_density as categorical columns
+    """
+
+    model_conditions = table["model_condition"].astype("category")
+    categories = model_conditions.cat.categories.astype(str)
+    codes = model_conditions.cat.codes.to_numpy()
+
+    table["model_condition"] = model_conditions
+    for column, parts in [("model_type", slice(None, 2)), ("seeding_density", slice(2, None))]:
+        values = np.array(['_'.join(condition.split('_')[parts]) for condition in categories], dtype=object)
+        value_categories, value_codes = np.unique(values, return_inverse=True)
+        table[column] = pd.Categorical.from_codes(
+            np.where(codes >= 0, value_codes.reshape(-1)[codes], -1), categories=value_categories
+        )
+    return table
+
+class IndexedTable:
+    """_summary_
+
+    A DataFrame sorted once by its key columns, with the rows of every combination of the first keys stored as a slice, so that selecting
+    the rows of a model_type, a (model_type, seeding_density), ... costs a dict lookup and returns a view instead of a filtered copy.
+    """
+
+    def __init__(self, table: pd.DataFrame, keys: List[str]):
+        """_summary_
+
+        Args:
+            table (pd.DataFrame): the DataFrame, containing the key columns
+            keys (List[str]): the key columns, from the coarsest to the finest selection
+        """
+
+        self.keys = list(keys)
+        self.table = table.sort_values(self.keys, kind="stable").reset_index(drop=True)
+
+        # the row slices of the combinations of the first 1, 2, ... keys, contiguous since the rows are sorted by the keys
+        self.slices = {}
+        for n_keys in range(1, len(self.keys) + 1):
+            groups = self.table.groupby(self.keys[:n_keys], observed=True, sort=False).indices
+            for key, row_ids in groups.items():
+                key = key if isinstance(key, tuple) else (key,)
+                self.slices[key] = slice(int(row_ids[0]), int(row_ids[-1]) + 1)
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def get(self, *key) -> pd.DataFrame:
+        # the rows of the values of the first len(key) keys, an empty DataFrame if there are none
+        if len(key) > len(self.keys):
+            raise ValueError(f"at most {len(self.keys)} keys ({', '.join(self.keys)}), got {len(key)}")
+        if not key:
+            return self.table
+        return self.table.iloc[self.slices.get(tuple(key), slice(0, 0))]
+
+    def get_values(self, column: str, *key) -> List:
+        # the sorted distinct values of column in the rows of key, e.g. the options of a Dropdown
+        values = self.get(*key)[column]
+        values = values.cat.remove_unused_categories().cat.categories if isinstance(values.dtype, pd.CategoricalDtype) else values.unique()
+        return sorted(values.tolist())
+
+def get_site_keys(snapshot: pd.DataFrame) -> np.ndarray:
+    # an integer per site, the same in all snapshots of a lattice: site_id, or the rank of (x, y) among the positions of the sites
+    if "site_id" in snapshot.columns:
+        return snapshot["site_id"].to_numpy(dtype=np.int64)
+    positions = np.stack([snapshot["x"].to_numpy(), snapshot["y"].to_numpy()], axis=1)
+    return np.unique(positions, axis=0, return_inverse=True)[1].reshape(-1).astype(np.int64)
+
+def downsample_background(snapshot: pd.DataFrame, background_fraction: float, seed: int=0) -> pd.DataFrame:
+    """_summary_
+
+    This function keeps a fraction of the background hepatocytes of snapshots, and all other sites. The hepatocytes kept are chosen by a hash
+    of their site, so that the same sites are kept in all snapshots and background points do not flicker between figures.
+
+    Args:
+        snapshot (pd.DataFrame): snapshots, containing x, y, site_type and preferably site_id
+        background_fraction (float): the fraction of background hepatocytes kept, in [0, 1]
+        seed (int, optional): the seed of the hash choosing the hepatocytes kept. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: the rows kept
+    """
+
+    hashes = (get_site_keys(snapshot).astype(np.uint64) + np.uint64(seed)) * np.uint64(0x9E3779B97F4A7C15)
+    kept = (hashes >> np.uint64(40)) < np.uint64(background_fraction * (1 << 24))
+    return snapshot.loc[(snapshot["site_type"].to_numpy() != BACKGROUND_SITE_TYPE) | kept]
+
+def rasterize_background(snapshot: pd.DataFrame, raster_bins: int, extent: Tuple[float]) -> pd.DataFrame:
+    """_summary_
+
+    This function replaces the background hepatocytes of every pid and time of snapshots by one point per occupied cell of a raster_bins x raster_bins
+    grid, at the centre of the cell, and keeps all other sites.
+
+    Args:
+        snapshot (pd.DataFrame): snapshots, containing pid, time, x, y and site_type
+        raster_bins (int): the number of cells of the grid along x and y
+        extent (Tuple[float]): (x_min, x_max, y_min, y_max) of the grid, the same for all snapshots of a lattice
+
+    Returns:
+        pd.DataFrame: the rows of the sites other than hepatocytes, followed by the points of the grid, with the columns of snapshot
+            (the columns other than pid, time, x, y and site_type of grid points taken from a hepatocyte of their cell)
+    """
+
+    is_background = snapshot["site_type"].to_numpy() == BACKGROUND_SITE_TYPE
+    background = snapshot.loc[is_background]
+
+    x_min, x_max, y_min, y_max = extent
+    x_size = max(x_max - x_min, 1e-12) / raster_bins
+    y_size = max(y_max - y_min, 1e-12) / raster_bins
+    ix = np.clip(((background["x"].to_numpy() - x_min) / x_size).astype(np.int64), 0, raster_bins - 1)
+    iy = np.clip(((background["y"].to_numpy() - y_min) / y_size).astype(np.int64), 0, raster_bins - 1)
+
+    # one row per occupied (pid, time, cell)
+    frame_ids = background.groupby(["pid", "time"], observed=True, sort=False).ngroup().to_numpy().astype(np.int64)
+    _, row_ids = np.unique((frame_ids * raster_bins + ix) * raster_bins + iy, return_index=True)
+    points = background.iloc[row_ids].copy()
+    points["x"] = x_min + (ix[row_ids] + 0.5) * x_size
+    points["y"] = y_min + (iy[row_ids] + 0.5) * y_size
+
+    return pd.concat([snapshot.loc[~is_background], points], ignore_index=True)
+
+class SnapshotExplorer:
+    """_summary_
+
+    Combined snapshots of simulations (e.g. selected_simulation_snapshots_at_40.csv), loaded once with categorical columns and indexed by
+    (model_type, seeding_density, pid, time), with the figures of the Dash app cached with LRU eviction.
+    """
+
+    def __init__(
+        self,
+        snapshots: Union[str, pd.DataFrame],
+        background: str="all",
+        background_fraction: float=0.1,
+        raster_bins: int=40,
+        cache_size: int=32
+    ):
+        """_summary_
+
+        Args:
+            snapshots (Union[str, pd.DataFrame]): the path to a CSV file or a DataFrame of combined snapshots, containing model_condition, pid,
+                x, y, site_type and optionally time (all rows at time 0 otherwise) and site_id
+            background (str, optional): the default treatment of the background hepatocytes in figures, "all" to plot all of them,
+                "downsample" to plot background_fraction of them, "raster" to plot one point per cell of a raster_bins x raster_bins grid.
+                Defaults to "all".
+            background_fraction (float, optional): the fraction of background hepatocytes plotted with background="downsample". Defaults to 0.1.
+            raster_bins (int, optional): the number of cells of the grid along x and y with background="raster". Defaults to 40.
+            cache_size (int, optional): the number of figures kept in the cache. Defaults to 32.
+        """
+
+        if background not in BACKGROUND_MODES:
+            raise ValueError(f"background must be one of {', '.join(BACKGROUND_MODES)}, got {background}")
+        self.background = background
+        self.background_fraction = background_fraction
+        self.raster_bins = raster_bins
+
+        table = pd.read_csv(snapshots) if isinstance(snapshots, str) else snapshots.copy()
+        if "time" not in table.columns:
+            table["time"] = 0
+        table = prepare_model_conditions(table)
+
+        # site type names as a categorical column, from the codes of site_type instead of a map of every row
+        self.site_types, _, self.color_map, _ = get_cell_configurations()
+        site_type_codes = np.arange(max(self.site_types) + 1)
+        site_type_names = [self.site_types.get(code, str(code)) for code in site_type_codes]
+        table["site_type_name"] = pd.Categorical.from_codes(table["site_type"].to_numpy(dtype=np.int64), categories=site_type_names)
+
+        self.snapshots = IndexedTable(table, SNAPSHOT_KEYS)
+        self.extent = (table["x"].min(), table["x"].max(), table["y"].min(), table["y"].max()) if len(table) else (0., 1., 0., 1.)
+
+        self.get_plot_data = functools.lru_cache(maxsize=cache_size)(self.make_plot_data)
+        self.get_figure = functools.lru_cache(maxsize=cache_size)(self.make_figure)
+
+    def get_model_types(self) -> List[str]:
+        return self.snapshots.get_values("model_type")
+
+    def get_seeding_densities(self, model_type: str=None) -> List[str]:
+        return self.snapshots.get_values("seeding_density", *([] if model_type is None else [model_type]))
+
+    def get_times(self, model_type: str, seeding_density: str) -> List[int]:
+        return self.snapshots.get_values("time", model_type, seeding_density)
+
+    def get_snapshots(self, model_type: str, seeding_density: str, pid: int=None, time: int=None) -> pd.DataFrame:
+        """_summary_
+
+        This function returns the snapshots of a model condition, of a pid, of a pid at a time, as a slice of the indexed snapshots.
+        With time but without pid, the snapshots of all pids at that time are returned.
+
+        Args:
+            model_type (str): the model type, e.g. model_1
+            seeding_density (str): the seeding density, e.g. SeedDen_0.25
+            pid (int, optional): the pid of a simulation. Defaults to None, i.e. all pids.
+            time (int, optional): the time of the snapshots. Defaults to None, i.e. all times.
+
+        Returns:
+            pd.DataFrame: the rows of the snapshots
+        """
+
+        if pid is not None:
+            return self.snapshots.get(*([model_type, seeding_density, pid] + ([] if time is None else [time])))
+
+        snapshots = self.snapshots.get(model_type, seeding_density)
+        if time is None:
+            return snapshots
+        # the time is the last key, so the rows of a time are one slice per pid
+        pids = self.snapshots.get_values("pid", model_type, seeding_density)
+        return pd.concat([self.snapshots.get(model_type, seeding_density, pid, time) for pid in pids])
+
+    def make_plot_data(
+        self,
+        model_type: str,
+        seeding_density: str,
+        time: int=None,
+        pids: Tuple[int]=None,
+        background: str=None
+    ) -> pd.DataFrame:
+        """_summary_
+
+        This function returns the points of a figure: the snapshots of pids of a model condition at a time, with the background hepatocytes
+        downsampled or rasterized. Use get_plot_data, the cached version of this function.
+
+        Args:
+            model_type (str): the model type, e.g. model_1
+            seeding_density (str): the seeding density, e.g. SeedDen_0.25
+            time (int, optional): the time of the snapshots. Defaults to None, i.e. the last time of the model condition.
+            pids (Tuple[int], optional): the pids plotted. Defaults to None, i.e. all pids of the model condition.
+            background (str, optional): the treatment of the background hepatocytes, see __init__. Defaults to None, i.e. self.background.
+
+        Returns:
+            pd.DataFrame: the rows plotted, containing pid, x, y and site_type_name
+        """
+
+        background = self.background if background is None else background
+        if background not in BACKGROUND_MODES:
+            raise ValueError(f"background must be one of {', '.join(BACKGROUND_MODES)}, got {background}")
+
+        times = self.get_times(model_type, seeding_density)
+        if time is None and times:
+            time = times[-1]
+        pids = self.snapshots.get_values("pid", model_type, seeding_density) if pids is None else pids
+
+        snapshots = [self.snapshots.get(model_type, seeding_density, pid, time) for pid in pids]
+        snapshot = pd.concat(snapshots) if snapshots else self.snapshots.table.iloc[:0]
+
+        if background == "downsample":
+            snapshot = downsample_background(snapshot, self.background_fraction)
+        elif background == "raster":
+            snapshot = rasterize_background(snapshot, self.raster_bins, self.extent)
+        return snapshot
+
+    def make_figure(
+        self,
+        model_type: str,
+        seeding_density: str,
+        time: int=None,
+        pids: Tuple[int]=None,
+        background: str=None,
+        facet_col_wrap: int=3,
+        facet_height: int=300
+    ) -> Dict:
+        """_summary_
+
+        This function returns the scatter plots of the snapshots of pids of a model condition at a time, one facet per pid, as update_plot of
+        2_notebook_exploration.ipynb. The figure is built as a dict of WebGL traces, one per site type and pid, since plotly.express spends
+        seconds validating the traces and axes of hundreds of facets. Use get_figure, the cached version of this function; the figure returned
+        is shared by the cache and should not be modified.
+
+        Args:
+            model_type (str): the model type, e.g. model_1
+            seeding_density (str): the seeding density, e.g. SeedDen_0.25
+            time (int, optional): the time of the snapshots. Defaults to None, i.e. the last time of the model condition.
+            pids (Tuple[int], optional): the pids plotted. Defaults to None, i.e. all pids of the model condition.
+            background (str, optional): the treatment of the background hepatocytes, see __init__. Defaults to None, i.e. self.background.
+            facet_col_wrap (int, optional): the number of facets per row. Defaults to 3.
+            facet_height (int, optional): the height of a row of facets in pixels. Defaults to 300.
+
+        Returns:
+            Dict: the figure, as accepted by dcc.Graph and plotly.graph_objects.Figure
+        """
+
+        plot_data = self.get_plot_data(model_type, seeding_density, time=time, pids=pids, background=background)
+        x = plot_data["x"].to_numpy()
+        y = plot_data["y"].to_numpy()
+        pids = plot_data["pid"].unique().tolist()
+        n_rows = max(-(-len(pids) // facet_col_wrap), 1)
+        x_gap, y_gap = 0.03 / facet_col_wrap, min(0.03, 0.3 / n_rows)
+
+        layout = {
+            "height": facet_height * n_rows + 100,
+            "plot_bgcolor": "white",
+            "legend": {"title": {"text": "site_type_name"}, "itemsizing": "constant"},
+            "annotations": []
+        }
+        axis = {"showgrid": False, "showline": True, "linecolor": "black", "ticks": "outside", "zeroline": False}
+        for i, pid in enumerate(pids):
+            row, col = divmod(i, facet_col_wrap)
+            suffix = "" if i == 0 else str(i + 1)
+            y_top = 1 - row / n_rows
+            layout[f"xaxis{suffix}"] = {
+                **axis, "domain": [col / facet_col_wrap + x_gap, (col + 1) / facet_col_wrap - x_gap], "anchor": f"y{suffix}",
+                "title": {"text": "x", "font": {"family": "Arial", "size": 14}}
+            }
+            layout[f"yaxis{suffix}"] = {
+                **axis, "domain": [y_top - 1 / n_rows + y_gap, y_top - y_gap], "anchor": f"x{suffix}",
+                "scaleanchor": f"x{suffix}", "scaleratio": 1, "title": {"text": "y", "font": {"family": "Arial", "size": 14}}
+            }
+            layout["annotations"].append({
+                "text": f"pid={pid}", "showarrow": False, "xref": "paper", "yref": "paper", "xanchor": "center", "yanchor": "bottom",
+                "x": (col + 0.5) / facet_col_wrap, "y": y_top - y_gap
+            })
+
+        # one trace per site type and pid, the rows of which are found once by groupby
+        index_of_pid = {pid: i for i, pid in enumerate(pids)}
+        groups = plot_data.groupby(["site_type_name", "pid"], observed=True, sort=True).indices
+        data = []
+        shown = set()
+        for (site_type_name, pid), row_ids in groups.items():
+            i = index_of_pid[pid]
+            suffix = "" if i == 0 else str(i + 1)
+            data.append({
+                "type": "scattergl", "mode": "markers", "x": x[row_ids], "y": y[row_ids],
+                "xaxis": f"x{suffix}", "yaxis": f"y{suffix}",
+                "name": site_type_name, "legendgroup": site_type_name, "showlegend": site_type_name not in shown,
+                "marker": {"color": self.color_map.get(site_type_name), "size": 1.5}
+            })
+            shown.add(site_type_name)
+
+        return {"data": data, "layout": layout}
+
+    def get_cache_info(self) -> Dict[str, Tuple]:
+        # hits, misses, maxsize and currsize of the caches of plot data and figures
+        return {"plot_data": self.get_plot_data.cache_info(), "figure": self.get_figure.cache_info()}
+
+    def clear_cache(self):
+        self.get_plot_data.cache_clear()
+        self.get_figure.cache_clear()
+
+def create_snapshot_app(explorer: SnapshotExplorer, external_stylesheets: List[str]=None):
+    """_summary_
+
+    This function returns the Dash app of the snapshots of 2_notebook_exploration.ipynb, with dropdowns of model type, seeding density and time,
+    and the figures of the SnapshotExplorer.
+
+    Args:
+        explorer (SnapshotExplorer): the snapshots
+        external_stylesheets (List[str], optional): the stylesheets of the app. Defaults to None, i.e. those of the notebook.
+
+    Returns:
+        dash.Dash: the app, to be run with app.run(port=8050)
+    """
+
+    from dash import Dash, Input, Output, html, dcc
+
+    external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css'] if external_stylesheets is None else external_stylesheets
+    app = Dash(__name__, external_stylesheets=external_stylesheets)
+
+    model_types = explorer.get_model_types()
+    seeding_densities = explorer.get_seeding_densities()
+    app.layout = html.Div([
+        html.Div([
+            html.Div([
+                html.H3('Select model type...'),
+                dcc.Dropdown(model_types, model_types[0] if model_types else None, placeholder="Select model type...", id='dropdown-model-type')
+            ], className="four columns"),
+            html.Div([
+                html.H3('Select tumour seeding density...'),
+                dcc.Dropdown(
+                    seeding_densities, seeding_densities[0] if seeding_densities else None,
+                    placeholder="Select seeding density...", id='dropdown-seeding-density'
+                )
+            ], className="four columns"),
+            html.Div([
+                html.H3('Select time point...'),
+                dcc.Dropdown(placeholder="Select time point...", id='dropdown-time')
+            ], className="four columns"),
+        ], className="row"),
+        html.Div([dcc.Graph(id='scatter1')])
+    ])
+
+    @app.callback(
+        [Output('dropdown-time', 'options'), Output('dropdown-time', 'value')],
+        [Input('dropdown-model-type', 'value'), Input('dropdown-seeding-density', 'value')]
+    )
+    def update_times(model_type, seeding_density):
+        times = explorer.get_times(model_type, seeding_density)
+        return [times, times[-1] if times else None]
+
+    @app.callback(
+        [Output('scatter1', 'figure')],
+        [Input('dropdown-model-type', 'value'), Input('dropdown-seeding-density', 'value'), Input('dropdown-time', 'value')]
+    )
+    def update_plot(model_type, seeding_density, time):
+        return [explorer.get_figure(model_type, seeding_density, time=time)]
+
+    return app
@@ -0,0 +1,287 @@
+"""_summary_
+
+This Python script contains an event-driven, continuous-time engine (Gillespie's direct method), an alternative to the synchronous
+time steps of update_cell_states and implicit_immune_predation in which the probabilities of settings.py are taken as rates per unit time:
+    - each proliferative cancer cell grows into each of its adjacent NO sites at rate P_CC_GROW;
+      in model_4, it also moves into each of them at rate 1-P_CC_GROW
+    - each quiescent hepatocyte becomes apoptotic at rate P_HEP_DAMAGED per adjacent cancer cell
+    - each apoptotic hepatocyte gets cleared at rate P_HEP_CLEARED per adjacent cancer cell, or, in model_2, turns ECM deposited
+      at rate 1-P_HEP_CLEARED per adjacent cancer cell if peri-central
+    - in model_3, each cancer cell is killed at rate P_CC_KILLED * C/N, C being the number of cancer cells and N the number of sites,
+      as it is attacked with probability C/N per time step in implicit_immune_predation; P_CC_KILLED is the kill probability of
+      the lineage of the cancer cell if it has its own (see LineageTable)
+The rates of the events of every site are kept in a Fenwick tree, so that the next event is drawn in O(log N) and only the sites
+around it are updated; time jumps directly from one event to the next, so that periods with few events cost little. In model_3,
+the kill probabilities of the cancer cells are kept in a second Fenwick tree over the sites, from which the cancer cell killed is drawn.
+
+"""
+
+import numpy as np
+from classes_and_functions.cell_classes import CancerCell, Hepatocyte, copy_cell_dictionary
+from classes_and_functions.lattice_classes import ArrayLattice, NO_CELL_ID, NO_CELL_STATE, NO_ADJACENT_SITE_ID, ZONATION_TYPE_PERI_CENTRAL
+from classes_and_functions.vectorized_functions import add_cells, move_cells, set_cell_states, remove_cells, get_lineage_ids, get_kill_probabilities
+from classes_and_functions.random_functions import RandomNumberBuffer
+from classes_and_functions.profiling_functions import profiled
+
+from typing import Dict, List, Tuple
+
+class FenwickTree:
+    """_summary_
+
+    A binary indexed tree over N non-negative rates, to update a rate and to draw an index in proportion to its rate in O(log N).
+    """
+
+    def __init__(self, rates: np.ndarray):
+        self.n = rates.size
+        self.rates = np.asarray(rates, dtype=np.float64).tolist()
+        self.top = 1 << (self.n.bit_length() - 1) if self.n else 0 # the largest power of 2 not above n
+        self.rebuild()
+
+    def rebuild(self):
+        # the partial sums from scratch, to discard the rounding errors accumulated by set
+        cumulative_rates = np.concatenate([[0.], np.cumsum(self.rates)])
+        i = np.arange(1, self.n + 1)
+        self.tree = [0.] + (cumulative_rates[i] - cumulative_rates[i - (i & -i)]).tolist()
+        self.total = float(cumulative_rates[-1])
+
+    def set(self, index: int, rate: float):
+        delta = rate - self.rates[index]
+        if delta == 0:
+            return
+        self.rates[index] = rate
+        self.total += delta
+        i = index + 1
+        while i <= self.n:
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, u: float) -> int:
+        # the index i such that sum(rates[:i]) <= u < sum(rates[:i+1]), for 0 <= u < total
+        i, step = 0, self.top
+        while step:
+            j = i + step
+            if j <= self.n and self.tree[j] <= u:
+                i = j
+                u -= self.tree[j]
+            step >>= 1
+        return min(i, self.n - 1)
+
+class GillespieSimulation:
+    """_summary_
+
+    Simulates tumour growth and liver damage event by event in continuous time, with cell_dictionaries and lattice updated in place.
+    """
+
+    def __init__(
+        self,
+        cell_dictionaries: Dict[str, Dict],
+        lattice: ArrayLattice,
+        parameters: Dict[str, float],
+        CancerCell: CancerCell,
+        Hepatocyte: Hepatocyte,
+        model_type: str="model_1",
+        rng: np.random.Generator=None
+    ):
+        """_summary_
+
+        Args:
+            cell_dictionaries (Dict[str, Dict]): a Dict of Dict containing the CancerCell and Hepatocyte objects
+            lattice (ArrayLattice): the lattice following initialisation of CancerCell objects
+            parameters (Dict[str, float]): parameters to be used in the simulation (see settings.py), taken as rates per unit time
+            CancerCell (CancerCell): the CancerCell class used for creating new CancerCell objects
+            Hepatocyte (Hepatocyte): the Hepatocyte class used for creating new Hepatocyte objects
+            model_type (str, optional): model type to implement in the simulation. Defaults to "model_1".
+            rng (np.random.Generator, optional): the random number generator of the simulation (see random_functions.py). Defaults to None, i.e. the global np.random state.
+        """
+
+        self.cell_dictionaries = {
+            "CancerCell": copy_cell_dictionary(cell_dictionaries['CancerCell']),
+            "Hepatocyte": copy_cell_dictionary(cell_dictionaries['Hepatocyte'])
+        }
+        self.lattice = lattice
+        self.CancerCell, self.Hepatocyte = CancerCell, Hepatocyte
+        self.t = 0.
+
+        self.random_numbers = RandomNumberBuffer(rng)
+
+        # rates of the events of a site
+        self.rate_cc_grow = parameters['P_CC_GROW']
+        self.rate_cc_move = 1 - parameters['P_CC_GROW'] if model_type == "model_4" else 0.
+        self.rate_hep_damaged = parameters['P_HEP_DAMAGED']
+        self.rate_hep_cleared = parameters['P_HEP_CLEARED']
+        self.rate_hep_fibrotic = 1 - parameters['P_HEP_CLEARED'] if model_type == "model_2" else 0.
+        self.p_cc_killed = parameters['P_CC_KILLED'] if model_type == "model_3" else 0.
+        self.is_killing = model_type == "model_3"
+
+        self.adjacent_site_ids = [
+            [site_id for site_id in adjacent_site_ids if site_id != NO_ADJACENT_SITE_ID]
+            for adjacent_site_ids in lattice.adjacent_site_ids.tolist()
+        ]
+        self.is_peri_central = lattice.zonation_type == ZONATION_TYPE_PERI_CENTRAL
+
+        self.n_cancer_cells = int((lattice.site_type == 4).sum())
+
+        self.rates = FenwickTree(self.get_rates(np.arange(lattice.n_sites)))
+        self.kill_probabilities = None
+        self.update_kill_probabilities()
+        self.n_events_since_rebuild = 0
+
+    def get_rates(self, site_ids: np.ndarray) -> np.ndarray:
+        # the total rates of the events of the given sites
+        lattice = self.lattice
+        adjacent_site_ids = lattice.adjacent_site_ids[site_ids]
+        is_valid = adjacent_site_ids != NO_ADJACENT_SITE_ID
+        adjacent_site_types = lattice.site_type[adjacent_site_ids]
+        n_adjacent_empty_sites = ((adjacent_site_types == 3) & is_valid).sum(axis=1)
+        n_adjacent_cancer_cells = ((adjacent_site_types == 4) & is_valid).sum(axis=1)
+
+        site_types, cell_states = lattice.site_type[site_ids], lattice.cell_state[site_ids]
+        rate_apoptotic = self.rate_hep_cleared + self.rate_hep_fibrotic * self.is_peri_central[site_ids]
+        rates = np.where((site_types == 4) & (cell_states == 1), n_adjacent_empty_sites * (self.rate_cc_grow + self.rate_cc_move), 0.)
+        rates = np.where((site_types == 2) & (cell_states == 0), n_adjacent_cancer_cells * self.rate_hep_damaged, rates)
+        rates = np.where((site_types == 2) & (cell_states == 2), n_adjacent_cancer_cells * rate_apoptotic, rates)
+
+        return rates
+
+    def get_kill_probabilities(self, site_ids: np.ndarray) -> np.ndarray:
+        # the kill probabilities of the cancer cells on the given sites, of their lineages if they have their own, 0 for other sites
+        lattice = self.lattice
+        is_cancer_cell = lattice.site_type[site_ids] == 4
+        kill_probabilities = np.zeros(site_ids.size)
+        kill_probabilities[is_cancer_cell] = get_kill_probabilities(
+            self.cell_dictionaries['CancerCell'], lattice, site_ids[is_cancer_cell], self.p_cc_killed
+        )
+        return kill_probabilities
+
+    def update_kill_probabilities(self):
+        """_summary_
+
+        This function reads the kill probabilities of all cancer cells again, e.g. after lineages are founded between calls of run_until.
+        """
+
+        if self.is_killing:
+            self.kill_probabilities = FenwickTree(self.get_kill_probabilities(np.arange(self.lattice.n_sites)))
+
+    def get_kill_rate(self) -> float:
+        # each cancer cell is attacked at rate C/N, and killed with its kill probability
+        if not self.is_killing:
+            return 0.
+        return self.kill_probabilities.total * self.n_cancer_cells / self.lattice.n_sites
+
+    def set_site(self, site_id: int, site_type: int, cell_id: int, cell_state: int):
+        lattice = self.lattice
+        self.n_cancer_cells += int(site_type == 4) - int(lattice.site_type[site_id] == 4)
+        lattice.site_type[site_id] = site_type
+        lattice.cell_id[site_id] = cell_id
+        lattice.cell_state[site_id] = cell_state
+
+    def update_rates(self, site_ids: List[int]):
+        # the rates of the changed sites and their adjacent sites
+        affected_site_ids = np.unique(np.concatenate([site_ids, self.lattice.adjacent_site_ids[site_ids].ravel()]))
+        affected_site_ids = affected_site_ids[affected_site_ids != NO_ADJACENT_SITE_ID]
+        for site_id, rate in zip(affected_site_ids.tolist(), self.get_rates(affected_site_ids).tolist()):
+            self.rates.set(site_id, rate)
+        if self.is_killing:
+            site_ids = np.asarray(site_ids)
+            for site_id, kill_probability in zip(site_ids.tolist(), self.get_kill_probabilities(site_ids).tolist()):
+                self.kill_probabilities.set(site_id, kill_probability)
+        self.lattice.update_frontier(site_ids)
+
+    def fire_site_event(self, site_id: int) -> List[int]:
+        # an event of a site, drawn in proportion to the rates of its events; returns the sites changed
+        lattice = self.lattice
+        dict_of_cancer_cells, dict_of_hepatocytes = self.cell_dictionaries['CancerCell'], self.cell_dictionaries['Hepatocyte']
+
+        if lattice.site_type[site_id] == 4: # grow or move into an adjacent NO site, chosen uniformly
+            adjacent_empty_site_ids = [
+                adjacent_site_id for adjacent_site_id in self.adjacent_site_ids[site_id] if lattice.site_type[adjacent_site_id] == 3
+            ]
+            u = self.random_numbers.random() * len(adjacent_empty_site_ids)
+            target_site_id = adjacent_empty_site_ids[int(u)]
+            is_growing = (u - int(u)) * (self.rate_cc_grow + self.rate_cc_move) < self.rate_cc_grow
+
+            if is_growing:
+                new_cancer_cell_ids = lattice.cell_id_allocator.allocate_many(1)
+                self.set_site(target_site_id, 4, new_cancer_cell_ids[0], 1) # sitetype = cancer cell
+                add_cells(
+                    dict_of_cancer_cells, self.CancerCell, new_cancer_cell_ids, np.array([target_site_id]), 1, lattice, # proliferative
+                    lineage_ids=get_lineage_ids(dict_of_cancer_cells, lattice.cell_id[[site_id]]) # of the parent
+                )
+                return [target_site_id]
+
+            cancer_cell_id = lattice.cell_id[site_id]
+            self.set_site(site_id, 3, NO_CELL_ID, NO_CELL_STATE) # sitetype = not occupied
+            self.set_site(target_site_id, 4, cancer_cell_id, 1) # sitetype = cancer cell
+            move_cells(dict_of_cancer_cells, np.array([cancer_cell_id]), np.array([target_site_id]), lattice)
+            return [site_id, target_site_id]
+
+        hep_id = lattice.cell_id[site_id]
+        if lattice.cell_state[site_id] == 0: # turn into apoptotic state
+            lattice.cell_state[site_id] = 2
+            set_cell_states(dict_of_hepatocytes, np.array([hep_id]), 2)
+            return [site_id]
+
+        # apoptotic hepatocytes get cleared, or turn ECM deposited
+        rate_apoptotic = self.rate_hep_cleared + self.rate_hep_fibrotic * bool(self.is_peri_central[site_id])
+        is_cleared = self.random_numbers.random() * rate_apoptotic < self.rate_hep_cleared
+        self.set_site(site_id, 3 if is_cleared else 5, NO_CELL_ID, NO_CELL_STATE) # change to Not Occupied or ECM
+        remove_cells(dict_of_hepatocytes, np.array([hep_id]))
+        return [site_id]
+
+    def fire_kill_event(self, site_id: int) -> List[int]:
+        # the cancer cell of the site is killed
+        remove_cells(self.cell_dictionaries['CancerCell'], np.array([self.lattice.cell_id[site_id]]))
+        self.set_site(site_id, 3, NO_CELL_ID, NO_CELL_STATE) # change to Not Occupied
+        return [site_id]
+
+    @profiled("run_until")
+    def run_until(self, t_end: float) -> Tuple[Dict, ArrayLattice]:
+        """_summary_
+
+        This function fires events until time t_end.
+
+        Args:
+            t_end (float): the time to simulate until
+
+        Returns:
+            Tuple[Dict, ArrayLattice]: an updated Dict of Dict containing the CancerCell and Hepatocyte objects, and the updated lattice, at time t_end
+        """
+
+        while True:
+            kill_rate = self.get_kill_rate()
+            total_rate = self.rates.total + kill_rate
+            if total_rate <= 1e-12:
+                break
+
+            # the time to the next event; an event beyond t_end is discarded, as event times are memoryless
+            dt = -np.log1p(-self.random_numbers.random()) / total_rate
+            if self.t + dt > t_end:
+                break
+
+            u = self.random_numbers.random() * total_rate
+            if u < kill_rate: # the cancer cell killed, drawn in proportion to its kill probability
+                site_id = self.kill_probabilities.find(u / kill_rate * self.kill_probabilities.total)
+                if self.kill_probabilities.rates[site_id] <= 0: # rounding errors of the partial sums
+                    self.kill_probabilities.rebuild()
+                    continue
+                changed_site_ids = self.fire_kill_event(site_id)
+            else:
+                site_id = self.rates.find(u - kill_rate)
+                if self.rates.rates[site_id] <= 0: # rounding errors of the partial sums
+                    self.rates.rebuild()
+                    continue
+                changed_site_ids = self.fire_site_event(site_id)
+            self.t += dt
+            self.update_rates(changed_site_ids)
+
+            # the partial sums are recomputed every N events, at an amortised O(1) cost per event
+            self.n_events_since_rebuild += 1
+            if self.n_events_since_rebuild >= self.lattice.n_sites:
+                self.rates.rebuild()
+                if self.is_killing:
+                    self.kill_probabilities.rebuild()
+                self.n_events_since_rebuild = 0
+
+        self.t = t_end
+
+        return self.cell_dictionaries, self.lattice
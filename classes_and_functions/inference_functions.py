@@ -0,0 +1,399 @@
+"""_summary_
+
+This Python script contains a parameter-inference mode, fitting the parameters of get_simulation_parameters (P_CC_GROW, P_HEP_DAMAGED, P_HEP_CLEARED,
+P_CC_KILLED) to observed tumour sizes, as in files/combined_results_tumour_sizes.csv, by approximate Bayesian computation with sequential Monte Carlo
+(ABC-SMC, Beaumont et al. 2009):
+    - every run is summarised at the observed times by statistics of its tumour sizes (get_summary_statistics), and compared with the observed tumours
+      by the Euclidean distance of the summary statistics over all times, scaled by their spread in the first population (get_distance)
+    - the first population of particles is drawn from the prior (uniform within bounds); every next population is drawn from the previous one,
+      perturbed by a Gaussian kernel, and a particle is accepted if its distance is within a tolerance, the quantile of the distances of the
+      previous population
+    - proposals are simulated in batches over a pool of processes sharing the base lattice (as in sweep_functions.py); since the distance up to a time
+      is a lower bound of the distance over all times, a run stops as soon as its distance so far exceeds the tolerance
+    - the summary statistics of runs are kept in a cache (RunCache, optionally appended to a CSV file) keyed by the settings, parameters and seed of
+      each run, so that a fit repeated with the same seed, or proposals repeated within a fit, reuse runs instead of simulating them again
+
+Run from the root of the repository, e.g.:
+    python -m classes_and_functions.inference_functions --observed observed_tumour_sizes.csv --model-type model_3 --seeding-density 1 --T 40 \
+        --parameters P_CC_GROW P_HEP_DAMAGED P_HEP_CLEARED P_CC_KILLED --n-particles 200 --n-generations 6 --n-workers 8 \
+        --cache abc_run_cache.csv --output abc_particles.csv
+
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from classes_and_functions import sweep_functions
+from classes_and_functions.lattice_classes import ArrayLattice
+from classes_and_functions.lattice_io_functions import save_lattice
+from classes_and_functions.settings import get_simulation_parameters
+from classes_and_functions.sweep_functions import run_simulation, attach_lattice, copy_lattice_for_run, read_lattice
+
+from typing import Dict, List, Tuple
+
+SUMMARY_STATISTIC_NAMES = ["n_tumours", "mean_log_size", "std_log_size", "median_log_size", "q90_log_size"]
+
+def get_summary_statistics(sizes: np.ndarray, n_runs: int=1) -> np.ndarray:
+    # statistics of the sizes of the tumours of n_runs runs at one time, in order of SUMMARY_STATISTIC_NAMES (all 0 without tumours)
+    log_sizes = np.log(np.asarray(sizes, dtype=np.float64))
+    if log_sizes.size == 0:
+        return np.zeros(len(SUMMARY_STATISTIC_NAMES))
+    return np.array([log_sizes.size / n_runs, log_sizes.mean(), log_sizes.std(), np.median(log_sizes), np.quantile(log_sizes, 0.9)])
+
+def get_observed_summary_statistics(observed_tumour_sizes: pd.DataFrame) -> Dict[int, np.ndarray]:
+    """_summary_
+
+    This function summarises observed tumour sizes at every observed time.
+
+    Args:
+        observed_tumour_sizes (pd.DataFrame): a DataFrame containing size and time of the observed tumours, and pid if they are pooled from
+            several runs (e.g. replicates or patients), in which case n_tumours is the mean number of tumours per run
+
+    Returns:
+        Dict[int, np.ndarray]: the summary statistics (see get_summary_statistics) of every observed time
+    """
+
+    n_runs = observed_tumour_sizes["pid"].nunique() if "pid" in observed_tumour_sizes else 1
+    return {
+        int(t): get_summary_statistics(tumour_t_sizes["size"].to_numpy(), n_runs)
+        for t, tumour_t_sizes in observed_tumour_sizes.groupby("time")
+    }
+
+def get_summary_scales(summaries: List[Dict[int, np.ndarray]]) -> Dict[int, np.ndarray]:
+    # the median absolute deviations of the summary statistics of complete runs at every time, 1 where they do not vary
+    scales = {}
+    for t in summaries[0]:
+        summaries_t = np.array([summaries_of_run[t] for summaries_of_run in summaries])
+        scales[t] = np.median(np.abs(summaries_t - np.median(summaries_t, axis=0)), axis=0)
+        scales[t][scales[t] == 0] = 1
+    return scales
+
+def get_distance(summaries: Dict[int, np.ndarray], observed_summaries: Dict[int, np.ndarray], scales: Dict[int, np.ndarray]) -> float:
+    # the scaled Euclidean distance of the summary statistics of a run over the times it reached, a lower bound of its distance over all times
+    return float(np.sqrt(sum((((summaries[t] - observed_summaries[t]) / scales[t]) ** 2).sum() for t in summaries)))
+
+def get_run_key(model_type: str, cancer_cell_seeding_density: float, engine: str, parameters: Dict[str, float], seed: int) -> Tuple:
+    # the settings, parameters and seed that determine a run, the parameters as a JSON string of their sorted items
+    parameters = json.dumps(sorted((name, float(value)) for name, value in parameters.items()))
+    return (model_type, float(cancer_cell_seeding_density), engine, parameters, int(seed))
+
+class RunCache:
+    """_summary_
+
+    The summary statistics of runs at the times they reached (all snapshot times, or up to the time a run was stopped early), keyed by get_run_key.
+    With a path, runs are appended to a CSV file as they are added, and the runs of the file are read when the cache is created,
+    so that the runs of previous fits are reused.
+    """
+
+    KEY_COLUMNS = ["model_type", "cancer_cell_seeding_density", "engine", "parameters", "seed"]
+
+    def __init__(self, path: str=None):
+        self.path = path
+        self.summaries = {} # run key -> time -> summary statistics
+        if path is not None and os.path.exists(path) and os.path.getsize(path) > 0:
+            table = pd.read_csv(path, float_precision="round_trip")
+            for row in zip(*[table[name] for name in self.KEY_COLUMNS + ["time"]], table[SUMMARY_STATISTIC_NAMES].to_numpy()):
+                *key, t, summaries_t = row
+                key = (str(key[0]), float(key[1]), str(key[2]), str(key[3]), int(key[4]))
+                self.summaries.setdefault(key, {})[int(t)] = summaries_t
+
+    def __len__(self) -> int:
+        return len(self.summaries)
+
+    def get(self, key: Tuple) -> Dict[int, np.ndarray]:
+        return self.summaries.get(key, {})
+
+    def add(self, key: Tuple, summaries: Dict[int, np.ndarray]):
+        # the summary statistics of a run at the times not yet cached
+        cached_summaries = self.summaries.setdefault(key, {})
+        new_times = [t for t in sorted(summaries) if t not in cached_summaries]
+        cached_summaries.update({t: summaries[t] for t in new_times})
+
+        if self.path is None or not new_times:
+            return
+        table = pd.DataFrame([summaries[t] for t in new_times], columns=SUMMARY_STATISTIC_NAMES)
+        for name, value in reversed(list(zip(self.KEY_COLUMNS, key))):
+            table.insert(0, name, value)
+        table.insert(len(self.KEY_COLUMNS), "time", new_times)
+        is_new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        table.to_csv(self.path, mode='a', header=is_new, index=False)
+
+def run_inference_task(
+    model_type: str,
+    cancer_cell_seeding_density: float,
+    T: int,
+    parameters: Dict[str, float],
+    seed: int,
+    times: List[int],
+    engine: str,
+    observed_summaries: Dict[int, np.ndarray],
+    scales: Dict[int, np.ndarray]=None,
+    epsilon: float=np.inf
+) -> Dict[int, np.ndarray]:
+    # one run of a proposal in a worker process, on a copy of the worker's base lattice, summarised at the observed times;
+    # with scales, the run stops at the first time its distance so far exceeds epsilon
+
+    summaries = {}
+    def stop(t: int, tumour_t_sizes: pd.DataFrame) -> bool:
+        summaries[t] = get_summary_statistics(tumour_t_sizes["size"].to_numpy())
+        return scales is not None and get_distance(summaries, observed_summaries, scales) > epsilon
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_simulation(
+            lattice=copy_lattice_for_run(sweep_functions.WORKER_LATTICE),
+            model_type=model_type,
+            cancer_cell_seeding_density=cancer_cell_seeding_density,
+            T=T,
+            parameters=parameters,
+            snapshot_times=times,
+            engine=engine,
+            rng=np.random.default_rng(seed),
+            stop=stop
+        )
+
+    return summaries
+
+def get_kernel_covariance(thetas: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    # twice the weighted covariance of a population (Beaumont et al. 2009), with a small diagonal for populations that do not vary
+    covariance = 2 * np.atleast_2d(np.cov(thetas, rowvar=False, aweights=weights))
+    return covariance + 1e-12 * np.eye(thetas.shape[1])
+
+def get_kernel_densities(thetas: np.ndarray, previous_thetas: np.ndarray, covariance: np.ndarray) -> np.ndarray:
+    # the densities of the Gaussian kernel of every previous particle at every particle, up to a constant, of shape (n, n_previous)
+    differences = (thetas[:, None, :] - previous_thetas[None, :, :]) @ np.linalg.inv(np.linalg.cholesky(covariance)).T
+    return np.exp(-0.5 * (differences ** 2).sum(axis=2))
+
+def run_abc_smc(
+    lattice: ArrayLattice,
+    observed_tumour_sizes: pd.DataFrame,
+    model_type: str,
+    cancer_cell_seeding_density: float,
+    T: int,
+    parameter_names: List[str]=None,
+    bounds: Dict[str, Tuple[float, float]]=None,
+    n_particles: int=100,
+    n_generations: int=5,
+    quantile: float=0.5,
+    min_acceptance_rate: float=0.01,
+    batch_size: int=None,
+    n_workers: int=None,
+    engine: str="numba",
+    cache: RunCache=None,
+    early_stopping: bool=True,
+    seed: int=None
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """_summary_
+
+    This function fits parameters of a model to observed tumour sizes by ABC-SMC, simulating batches of proposals over a pool of processes sharing the
+    base lattice, stopping runs early once their distance exceeds the tolerance, and reusing the runs of a cache.
+
+    Args:
+        lattice (ArrayLattice): the lattice without cancer cells, not updated
+        observed_tumour_sizes (pd.DataFrame): a DataFrame containing size and time of the observed tumours, and pid if pooled from several runs,
+            e.g. the rows of one model_condition of files/combined_results_tumour_sizes.csv
+        model_type (str): model type to implement in the simulation
+        cancer_cell_seeding_density (float): the number of cancer cells initialised per CV
+        T (int): the number of time steps, at least the last observed time
+        parameter_names (List[str], optional): the parameters to infer, others taking the values of get_simulation_parameters.
+            Defaults to None, i.e. all parameters of the model type.
+        bounds (Dict[str, Tuple[float, float]], optional): the bounds of the uniform prior of each parameter. Defaults to None, i.e. (0, 1),
+            as all parameters are probabilities.
+        n_particles (int, optional): the number of particles of a population. Defaults to 100.
+        n_generations (int, optional): the number of populations. Defaults to 5.
+        quantile (float, optional): the quantile of the distances of a population giving the tolerance of the next one. Defaults to 0.5.
+        min_acceptance_rate (float, optional): the acceptance rate below which the fit stops, at the last complete population. Defaults to 0.01.
+        batch_size (int, optional): the number of proposals simulated together. Defaults to None, i.e. n_particles.
+        n_workers (int, optional): the number of processes. Defaults to None, i.e. the number of CPUs.
+        engine (str, optional): "loop", "vectorized", "numba" or "gillespie", see run_simulation. Defaults to "numba", which follows the rules of the loop engine cell by cell.
+        cache (RunCache, optional): the cache of runs, updated with the runs simulated. Defaults to None, i.e. a new cache for this fit.
+        early_stopping (bool, optional): whether runs stop once their distance exceeds the tolerance. Defaults to True.
+        seed (int, optional): the seed of the proposals, from which every proposal draws the seed of its run. Defaults to None, i.e. fresh entropy.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: a DataFrame containing generation, particle, the inferred parameters, weight, distance, epsilon and seed
+            (of the run) of the particles of every population, and a DataFrame containing generation, epsilon, n_proposals, n_out_of_bounds,
+            n_simulated, n_cached, n_stopped_early, acceptance_rate and time_s of every population
+    """
+
+    observed_summaries = get_observed_summary_statistics(observed_tumour_sizes)
+    times = sorted(observed_summaries)
+    if not times or times[-1] > T or times[0] < 0:
+        raise ValueError(f"the observed times should be within [0, T={T}], got {times}")
+
+    base_parameters = get_simulation_parameters(model_type)
+    parameter_names = list(base_parameters) if parameter_names is None else list(parameter_names)
+    for name in parameter_names:
+        if name not in base_parameters:
+            raise ValueError(f"{name} is not a parameter of {model_type}")
+    bounds = {name: (0., 1.) for name in parameter_names} if bounds is None else bounds
+    low, high = np.array([bounds[name][0] for name in parameter_names]), np.array([bounds[name][1] for name in parameter_names])
+
+    rng = np.random.default_rng(seed)
+    cache = RunCache() if cache is None else cache
+    batch_size = n_particles if batch_size is None else batch_size
+
+    def get_run_parameters(theta: np.ndarray) -> Dict[str, float]:
+        return dict(base_parameters, **dict(zip(parameter_names, theta.tolist())))
+
+    particles, generations = [], []
+    scales, population = None, None # the thetas, weights and distances of the last population
+    with tempfile.TemporaryDirectory() as directory:
+        save_lattice(lattice, directory)
+
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=attach_lattice, initargs=(directory,)) as executor:
+            for generation in range(n_generations):
+                start = time.perf_counter()
+                epsilon = np.inf if population is None else float(np.quantile(population["distances"], quantile))
+                if population is not None:
+                    covariance = get_kernel_covariance(population["thetas"], population["weights"])
+                counts = dict.fromkeys(["n_proposals", "n_out_of_bounds", "n_simulated", "n_cached", "n_stopped_early"], 0)
+                accepted = [] # (theta, seed, distance, summaries)
+
+                while len(accepted) < n_particles:
+                    # proposals from the prior, or from the last population perturbed by the kernel, resampled until within the bounds
+                    proposals = []
+                    while len(proposals) < batch_size:
+                        if population is None:
+                            theta = rng.uniform(low, high)
+                        else:
+                            i = rng.choice(population["weights"].size, p=population["weights"])
+                            theta = rng.multivariate_normal(population["thetas"][i], covariance)
+                            if np.any(theta < low) or np.any(theta > high):
+                                counts["n_out_of_bounds"] += 1
+                                continue
+                        proposals.append((theta, int(rng.integers(2**63 - 1))))
+
+                    # cached runs that reached all times, or whose distance so far already exceeds the tolerance, are not simulated again
+                    futures = {}
+                    summaries_of_proposals = []
+                    for i, (theta, run_seed) in enumerate(proposals):
+                        key = get_run_key(model_type, cancer_cell_seeding_density, engine, get_run_parameters(theta), run_seed)
+                        summaries = cache.get(key)
+                        if len(summaries) == len(times) or (scales is not None and get_distance(summaries, observed_summaries, scales) > epsilon):
+                            counts["n_cached"] += 1
+                        else:
+                            futures[i] = (key, executor.submit(
+                                run_inference_task, model_type, cancer_cell_seeding_density, T, get_run_parameters(theta), run_seed, times, engine,
+                                observed_summaries, scales if early_stopping else None, epsilon
+                            ))
+                        summaries_of_proposals.append(summaries)
+                    for i, (key, future) in futures.items():
+                        summaries_of_proposals[i] = future.result()
+                        cache.add(key, summaries_of_proposals[i])
+                        counts["n_simulated"] += 1
+                        counts["n_stopped_early"] += len(summaries_of_proposals[i]) < len(times)
+
+                    # accepted in order of proposal, so that the fit does not depend on the order in which runs finish
+                    for (theta, run_seed), summaries in zip(proposals, summaries_of_proposals):
+                        counts["n_proposals"] += 1
+                        if len(summaries) < len(times):
+                            continue
+                        distance = np.nan if scales is None else get_distance(summaries, observed_summaries, scales)
+                        if scales is None or distance <= epsilon:
+                            accepted.append((theta, run_seed, distance, summaries))
+                        if len(accepted) == n_particles:
+                            break
+
+                    acceptance_rate = len(accepted) / counts["n_proposals"]
+                    if counts["n_proposals"] >= n_particles and acceptance_rate < min_acceptance_rate:
+                        break
+
+                print(
+                    f"> generation {generation}: epsilon {epsilon:.3g}, {len(accepted)}/{counts['n_proposals']} accepted, "
+                    f"{counts['n_simulated']} simulated ({counts['n_stopped_early']} stopped early), {counts['n_cached']} cached"
+                )
+                if len(accepted) < n_particles:
+                    print(f"> acceptance rate {acceptance_rate:.3g} below {min_acceptance_rate}, the fit stops at generation {generation - 1}")
+                    break
+
+                thetas = np.array([theta for theta, _, _, _ in accepted])
+                if scales is None:
+                    # the summary statistics are scaled by their spread in the first population, drawn from the prior
+                    scales = get_summary_scales([summaries for _, _, _, summaries in accepted])
+                    distances = np.array([get_distance(summaries, observed_summaries, scales) for _, _, _, summaries in accepted])
+                    weights = np.full(n_particles, 1 / n_particles)
+                else:
+                    distances = np.array([distance for _, _, distance, _ in accepted])
+                    weights = 1 / (get_kernel_densities(thetas, population["thetas"], covariance) @ population["weights"])
+                    weights /= weights.sum()
+                population = {"thetas": thetas, "weights": weights, "distances": distances}
+
+                particles_of_generation = pd.DataFrame(thetas, columns=parameter_names)
+                particles_of_generation.insert(0, "generation", generation)
+                particles_of_generation.insert(1, "particle", np.arange(n_particles))
+                particles_of_generation["weight"] = weights
+                particles_of_generation["distance"] = distances
+                particles_of_generation["epsilon"] = epsilon
+                particles_of_generation["seed"] = [run_seed for _, run_seed, _, _ in accepted]
+                particles.append(particles_of_generation)
+                generations.append(dict(
+                    generation=generation, epsilon=epsilon, **counts, acceptance_rate=acceptance_rate, time_s=time.perf_counter() - start
+                ))
+
+    particles = pd.concat(particles, ignore_index=True) if particles else pd.DataFrame()
+    return particles, pd.DataFrame(generations)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Fit parameters of a model to observed tumour sizes by ABC-SMC")
+    parser.add_argument("--lattice", default="./files/lattice_with_CVs_PTs_2025-06-23_annotated_without_tumour.csv",
+                        help="path to a lattice directory (see lattice_io_functions.py) or CSV file without tumour")
+    parser.add_argument("--lattice-settings", default=None, help="path to lattice settings, to generate the lattice instead of reading --lattice")
+    parser.add_argument("--lattice-size", type=int, default=None, help="lattice size of the generated lattice")
+    parser.add_argument("--observed", required=True, help="path to a CSV file of observed tumour sizes, with columns size and time (and pid)")
+    parser.add_argument("--observed-model-condition", default=None, help="the model_condition of the observed tumour sizes to fit, if they have several")
+    parser.add_argument("--model-type", default="model_1")
+    parser.add_argument("--seeding-density", type=float, default=1)
+    parser.add_argument("--T", type=int, default=40)
+    parser.add_argument("--parameters", nargs="+", default=None, help="the parameters to infer, all parameters of the model type by default")
+    parser.add_argument("--bounds", action="append", default=[], metavar="NAME=LOW,HIGH", help="the bounds of the prior of a parameter, (0, 1) by default")
+    parser.add_argument("--n-particles", type=int, default=100)
+    parser.add_argument("--n-generations", type=int, default=5)
+    parser.add_argument("--quantile", type=float, default=0.5)
+    parser.add_argument("--min-acceptance-rate", type=float, default=0.01)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--n-workers", type=int, default=None)
+    parser.add_argument("--engine", default="numba", help="loop, vectorized, numba or gillespie")
+    parser.add_argument("--cache", default=None, help="path to a CSV file of the runs of previous fits, appended to with the runs of this fit")
+    parser.add_argument("--no-early-stopping", action="store_true", help="run every proposal for T time steps")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default="abc_particles.csv", help="path to a CSV file to save the particles of every population to")
+    args = parser.parse_args()
+
+    observed_tumour_sizes = pd.read_csv(args.observed)
+    if args.observed_model_condition is not None:
+        observed_tumour_sizes = observed_tumour_sizes[observed_tumour_sizes["model_condition"] == args.observed_model_condition]
+
+    bounds = None
+    if args.bounds:
+        bounds = {name: (0., 1.) for name in (args.parameters or get_simulation_parameters(args.model_type))}
+        for bound in args.bounds:
+            name, values = bound.split("=")
+            bounds[name] = tuple(float(value) for value in values.split(","))
+
+    lattice = read_lattice(
+        path_to_lattice=None if args.lattice_settings is not None else args.lattice,
+        path_to_lattice_settings=args.lattice_settings,
+        lattice_size=args.lattice_size
+    )
+    cache = RunCache(args.cache)
+    print(f"> fitting {args.model_type} on a lattice of {lattice.n_sites} sites, {len(cache)} runs in the cache")
+
+    particles, generations = run_abc_smc(
+        lattice, observed_tumour_sizes, args.model_type, args.seeding_density, args.T, parameter_names=args.parameters, bounds=bounds,
+        n_particles=args.n_particles, n_generations=args.n_generations, quantile=args.quantile, min_acceptance_rate=args.min_acceptance_rate,
+        batch_size=args.batch_size, n_workers=args.n_workers, engine=args.engine, cache=cache, early_stopping=not args.no_early_stopping,
+        seed=args.seed
+    )
+    print(generations.to_string(index=False))
+    particles.to_csv(args.output, index=False)
+    print(f"> particles saved to {args.output}")
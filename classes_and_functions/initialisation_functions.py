@@ -1,156 +1,262 @@
 """_summary_
 
-This Python script contains function to initialise CancerCell objects nad update lattice accordingly
+This Python script contains functions to initialise the lattice (adjacent sites, zonation types) and CancerCell objects, and update lattice accordingly
 
 """
 
-from classes_and_functions.cell_classes import CancerCell, Hepatocyte
+from classes_and_functions.cell_classes import CancerCell, Hepatocyte, CellStore, CellDictionary, LineageTable
+from classes_and_functions.random_functions import get_rng
+from classes_and_functions.lattice_classes import ArrayLattice, N_ADJACENT_SITES, NO_ADJACENT_SITE_ID, \
+    ZONATION_TYPE_NA, ZONATION_TYPE_PERI_CENTRAL, ZONATION_TYPE_OTHER, PERI_CENTRAL_DISTANCE
+from classes_and_functions.lattice_io_functions import load_lattice
 import numpy as np
 import pandas as pd
+from scipy.spatial import cKDTree
 
-from typing import Dict, Tuple
+from typing import Dict, Tuple, Union
 
-#### This function without docstrings is NOT used for the tutorial ####
-def init_lattice_in_simulation(lattice: pd.DataFrame, lattice_settings: Dict) -> pd.DataFrame:
-    lattice_in_simulation = lattice[
-        ["site_id", "x", "y", "site_type"]
-    ].copy()
+# offsets to the 6 adjacent sites, anticlockwise from the x axis, in axial coordinates (q, r) of the hexagonal lattice
+AXIAL_OFFSETS = np.array([(1, 0), (0, 1), (-1, 1), (-1, 0), (0, -1), (1, -1)])
 
-    lattice_in_simulation["cell_id"] = lattice_in_simulation["site_id"].copy()
+def get_axial_coordinates(x: np.ndarray, y: np.ndarray, spacing: float) -> Tuple[np.ndarray, np.ndarray]:
+    """_summary_
+    
+    This function computes integer axial coordinates of lattice sites, relative to the first site, 
+    with x = x_0 + spacing * (q + r/2) and y = y_0 + spacing * r * sqrt(3)/2.
+
+    Args:
+        x (np.ndarray): x coordinates of the N lattice sites
+        y (np.ndarray): y coordinates of the N lattice sites
+        spacing (float): the distance between adjacent lattice sites
 
-    lattice_in_simulation["cell_id"] = lattice_in_simulation["cell_id"].astype(np.uint32)
-    lattice_in_simulation["site_id"] = lattice_in_simulation["site_id"].astype(np.uint16)
-    lattice_in_simulation["site_type"] = lattice_in_simulation["site_type"].astype(np.uint8)
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: the axial coordinates q, r of the N lattice sites, or (None, None) if some sites are off the hexagonal grid
+    """
     
-    # get adjacent site ids for all lattice sites - it feels that this procedure can be optimised
-    def get_adjacent_site_xys(xy_array: np.ndarray, spacing: float) -> np.ndarray:
+    dx, dy = x - x[0], y - y[0]
+    r = np.rint(dy / (spacing * np.sqrt(3)/2)).astype(np.int64)
+    q = np.rint(dx / spacing - r/2).astype(np.int64)
+    
+    # same tolerance as for finding adjacent sites
+    errors = np.hypot(dx - spacing * (q + r/2), dy - spacing * r * np.sqrt(3)/2)
+    if errors.size and errors.max() >= 0.1*spacing:
+        return None, None
+    
+    return q, r
 
-        radians = np.linspace(0, 2*np.pi *5/6, 6)
-        adjacent_xy_arrays = np.array([
-                (xy_array[0] + spacing * np.cos(radian), xy_array[1] + spacing * np.sin(radian))
-                for radian in radians
-        ])
+def get_adjacent_site_ids(
+    x: np.ndarray, y: np.ndarray, site_type: np.ndarray, spacing: float, chunk_size: int=2**18
+) -> np.ndarray:
+    """_summary_
+    
+    This function finds the adjacent sites of all hepatocyte sites, among CV, PT and hepatocyte sites.
+    Sites on a hexagonal grid are matched by their integer axial coordinates; 
+    otherwise a KD-tree is queried at the 6 hexagonal offsets of each site.
 
-        return adjacent_xy_arrays
+    Args:
+        x (np.ndarray): x coordinates of the N lattice sites, indexed by site_id
+        y (np.ndarray): y coordinates of the N lattice sites, indexed by site_id
+        site_type (np.ndarray): site types of the N lattice sites, indexed by site_id
+        spacing (float): the distance between adjacent lattice sites
+        chunk_size (int, optional): the number of hepatocyte sites queried at once, to bound memory use. Defaults to 2**18.
 
-    def get_adjacent_site_ids(adjacent_xy_arrays, lattice, threshold):
+    Returns:
+        np.ndarray: an (N, 6) array of adjacent site ids, in anticlockwise order, left-aligned and padded with NO_ADJACENT_SITE_ID
+    """
+    
+    adjacent_site_ids = np.full((x.size, N_ADJACENT_SITES), NO_ADJACENT_SITE_ID, dtype=np.int32)
+    
+    candidate_site_ids = np.flatnonzero(np.isin(site_type, [0, 1, 2]))
+    hep_site_ids = np.flatnonzero(site_type == 2)
+    if candidate_site_ids.size == 0 or hep_site_ids.size == 0:
+        return adjacent_site_ids
+    
+    q, r = get_axial_coordinates(x=x, y=y, spacing=spacing)
+    
+    if q is not None:
+        # ... look up the axial coordinates of adjacent sites in the sorted keys of candidate sites
+        q, r = q - q.min() + 1, r - r.min() + 1
+        n_rows = r.max() + 2
+        candidate_keys = q[candidate_site_ids] * n_rows + r[candidate_site_ids]
+        order = np.argsort(candidate_keys, kind='stable')
+        sorted_candidate_keys, sorted_candidate_site_ids = candidate_keys[order], candidate_site_ids[order]
         
-        adjacent_site_ids = []
-        for xy_array in adjacent_xy_arrays:
-            
-            lattice_xy_arrays = lattice[['x','y']].values
-            lattice_site_ids  = lattice.site_id.values
-            distances = np.linalg.norm(lattice_xy_arrays-xy_array, axis=1)
-            which_ones = np.where(distances<0.1*lattice_settings['spacing'])[0]
-            if which_ones:
-                adjacent_site_ids.append(str(lattice_site_ids[which_ones[0]]))
-            
-        if len(adjacent_site_ids):
-            adjacent_site_ids_str = ','.join(adjacent_site_ids)
-        else:
-            adjacent_site_ids_str = ""
+        found_adjacent_site_ids = np.full((hep_site_ids.size, N_ADJACENT_SITES), NO_ADJACENT_SITE_ID, dtype=np.int64)
+        for i, (dq, dr) in enumerate(AXIAL_OFFSETS):
+            adjacent_keys = (q[hep_site_ids] + dq) * n_rows + (r[hep_site_ids] + dr)
+            positions = np.minimum(np.searchsorted(sorted_candidate_keys, adjacent_keys), sorted_candidate_keys.size-1)
+            is_found = sorted_candidate_keys[positions] == adjacent_keys
+            found_adjacent_site_ids[is_found, i] = sorted_candidate_site_ids[positions[is_found]]
+    
+    else:
+        # ... query a KD-tree of candidate sites, in chunks of hepatocyte sites
+        xy = np.column_stack([x, y])
+        tree = cKDTree(xy[candidate_site_ids])
         
-        return adjacent_site_ids_str
-
-    def annotate_lattice_with_adjacent_sites(lattice):
+        radians = np.linspace(0, 2*np.pi *5/6, N_ADJACENT_SITES)
+        offsets = spacing * np.column_stack([np.cos(radians), np.sin(radians)])
         
-        list_of_adjacent_site_ids_strs = []
-        for site_id, x, y, site_type in lattice[['site_id', 'x', 'y', 'site_type']].values:
-            
-            if site_id % 10000 == 0 or site_id == lattice.shape[0]-1:
-                print(f"> {site_id/lattice.shape[0]:.2%} processed...")
+        found_adjacent_site_ids = np.empty((hep_site_ids.size, N_ADJACENT_SITES), dtype=np.int64)
+        for chunk_start in range(0, hep_site_ids.size, chunk_size):
+            chunk_site_ids = hep_site_ids[chunk_start:chunk_start+chunk_size]
+            adjacent_xys = (xy[chunk_site_ids, None, :] + offsets[None, :, :]).reshape(-1, 2)
             
-            if site_type==2:
-                adjacent_xy_arrays = get_adjacent_site_xys(
-                    xy_array=np.array((x,y)), spacing=lattice_settings['spacing']
-                )
-                adjacent_site_ids_str = get_adjacent_site_ids(
-                    adjacent_xy_arrays=adjacent_xy_arrays,
-                    lattice=lattice.loc[lattice.site_type.isin([0,1,2])],
-                    threshold=0.1*lattice_settings['spacing']
-                )
-                list_of_adjacent_site_ids_strs.append(adjacent_site_ids_str)
-                
-            else:
-                list_of_adjacent_site_ids_strs.append('n/a')
-                
-        lattice["adjacent_site_ids_str"] = list_of_adjacent_site_ids_strs
-        
-        return lattice
+            distances, indices = tree.query(adjacent_xys, distance_upper_bound=0.1*spacing, workers=-1)
+            found_adjacent_site_ids[chunk_start:chunk_start+chunk_size] = np.where(
+                np.isfinite(distances), candidate_site_ids[np.minimum(indices, candidate_site_ids.size-1)], NO_ADJACENT_SITE_ID
+            ).reshape(-1, N_ADJACENT_SITES)
+    
+    # left-align the adjacent site ids found, keeping their anticlockwise order
+    order = np.argsort(found_adjacent_site_ids == NO_ADJACENT_SITE_ID, axis=1, kind='stable')
+    adjacent_site_ids[hep_site_ids] = np.take_along_axis(found_adjacent_site_ids, order, axis=1)
+    
+    return adjacent_site_ids
 
-    def annotate_lattice_with_zonation(lattice):
-        
-        cv_xy_arrays = lattice.loc[lattice.site_type==0, ['x', 'y']].values
-        list_of_zonation_types = []
-        
-        for site_id, x, y, site_type in lattice[['site_id', 'x', 'y', 'site_type']].values:
-            
-            if site_type==2:
-                xy_array=np.array((x,y))
-                distances = np.linalg.norm(cv_xy_arrays-xy_array, axis=1)
-                if distances.min() <= 5**lattice_settings['spacing']:
-                    zonation_type = "peri-central"
-                else:
-                    zonation_type = "other"
-            else:
-                zonation_type = "n/a"
-                
-            list_of_zonation_types.append(zonation_type)
-            
-        lattice["zonation_type"] = list_of_zonation_types
-        
-        return lattice
+def get_zonation_types(
+    x: np.ndarray, y: np.ndarray, site_type: np.ndarray, spacing: float
+) -> np.ndarray:
+    """_summary_
+    
+    This function annotates hepatocyte sites within 5 spacings of their nearest central vein as peri-central, 
+    with one nearest-neighbour query on a KD-tree of central veins.
+
+    Args:
+        x (np.ndarray): x coordinates of the N lattice sites, indexed by site_id
+        y (np.ndarray): y coordinates of the N lattice sites, indexed by site_id
+        site_type (np.ndarray): site types of the N lattice sites, indexed by site_id
+        spacing (float): the distance between adjacent lattice sites
+
+    Returns:
+        np.ndarray: an (N,) array of zonation type codes (see ZONATION_TYPES in lattice_classes.py)
+    """
+    
+    xy = np.column_stack([x, y])
+    zonation_type = np.full(xy.shape[0], ZONATION_TYPE_NA, dtype=np.uint8)
+    
+    hep_site_ids = np.flatnonzero(site_type == 2)
+    zonation_type[hep_site_ids] = ZONATION_TYPE_OTHER
+    
+    cv_xys = xy[site_type == 0]
+    if cv_xys.shape[0] == 0 or hep_site_ids.size == 0:
+        return zonation_type
+    
+    distances, _ = cKDTree(cv_xys).query(xy[hep_site_ids], workers=-1)
+    zonation_type[hep_site_ids[distances <= PERI_CENTRAL_DISTANCE*spacing]] = ZONATION_TYPE_PERI_CENTRAL
+    
+    return zonation_type
+
+def init_lattice_in_simulation(lattice: pd.DataFrame, lattice_settings: Dict, as_array: bool=False) -> Union[pd.DataFrame, ArrayLattice]:
+    """_summary_
+    
+    This function annotates a lattice of CV, PT and hepatocyte sites with adjacent sites and zonation types.
+
+    Args:
+        lattice (pd.DataFrame): a DataFrame containing information about site_id, x, y, site_type
+        lattice_settings (Dict): settings of the lattice, including spacing
+        as_array (bool, optional): whether to return the annotated lattice as an ArrayLattice. Defaults to False.
 
+    Returns:
+        Union[pd.DataFrame, ArrayLattice]: the annotated lattice, with every site occupied by a cell of the same id as the site,
+            as a DataFrame with adjacent_site_ids_str and zonation_type columns (or as an ArrayLattice if as_array)
+    """
+    
+    spacing = lattice_settings['spacing']
+    
+    site_ids = lattice["site_id"].values.astype(np.int64)
+    n_sites = site_ids.size
+    if not np.array_equal(np.sort(site_ids), np.arange(n_sites)):
+        raise ValueError("site_id should be a permutation of 0, 1, ..., N-1")
+    
+    x = np.empty(n_sites, dtype=np.float64); x[site_ids] = lattice["x"].values
+    y = np.empty(n_sites, dtype=np.float64); y[site_ids] = lattice["y"].values
+    site_type = np.empty(n_sites, dtype=np.uint8); site_type[site_ids] = lattice["site_type"].values
+    
     print("> annotate adjacent sites ...")
-    lattice_in_simulation = annotate_lattice_with_adjacent_sites(lattice=lattice_in_simulation)
+    adjacent_site_ids = get_adjacent_site_ids(x=x, y=y, site_type=site_type, spacing=spacing)
     print("> annotate zonation type ...")
-    lattice_in_simulation = annotate_lattice_with_zonation(lattice=lattice_in_simulation)
+    zonation_type = get_zonation_types(x=x, y=y, site_type=site_type, spacing=spacing)
     
-    return lattice_in_simulation
+    lattice_in_simulation = ArrayLattice(
+        x=x, y=y, site_type=site_type, 
+        cell_id=np.arange(n_sites), 
+        zonation_type=zonation_type, 
+        adjacent_site_ids=adjacent_site_ids
+    )
+    
+    return lattice_in_simulation if as_array else lattice_in_simulation.to_dataframe()
 
 def init_cell_dictionaries(
-    lattice: pd.DataFrame, 
+    lattice: Union[str, pd.DataFrame, ArrayLattice], 
     n_cancer_cells_init: int, 
     CancerCell: CancerCell, 
-    Hepatocyte: Hepatocyte
-) -> Tuple[Dict, pd.DataFrame]:
+    Hepatocyte: Hepatocyte,
+    use_cell_store: bool=True,
+    track_lineages: bool=False,
+    rng: np.random.Generator=None
+) -> Tuple[Dict, Union[pd.DataFrame, ArrayLattice]]:
     """_summary_
     
     This function initialises cancer cells in the lattice.
 
     Args:
-        lattice (pd.DataFrame): a DataFrame containing information about site_id, x, y, site_type, cell_id, adjacent_site_ids_str, zonation_type
+        lattice (Union[str, pd.DataFrame, ArrayLattice]): a DataFrame (or the equivalent ArrayLattice) containing information about site_id, x, y, site_type, cell_id, adjacent_site_ids_str, zonation_type,
+            or the path to a lattice directory or CSV file, loaded as an ArrayLattice with load_lattice (see lattice_io_functions.py)
         n_cancer_cells_init (int): the number of cancer cells to initialise in the lattice
         CancerCell (CancerCell): the CancerCell class used for creating new CancerCell objects
         Hepatocyte (Hepatocyte): the Hepatocyte class used for creating new Hepatocyte objects
+        use_cell_store (bool, optional): whether to keep the cells in CellDictionary objects (backed by a CellStore, see cell_classes.py),
+            or in dicts of CancerCell and Hepatocyte objects. Defaults to True.
+        track_lineages (bool, optional): whether to track the lineages of cancer cells, each initial cancer cell founding a lineage
+            inherited by the cells born from it, in the lineage_id column and the LineageTable of the CellStore (see cell_classes.py),
+            e.g. cell_dictionaries['CancerCell'].lineages.n_cells for the current clone sizes. Requires use_cell_store. Defaults to False.
+        rng (np.random.Generator, optional): the random number generator of the simulation (see random_functions.py). Defaults to None, i.e. the global np.random state.
 
     Returns:
-        Tuple[Dict, pd.DataFrame]: a Tuple of objects including
-            cell_dictionaries - a Dict of Dict containing the CancerCell and Hepatocyte objects
-            lattice - a DataFrame containing information following initialisation of CancerCell objects
+        Tuple[Dict, Union[pd.DataFrame, ArrayLattice]]: a Tuple of objects including
+            cell_dictionaries - a Dict of Dict containing the CancerCell and Hepatocyte objects, keyed by cell_id
+            lattice - a DataFrame (or ArrayLattice, as given or loaded) containing information following initialisation of CancerCell objects
     """
     
+    if isinstance(lattice, str):
+        lattice = load_lattice(lattice)
+    
+    # a DataFrame lattice is converted to an ArrayLattice for O(1) site lookups (cached in lattice.attrs for the simulation), and updated in place afterwards
+    if isinstance(lattice, pd.DataFrame):
+        cell_dictionaries, array_lattice = init_cell_dictionaries(
+            lattice=ArrayLattice.from_dataframe_cached(lattice),
+            n_cancer_cells_init=n_cancer_cells_init,
+            CancerCell=CancerCell,
+            Hepatocyte=Hepatocyte,
+            use_cell_store=use_cell_store,
+            track_lineages=track_lineages,
+            rng=rng
+        )
+        return cell_dictionaries, array_lattice.update_dataframe(lattice)
+    
+    if use_cell_store:
+        return init_cell_store_dictionaries(lattice, n_cancer_cells_init, CancerCell, Hepatocyte, track_lineages=track_lineages, rng=rng)
+    if track_lineages:
+        raise ValueError("lineages are tracked in a CellStore, set use_cell_store=True")
+    
     # initial configuration of hepatocytes
     dict_of_hepatocytes  = {} # id : Hepatocyte()
-    for site_id, x, y, site_type, cell_id, adjacent_site_ids_str, zonation_type in lattice.values:
+    for site_id in np.flatnonzero(lattice.site_type == 2):
         
-        if site_type == 2:
+        site_id = int(site_id)
+        cell_attributes = {
+            "cell_id": int(lattice.cell_id[site_id]), "site_id": site_id,
+            "cell_position": (lattice.x[site_id], lattice.y[site_id]),
+            "cell_state": 0 
+        }
+        hep = Hepatocyte(cell_attributes=cell_attributes)
         
-            cell_attributes = {
-                "cell_id": cell_id, "site_id": site_id,
-                "cell_position": (x,y),
-                "cell_state": 0 
-            }
-            hep = Hepatocyte(cell_attributes=cell_attributes)
-            
-            dict_of_hepatocytes.update({site_id: hep})
+        dict_of_hepatocytes.update({site_id: hep})
 
     # introduce the first cancer cell
     dict_of_cancer_cells = {} # id : CancerCell()
 
     print("BEFORE: total number of hepatocytes: %d " % len(dict_of_hepatocytes))
 
-    cancer_cell_id = int(lattice.cell_id.max() + 1)
     site_ids_to_sample = [
         site_id
         for site_id in dict_of_hepatocytes.keys()
@@ -158,11 +264,13 @@ def init_cell_dictionaries(
     ]
     # print(site_ids_to_sample)
 
-    cancer_cell_site_ids = np.random.choice(site_ids_to_sample, size=n_cancer_cells_init, replace=False)
+    cancer_cell_site_ids = get_rng(rng).choice(site_ids_to_sample, size=n_cancer_cells_init, replace=False)
     print(f"> selecting {cancer_cell_site_ids.size} sites to create the first CancerCell objects ")
 
     for cancer_cell_site_id in cancer_cell_site_ids:
 
+        cancer_cell_id = lattice.cell_id_allocator.allocate()
+        cancer_cell_site_id = int(cancer_cell_site_id)
         cancer_cell_xy = dict_of_hepatocytes[cancer_cell_site_id].attributes['cell_position']
 
         cancer_cell_attributes = {
@@ -179,14 +287,10 @@ def init_cell_dictionaries(
         del dict_of_hepatocytes[cancer_cell_site_id]
 
         ## [3] update lattice information
-        # print(lattice.loc[lattice.site_id==cancer_cell_site_id])
-        lattice.loc[
-            lattice.site_id==cancer_cell_site_id,
-            ["site_type", "cell_id"]
-        ] = (4, cancer_cell_id) # double check cell type corresponds to cancer cell
-        # print(lattice.loc[lattice.site_id==cancer_cell_site_id])
-
-        cancer_cell_id += 1
+        lattice.site_type[cancer_cell_site_id] = 4 # double check cell type corresponds to cancer cell
+        lattice.cell_id[cancer_cell_site_id] = cancer_cell_id
+        lattice.cell_state[cancer_cell_site_id] = 1
+        lattice.update_frontier([cancer_cell_site_id])
         
     print("AFTER : total number of hepatocytes : %d " % len(dict_of_hepatocytes))
     print("AFTER : total number of cancer cells: %d " % len(dict_of_cancer_cells))
@@ -196,4 +300,71 @@ def init_cell_dictionaries(
         "Hepatocyte": dict_of_hepatocytes
     }
 
-    return cell_dictionaries, lattice
\ No newline at end of file
+    return cell_dictionaries, lattice
+
+def init_cell_store_dictionaries(
+    lattice: ArrayLattice, 
+    n_cancer_cells_init: int, 
+    CancerCell: CancerCell, 
+    Hepatocyte: Hepatocyte,
+    track_lineages: bool=False,
+    rng: np.random.Generator=None
+) -> Tuple[Dict, ArrayLattice]:
+    """_summary_
+    
+    This function initialises cancer cells in the lattice, as init_cell_dictionaries, with cells kept in CellDictionary objects
+    and all cells created in batches.
+
+    Args:
+        lattice (ArrayLattice): the lattice
+        n_cancer_cells_init (int): the number of cancer cells to initialise in the lattice
+        CancerCell (CancerCell): the CancerCell class used for the views of cancer cells
+        Hepatocyte (Hepatocyte): the Hepatocyte class used for the views of hepatocytes
+        track_lineages (bool, optional): whether to track the lineages of cancer cells, one founded per initial cancer cell. Defaults to False.
+        rng (np.random.Generator, optional): the random number generator of the simulation. Defaults to None, i.e. the global np.random state.
+
+    Returns:
+        Tuple[Dict, ArrayLattice]: a Tuple of objects including
+            cell_dictionaries - a Dict of CellDictionary objects containing the cancer cells and hepatocytes, keyed by cell_id
+            lattice - the lattice following initialisation of cancer cells
+    """
+    
+    # initial configuration of hepatocytes
+    hep_site_ids = np.flatnonzero(lattice.site_type == 2)
+    dict_of_hepatocytes = CellDictionary(CellStore(cell_class=Hepatocyte, capacity=hep_site_ids.size))
+    dict_of_hepatocytes.store.add_many(
+        lattice.cell_id[hep_site_ids], site_id=hep_site_ids, cell_state=0,
+        x=lattice.x[hep_site_ids], y=lattice.y[hep_site_ids]
+    )
+    
+    # introduce the first cancer cells
+    lineages = LineageTable(capacity=n_cancer_cells_init) if track_lineages else None
+    dict_of_cancer_cells = CellDictionary(CellStore(cell_class=CancerCell, capacity=n_cancer_cells_init, lineages=lineages))
+    
+    print("BEFORE: total number of hepatocytes: %d " % len(dict_of_hepatocytes))
+    
+    cancer_cell_site_ids = get_rng(rng).choice(hep_site_ids, size=n_cancer_cells_init, replace=False)
+    print(f"> selecting {cancer_cell_site_ids.size} sites to create the first CancerCell objects ")
+    
+    cancer_cell_ids = lattice.cell_id_allocator.allocate_many(cancer_cell_site_ids.size)
+    lineage_ids = {"lineage_id": lineages.add_lineages(cancer_cell_ids, birth_time=0)} if track_lineages else {} # lineage-initiating cells
+    dict_of_cancer_cells.store.add_many(
+        cancer_cell_ids, site_id=cancer_cell_site_ids, cell_state=1, # proliferative
+        x=lattice.x[cancer_cell_site_ids], y=lattice.y[cancer_cell_site_ids], **lineage_ids
+    )
+    dict_of_hepatocytes.store.remove_many(lattice.cell_id[cancer_cell_site_ids])
+    
+    lattice.site_type[cancer_cell_site_ids] = 4 # double check cell type corresponds to cancer cell
+    lattice.cell_id[cancer_cell_site_ids] = cancer_cell_ids
+    lattice.cell_state[cancer_cell_site_ids] = 1
+    lattice.update_frontier(cancer_cell_site_ids)
+    
+    print("AFTER : total number of hepatocytes : %d " % len(dict_of_hepatocytes))
+    print("AFTER : total number of cancer cells: %d " % len(dict_of_cancer_cells))
+    
+    cell_dictionaries = {
+        "CancerCell": dict_of_cancer_cells,
+        "Hepatocyte": dict_of_hepatocytes
+    }
+    
+    return cell_dictionaries, lattice
@@ -0,0 +1,347 @@
+"""_summary_
+
+This script contains the definition of the ArrayLattice class.
+The lattice is stored as contiguous NumPy arrays indexed by site_id, so that looking up or updating a site costs O(1).
+Converters to and from the lattice_in_simulation DataFrame are provided to keep the notebooks working.
+
+"""
+
+import numpy as np
+import pandas as pd
+from classes_and_functions.cell_classes import CellIdAllocator, CellDictionary
+
+from typing import Dict
+
+N_ADJACENT_SITES = 6 # hexagonal lattice
+
+NO_CELL_ID = -1 # cell_id of sites not occupied by any cell (NaN in the DataFrame)
+NO_CELL_STATE = -1 # cell_state of sites not occupied by any cell
+NO_ADJACENT_SITE_ID = -1 # padding of the adjacent site id table
+
+ZONATION_TYPES = {
+    0: "n/a",
+    1: "peri-central",
+    2: "other"
+}
+ZONATION_TYPE_NA, ZONATION_TYPE_PERI_CENTRAL, ZONATION_TYPE_OTHER = 0, 1, 2
+
+# hepatocytes within this many spacings of a central vein are peri-central
+PERI_CENTRAL_DISTANCE = 5
+
+# key of lattice.attrs under which the ArrayLattice converted from a DataFrame is cached
+ARRAY_LATTICE_ATTR = "array_lattice"
+
+class ArrayLatticeCache:
+    """_summary_
+
+    A holder for the ArrayLattice converted from a lattice_in_simulation DataFrame, kept in lattice.attrs.
+    pandas deep-copies attrs into every DataFrame or Series derived from the lattice, so copying the holder returns the holder itself,
+    and pickling it drops the ArrayLattice; a holder that no longer matches its DataFrame is rebuilt by ArrayLattice.from_dataframe_cached.
+    """
+
+    def __init__(self, array_lattice: "ArrayLattice"=None):
+        self.array_lattice = array_lattice
+
+    def __copy__(self) -> "ArrayLatticeCache":
+        return self
+
+    def __deepcopy__(self, memo: Dict) -> "ArrayLatticeCache":
+        return self
+
+    def __reduce__(self):
+        return (ArrayLatticeCache, ())
+
+class ArrayLattice:
+    """_summary_
+
+    A lattice-centred data structure equivalent to the lattice_in_simulation DataFrame, with
+        x, y (np.float64), site_type (np.uint8), cell_id (np.int64, NO_CELL_ID if not occupied), zonation_type (np.uint8, see ZONATION_TYPES)
+        and cell_state (np.int8, NO_CELL_STATE if not occupied, see settings.py) as arrays of shape (N,) indexed by site_id, and
+        adjacent_site_ids (np.int32) as an array of shape (N, 6) padded with NO_ADJACENT_SITE_ID, and
+        cell_id_allocator (CellIdAllocator) handing out the ids of new cells, and
+        frontier (ActiveFrontier) the sites of cancer cells that can act in a step, built on first use by get_frontier
+    """
+
+    def __init__(
+        self,
+        x: np.ndarray,
+        y: np.ndarray,
+        site_type: np.ndarray,
+        cell_id: np.ndarray,
+        zonation_type: np.ndarray,
+        adjacent_site_ids: np.ndarray,
+        cell_state: np.ndarray=None,
+        next_cell_id: int=None
+    ):
+        self.x = np.ascontiguousarray(x, dtype=np.float64)
+        self.y = np.ascontiguousarray(y, dtype=np.float64)
+        self.site_type = np.ascontiguousarray(site_type, dtype=np.uint8)
+        self.cell_id = np.ascontiguousarray(cell_id, dtype=np.int64)
+        self.zonation_type = np.ascontiguousarray(zonation_type, dtype=np.uint8)
+        self.adjacent_site_ids = np.ascontiguousarray(adjacent_site_ids, dtype=np.int32)
+
+        # default cell states: quiescent hepatocytes, proliferative cancer cells
+        if cell_state is None:
+            cell_state = np.full(self.x.size, NO_CELL_STATE, dtype=np.int8)
+            cell_state[self.site_type == 2] = 0
+            cell_state[self.site_type == 4] = 1
+        self.cell_state = np.ascontiguousarray(cell_state, dtype=np.int8)
+        
+        # by default, new cells get ids larger than all ids on the lattice
+        if next_cell_id is None:
+            next_cell_id = self.cell_id.max() + 1 if self.cell_id.size else 0
+        self.cell_id_allocator = CellIdAllocator(next_cell_id=max(next_cell_id, 0))
+        self.frontier = None
+
+        if self.adjacent_site_ids.shape != (self.x.size, N_ADJACENT_SITES):
+            raise ValueError(f"adjacent_site_ids should have shape ({self.x.size}, {N_ADJACENT_SITES})")
+
+    @property
+    def n_sites(self) -> int:
+        return self.x.size
+
+    @property
+    def site_id(self) -> np.ndarray:
+        return np.arange(self.n_sites)
+
+    def get_adjacent_site_ids(self, site_id: int) -> np.ndarray:
+        adjacent_site_ids = self.adjacent_site_ids[site_id]
+        return adjacent_site_ids[adjacent_site_ids != NO_ADJACENT_SITE_ID]
+
+    def get_frontier(self) -> "ActiveFrontier":
+        if self.frontier is None:
+            self.frontier = ActiveFrontier(self)
+        return self.frontier
+
+    def update_frontier(self, site_ids: np.ndarray):
+        # to be called with the sites whose site_type changed, once the frontier has been built
+        if self.frontier is not None:
+            self.frontier.update(self, site_ids)
+
+    def copy(self) -> "ArrayLattice":
+        return ArrayLattice(
+            x=self.x.copy(), y=self.y.copy(),
+            site_type=self.site_type.copy(), cell_id=self.cell_id.copy(),
+            zonation_type=self.zonation_type.copy(),
+            adjacent_site_ids=self.adjacent_site_ids.copy(),
+            cell_state=self.cell_state.copy(),
+            next_cell_id=self.cell_id_allocator.next_cell_id
+        )
+
+    def set_cell_states_from_cell_dictionaries(self, cell_dictionaries: Dict[str, Dict]) -> "ArrayLattice":
+        """_summary_
+
+        This function copies the cell states of the CancerCell and Hepatocyte objects into the cell_state array.
+
+        Args:
+            cell_dictionaries (Dict[str, Dict]): a Dict of Dict containing the CancerCell and Hepatocyte objects
+
+        Returns:
+            ArrayLattice: the lattice with updated cell_state
+        """
+
+        for dict_of_cells in cell_dictionaries.values():
+            if isinstance(dict_of_cells, CellDictionary):
+                store = dict_of_cells.store
+                rows = np.flatnonzero(store.is_alive[:store.n_rows])
+                site_ids, cell_ids = store.site_id[rows], store.cell_id[rows]
+                is_on_site = self.cell_id[site_ids] == cell_ids
+                self.cell_state[site_ids[is_on_site]] = store.cell_state[rows[is_on_site]]
+                continue
+            for cell in dict_of_cells.values():
+                cell_attributes = cell.get_attributes()
+                site_id = cell_attributes['site_id']
+                if self.cell_id[site_id] == cell_attributes['cell_id']:
+                    self.cell_state[site_id] = cell_attributes['cell_state']
+
+        return self
+
+    @classmethod
+    def from_dataframe(cls, lattice: pd.DataFrame) -> "ArrayLattice":
+        """_summary_
+
+        This function converts a lattice_in_simulation DataFrame into an ArrayLattice.
+
+        Args:
+            lattice (pd.DataFrame): a DataFrame containing information about site_id, x, y, site_type, cell_id, adjacent_site_ids_str, zonation_type
+
+        Returns:
+            ArrayLattice: the lattice with site information stored in arrays indexed by site_id
+        """
+
+        site_ids = lattice["site_id"].values.astype(np.int64)
+        n_sites = site_ids.size
+        if not np.array_equal(np.sort(site_ids), np.arange(n_sites)):
+            raise ValueError("site_id should be a permutation of 0, 1, ..., N-1")
+
+        x = np.empty(n_sites, dtype=np.float64); x[site_ids] = lattice["x"].values
+        y = np.empty(n_sites, dtype=np.float64); y[site_ids] = lattice["y"].values
+        site_type = np.empty(n_sites, dtype=np.uint8); site_type[site_ids] = lattice["site_type"].values
+
+        cell_id = np.full(n_sites, NO_CELL_ID, dtype=np.int64)
+        cell_id_values = lattice["cell_id"].values.astype(np.float64)
+        is_occupied = ~np.isnan(cell_id_values)
+        cell_id[site_ids[is_occupied]] = cell_id_values[is_occupied]
+
+        # zonation types as integer codes
+        zonation_codes = {zonation_type: code for code, zonation_type in ZONATION_TYPES.items()}
+        zonation_type = np.zeros(n_sites, dtype=np.uint8)
+        if "zonation_type" in lattice.columns:
+            zonation_type[site_ids] = [
+                zonation_codes.get(value, 0) for value in lattice["zonation_type"].values
+            ]
+
+        # adjacent site ids from the comma-joined strings, "n/a" or NaN if not annotated
+        adjacent_site_ids = np.full((n_sites, N_ADJACENT_SITES), NO_ADJACENT_SITE_ID, dtype=np.int32)
+        if "adjacent_site_ids_str" in lattice.columns:
+            for site_id, adjacent_site_ids_str in zip(site_ids, lattice["adjacent_site_ids_str"].values):
+                if not isinstance(adjacent_site_ids_str, str) or adjacent_site_ids_str in ("", "n/a"):
+                    continue
+                adjacent_site_ids_of_site = [int(str) for str in adjacent_site_ids_str.split(',')]
+                adjacent_site_ids[site_id, :len(adjacent_site_ids_of_site)] = adjacent_site_ids_of_site
+
+        return cls(
+            x=x, y=y, site_type=site_type, cell_id=cell_id,
+            zonation_type=zonation_type, adjacent_site_ids=adjacent_site_ids,
+            next_cell_id=lattice.attrs.get("next_cell_id")
+        )
+
+    @classmethod
+    def from_dataframe_cached(cls, lattice: pd.DataFrame) -> "ArrayLattice":
+        """_summary_
+
+        This function converts a lattice_in_simulation DataFrame into an ArrayLattice, reusing the ArrayLattice cached in lattice.attrs
+        if its site_type, cell_id and next cell id still match the DataFrame, so that a simulation on the DataFrame converts it once rather than every step.
+        The cached ArrayLattice is updated in place by the simulation functions and written back with update_dataframe.
+
+        Args:
+            lattice (pd.DataFrame): a DataFrame containing information about site_id, x, y, site_type, cell_id, adjacent_site_ids_str, zonation_type
+
+        Returns:
+            ArrayLattice: the lattice with site information stored in arrays indexed by site_id
+        """
+
+        cache = lattice.attrs.get(ARRAY_LATTICE_ATTR)
+        array_lattice = cache.array_lattice if isinstance(cache, ArrayLatticeCache) else None
+        if array_lattice is not None and array_lattice.matches_dataframe(lattice):
+            return array_lattice
+
+        array_lattice = cls.from_dataframe(lattice)
+        lattice.attrs[ARRAY_LATTICE_ATTR] = ArrayLatticeCache(array_lattice)
+        return array_lattice
+
+    def matches_dataframe(self, lattice: pd.DataFrame) -> bool:
+        # the DataFrame may have been edited, sliced or copied since the ArrayLattice was cached
+        if len(lattice) != self.n_sites or lattice.attrs.get("next_cell_id") != self.cell_id_allocator.next_cell_id:
+            return False
+        site_ids = lattice["site_id"].values.astype(np.int64)
+        return np.array_equal(self.site_id[site_ids], site_ids) \
+            and np.array_equal(self.site_type[site_ids], lattice["site_type"].values) \
+            and np.array_equal(self.get_cell_id_column()[site_ids], lattice["cell_id"].values.astype(np.float64), equal_nan=True)
+
+    def get_cell_id_column(self) -> np.ndarray:
+        # NaN for sites not occupied, as in the DataFrame
+        if (self.cell_id == NO_CELL_ID).any():
+            return np.where(self.cell_id == NO_CELL_ID, np.nan, self.cell_id.astype(np.float64))
+        return self.cell_id.copy()
+
+    def get_adjacent_site_ids_strs(self) -> np.ndarray:
+        adjacent_site_ids_strs = np.full(self.n_sites, "n/a", dtype=object)
+        for site_id in np.flatnonzero((self.adjacent_site_ids != NO_ADJACENT_SITE_ID).any(axis=1)):
+            adjacent_site_ids_strs[site_id] = ','.join(str(s) for s in self.get_adjacent_site_ids(site_id))
+        return adjacent_site_ids_strs
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """_summary_
+
+        This function converts the ArrayLattice into a lattice_in_simulation DataFrame.
+
+        Returns:
+            pd.DataFrame: a DataFrame containing information about site_id, x, y, site_type, cell_id, adjacent_site_ids_str, zonation_type
+        """
+
+        zonation_type_names = np.array([ZONATION_TYPES[code] for code in sorted(ZONATION_TYPES)], dtype=object)
+
+        lattice = pd.DataFrame({
+            "site_id": self.site_id,
+            "x": self.x.copy(),
+            "y": self.y.copy(),
+            "site_type": self.site_type.copy(),
+            "cell_id": self.get_cell_id_column(),
+            "adjacent_site_ids_str": self.get_adjacent_site_ids_strs(),
+            "zonation_type": zonation_type_names[self.zonation_type]
+        })
+        lattice.attrs["next_cell_id"] = self.cell_id_allocator.next_cell_id
+
+        return lattice
+
+    def update_dataframe(self, lattice: pd.DataFrame) -> pd.DataFrame:
+        """_summary_
+
+        This function writes site_type and cell_id of the ArrayLattice back into a lattice_in_simulation DataFrame, in place,
+        and keeps the next cell id in lattice.attrs so that ids are not reused after converting the DataFrame again.
+
+        Args:
+            lattice (pd.DataFrame): a DataFrame containing information about site_id, x, y, site_type, cell_id, adjacent_site_ids_str, zonation_type
+
+        Returns:
+            pd.DataFrame: the same DataFrame with updated site_type and cell_id
+        """
+
+        site_ids = lattice["site_id"].values.astype(np.int64)
+        lattice["site_type"] = self.site_type[site_ids].astype(lattice["site_type"].dtype)
+        lattice["cell_id"] = self.get_cell_id_column()[site_ids]
+        lattice.attrs["next_cell_id"] = self.cell_id_allocator.next_cell_id
+
+        return lattice
+
+class ActiveFrontier:
+    """_summary_
+
+    The sites of the cancer cells that can act in a step, i.e. with at least one adjacent NO or HEP site, kept as
+        is_active (np.bool_) a mask of shape (N,) indexed by site_id, and
+        site_ids (set) the ids of the active sites,
+    and updated locally from the sites whose site_type changed (births, deaths, moves, clearance), so that a step costs O(tumour boundary).
+    Cancer cells whose adjacent sites are all occupied by cancer cells, ECM, CVs or PTs can neither grow, move nor damage hepatocytes;
+    the hepatocytes to process in a step are the HEP sites adjacent to the active sites.
+    """
+
+    def __init__(self, lattice: ArrayLattice):
+        self.is_active = self.get_is_active(lattice, np.arange(lattice.n_sites))
+        self.site_ids = set(np.flatnonzero(self.is_active).tolist())
+
+    @staticmethod
+    def get_is_active(lattice: ArrayLattice, site_ids: np.ndarray) -> np.ndarray:
+        adjacent_site_ids = lattice.adjacent_site_ids[site_ids]
+        adjacent_site_types = lattice.site_type[adjacent_site_ids]
+        is_adjacent_site_free = (adjacent_site_ids != NO_ADJACENT_SITE_ID) & ((adjacent_site_types == 2) | (adjacent_site_types == 3))
+        return (lattice.site_type[site_ids] == 4) & is_adjacent_site_free.any(axis=1)
+
+    def update(self, lattice: ArrayLattice, site_ids: np.ndarray):
+        """_summary_
+
+        This function updates the frontier around the given sites, i.e. the sites and their adjacent sites.
+
+        Args:
+            lattice (ArrayLattice): the lattice
+            site_ids (np.ndarray): the ids of the sites whose site_type changed
+        """
+
+        site_ids = np.asarray(site_ids, dtype=np.int64)
+        if site_ids.size == 0:
+            return
+        affected_site_ids = np.unique(np.concatenate([site_ids, lattice.adjacent_site_ids[site_ids].ravel()]))
+        affected_site_ids = affected_site_ids[affected_site_ids != NO_ADJACENT_SITE_ID]
+
+        is_active = self.get_is_active(lattice, affected_site_ids)
+        is_changed = is_active != self.is_active[affected_site_ids]
+        for site_id, is_site_active in zip(affected_site_ids[is_changed].tolist(), is_active[is_changed].tolist()):
+            if is_site_active:
+                self.site_ids.add(site_id)
+            else:
+                self.site_ids.discard(site_id)
+        self.is_active[affected_site_ids] = is_active
+
+    def get_site_ids(self) -> np.ndarray:
+        # the active sites, in order of site_id
+        return np.sort(np.fromiter(self.site_ids, dtype=np.int64, count=len(self.site_ids)))
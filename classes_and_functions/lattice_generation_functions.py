@@ -0,0 +1,198 @@
+"""_summary_
+
+This Python script contains functions to generate a hexagonal lattice of liver lobules from lattice settings, directly as an ArrayLattice.
+
+The lattice is a hexagon of lattice_size sites around the origin, with site ids assigned ring by ring (breadth-first from the origin),
+as in files/lattice_with_CVs_PTs_2025-06-23_annotated_without_tumour.csv. Central Veins (CVs) and Portal Triads (PTs) are placed
+by tiling a unit of lobules, so that very large lattices are generated in chunks without pairwise distance computations.
+
+"""
+
+import numpy as np
+from classes_and_functions.lattice_classes import ArrayLattice, N_ADJACENT_SITES, NO_ADJACENT_SITE_ID, \
+    ZONATION_TYPE_PERI_CENTRAL, ZONATION_TYPE_OTHER, PERI_CENTRAL_DISTANCE
+from classes_and_functions.initialisation_functions import AXIAL_OFFSETS
+
+from typing import Dict, Tuple
+
+def check_lattice_settings(lattice_settings: Dict):
+    """_summary_
+
+    This function checks that the lattice settings describe lobules that can be generated, i.e.
+    PTs at lobule_size sites from CVs and CVs at lobule_size * sqrt(3) sites from each other.
+
+    Args:
+        lattice_settings (Dict): settings of the lattice, including spacing, lobule_size, lattice_size, spacing_CV_CV, spacing_CV_PT
+    """
+
+    spacing, lobule_size = lattice_settings['spacing'], lattice_settings['lobule_size']
+
+    if not np.isclose(lattice_settings['spacing_CV_PT'], lobule_size * spacing):
+        raise ValueError("spacing_CV_PT should be equal to lobule_size * spacing")
+    if not np.isclose(lattice_settings['spacing_CV_CV'], lobule_size * np.sqrt(3) * spacing):
+        raise ValueError("spacing_CV_CV should be equal to lobule_size * sqrt(3) * spacing")
+
+def get_ring_ordered_axial_coordinates(lattice_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """_summary_
+
+    This function lists the sites of a hexagonal lattice of radius lattice_size in breadth-first order from the origin,
+    adding the adjacent sites of each site of a ring in anticlockwise order.
+
+    Args:
+        lattice_size (int): the number of rings of sites around the origin
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: the axial coordinates q, r of the 3 * lattice_size * (lattice_size+1) + 1 sites, in order of site_id
+    """
+
+    n_sites = 3 * lattice_size * (lattice_size+1) + 1
+    q = np.zeros(n_sites, dtype=np.int32)
+    r = np.zeros(n_sites, dtype=np.int32)
+
+    ring_start, ring_end = 0, 1
+    for ring in range(1, lattice_size+1):
+        # adjacent sites of the previous ring, in order of parent site then direction
+        candidate_q = (q[ring_start:ring_end, None] + AXIAL_OFFSETS[None, :, 0]).ravel()
+        candidate_r = (r[ring_start:ring_end, None] + AXIAL_OFFSETS[None, :, 1]).ravel()
+        is_in_ring = np.maximum(np.maximum(np.abs(candidate_q), np.abs(candidate_r)), np.abs(candidate_q + candidate_r)) == ring
+        candidate_q, candidate_r = candidate_q[is_in_ring], candidate_r[is_in_ring]
+
+        # keep the first occurrence of each site
+        _, first_occurrences = np.unique(candidate_q.astype(np.int64) * (4*ring+1) + candidate_r, return_index=True)
+        first_occurrences.sort()
+
+        ring_start, ring_end = ring_end, ring_end + 6*ring
+        q[ring_start:ring_end] = candidate_q[first_occurrences]
+        r[ring_start:ring_end] = candidate_r[first_occurrences]
+
+    return q, r
+
+def get_unit_lobule_tile(lattice_settings: Dict) -> Tuple[np.ndarray, np.ndarray]:
+    """_summary_
+
+    This function builds the tile of 3 * lobule_size by 3 * lobule_size sites (in axial coordinates)
+    that repeats over the lattice, with CVs at lobule_size * (q, r) for q - r divisible by 3 and PTs at the other lobule_size * (q, r).
+
+    Args:
+        lattice_settings (Dict): settings of the lattice, including spacing, lobule_size
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: arrays of shape (3 * lobule_size, 3 * lobule_size), indexed by (q mod 3 * lobule_size, r mod 3 * lobule_size), including
+            site_type_tile - site types of an infinite lattice of lobules
+            zonation_type_tile - zonation types of an infinite lattice of lobules
+    """
+
+    lobule_size = lattice_settings['lobule_size']
+    tile_size = 3 * lobule_size
+
+    tile_q, tile_r = np.meshgrid(np.arange(tile_size), np.arange(tile_size), indexing='ij')
+
+    site_type_tile = np.full((tile_size, tile_size), 2, dtype=np.uint8)
+    is_lobule_corner = (tile_q % lobule_size == 0) & (tile_r % lobule_size == 0)
+    is_cv = is_lobule_corner & ((tile_q - tile_r) % tile_size == 0)
+    site_type_tile[is_lobule_corner] = 1 # PT
+    site_type_tile[is_cv] = 0 # CV
+
+    # distances to the nearest CV, among the CVs of this tile and the 8 surrounding tiles
+    cv_q, cv_r = tile_q[is_cv], tile_r[is_cv]
+    shifts = np.array([(i, j) for i in (-1, 0, 1) for j in (-1, 0, 1)]) * tile_size
+    cv_q = (cv_q[None, :] + shifts[:, :1]).ravel()
+    cv_r = (cv_r[None, :] + shifts[:, 1:]).ravel()
+
+    # squared distances in spacings are integers in axial coordinates, so that sites at exactly PERI_CENTRAL_DISTANCE do not depend on rounding
+    dq = tile_q.ravel()[:, None] - cv_q[None, :]
+    dr = tile_r.ravel()[:, None] - cv_r[None, :]
+    squared_distances = (dq**2 + dq*dr + dr**2).min(axis=1).reshape(tile_size, tile_size)
+
+    zonation_type_tile = np.where(squared_distances <= PERI_CENTRAL_DISTANCE**2, ZONATION_TYPE_PERI_CENTRAL, ZONATION_TYPE_OTHER).astype(np.uint8)
+
+    return site_type_tile, zonation_type_tile
+
+def generate_lattice(lattice_settings: Dict, lattice_size: int=None, chunk_size: int=2**18) -> ArrayLattice:
+    """_summary_
+
+    This function generates a hexagonal lattice of liver lobules, with CVs, PTs, hepatocytes, adjacent sites and zonation types.
+    Site types, coordinates and adjacent sites match init_lattice_in_simulation on a lattice of the same settings; zonation types
+    are computed from integer squared distances, so that hepatocytes at exactly PERI_CENTRAL_DISTANCE spacings from a CV are
+    peri-central here but may not be with the floating point distances of get_zonation_types.
+
+    Args:
+        lattice_settings (Dict): settings of the lattice, including spacing, lobule_size, lattice_size, spacing_CV_CV, spacing_CV_PT
+        lattice_size (int, optional): the number of rings of sites around the origin, to tile the lobules over a larger or smaller lattice.
+            Defaults to None, i.e. lattice_settings['lattice_size'].
+        chunk_size (int, optional): the number of sites processed at once, to bound memory use. Defaults to 2**18.
+
+    Returns:
+        ArrayLattice: the generated lattice, with every site occupied by a cell of the same id as the site
+    """
+
+    check_lattice_settings(lattice_settings)
+
+    spacing, lobule_size = lattice_settings['spacing'], lattice_settings['lobule_size']
+    if lattice_size is None:
+        lattice_size = lattice_settings['lattice_size']
+    tile_size = 3 * lobule_size
+
+    q, r = get_ring_ordered_axial_coordinates(lattice_size)
+    n_sites = q.size
+    site_type_tile, zonation_type_tile = get_unit_lobule_tile(lattice_settings)
+
+    # site ids of all axial coordinates in the bounding box, NO_ADJACENT_SITE_ID outside of the lattice (with a margin of 1)
+    width = 2*lattice_size + 3
+    site_id_map = np.full((width, width), NO_ADJACENT_SITE_ID, dtype=np.int32)
+    site_id_map[q + lattice_size+1, r + lattice_size+1] = np.arange(n_sites, dtype=np.int32)
+
+    x = np.empty(n_sites, dtype=np.float64)
+    y = np.empty(n_sites, dtype=np.float64)
+    site_type = np.empty(n_sites, dtype=np.uint8)
+    zonation_type = np.zeros(n_sites, dtype=np.uint8)
+    adjacent_site_ids = np.full((n_sites, N_ADJACENT_SITES), NO_ADJACENT_SITE_ID, dtype=np.int32)
+
+    for chunk_start in range(0, n_sites, chunk_size):
+        chunk = slice(chunk_start, chunk_start+chunk_size)
+        chunk_q, chunk_r = q[chunk], r[chunk]
+
+        x[chunk] = spacing * (chunk_q + chunk_r/2)
+        y[chunk] = spacing * chunk_r * np.sqrt(3)/2
+
+        chunk_site_type = site_type_tile[chunk_q % tile_size, chunk_r % tile_size]
+        site_type[chunk] = chunk_site_type
+        is_hep = chunk_site_type == 2
+        zonation_type[chunk] = np.where(is_hep, zonation_type_tile[chunk_q % tile_size, chunk_r % tile_size], 0)
+
+        # adjacent sites of hepatocytes, left-aligned in anticlockwise order
+        hep_site_ids = chunk_start + np.flatnonzero(is_hep)
+        found_adjacent_site_ids = site_id_map[
+            q[hep_site_ids, None] + AXIAL_OFFSETS[None, :, 0] + lattice_size+1,
+            r[hep_site_ids, None] + AXIAL_OFFSETS[None, :, 1] + lattice_size+1
+        ]
+        order = np.argsort(found_adjacent_site_ids == NO_ADJACENT_SITE_ID, axis=1, kind='stable')
+        adjacent_site_ids[hep_site_ids] = np.take_along_axis(found_adjacent_site_ids, order, axis=1)
+
+    # zonation types near the edge of the lattice only count CVs within the lattice, looked up at the axial offsets within PERI_CENTRAL_DISTANCE
+    near_edge_site_ids = np.flatnonzero(
+        (np.maximum(np.maximum(np.abs(q), np.abs(r)), np.abs(q + r)) > lattice_size - PERI_CENTRAL_DISTANCE - 1) & (site_type == 2)
+    )
+    if near_edge_site_ids.size:
+        offset_q, offset_r = np.meshgrid(np.arange(-PERI_CENTRAL_DISTANCE, PERI_CENTRAL_DISTANCE+1), np.arange(-PERI_CENTRAL_DISTANCE, PERI_CENTRAL_DISTANCE+1), indexing='ij')
+        is_within = offset_q**2 + offset_q*offset_r + offset_r**2 <= PERI_CENTRAL_DISTANCE**2
+        offset_q, offset_r = offset_q[is_within], offset_r[is_within]
+
+        # with a margin of PERI_CENTRAL_DISTANCE around the lattice
+        margin = PERI_CENTRAL_DISTANCE
+        is_cv_map = np.zeros((2*(lattice_size+margin)+1, 2*(lattice_size+margin)+1), dtype=bool)
+        is_cv_map[q[site_type == 0] + lattice_size+margin, r[site_type == 0] + lattice_size+margin] = True
+        is_peri_central = is_cv_map[
+            q[near_edge_site_ids, None] + offset_q[None, :] + lattice_size+margin,
+            r[near_edge_site_ids, None] + offset_r[None, :] + lattice_size+margin
+        ].any(axis=1)
+        zonation_type[near_edge_site_ids] = np.where(is_peri_central, ZONATION_TYPE_PERI_CENTRAL, ZONATION_TYPE_OTHER)
+
+    lattice = ArrayLattice(
+        x=x, y=y, site_type=site_type,
+        cell_id=np.arange(n_sites),
+        zonation_type=zonation_type,
+        adjacent_site_ids=adjacent_site_ids
+    )
+
+    return lattice
@@ -0,0 +1,127 @@
+"""_summary_
+
+This Python script contains functions to save and load an ArrayLattice in a binary lattice format, and to convert lattice CSV files into it once,
+so that loading a lattice does not parse the adjacent_site_ids_str strings of the CSV file again.
+
+A lattice directory contains
+    - metadata.json: the format version, the number of sites, the next cell id and the dtypes of the arrays
+    - <array>.npy: the arrays of the ArrayLattice (x, y, site_type, cell_id, zonation_type, cell_state and the (N, 6) adjacent_site_ids)
+The arrays that are not updated during a simulation are memory-mapped with np.load(mmap_mode='r'), so that processes loading
+the same lattice share one page-cached copy of them; the arrays updated during a simulation are loaded as copies.
+
+Run from the root of the repository, e.g.:
+    python -m classes_and_functions.lattice_io_functions ./files/lattice_with_CVs_PTs_2025-06-23_annotated_without_tumour.csv \
+        ./files/lattice_with_CVs_PTs_2025-06-23_annotated_without_tumour
+
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from classes_and_functions.lattice_classes import ArrayLattice, N_ADJACENT_SITES
+
+LATTICE_FORMAT_VERSION = 1
+
+LATTICE_ARRAYS = {
+    "x": np.float64,
+    "y": np.float64,
+    "site_type": np.uint8,
+    "cell_id": np.int64,
+    "zonation_type": np.uint8,
+    "adjacent_site_ids": np.int32,
+    "cell_state": np.int8
+}
+READ_ONLY_ARRAY_NAMES = ["x", "y", "zonation_type", "adjacent_site_ids"] # not updated during a simulation
+UPDATED_ARRAY_NAMES = ["site_type", "cell_id", "cell_state"] # updated during a simulation
+
+def is_lattice_directory(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, "metadata.json"))
+
+def save_lattice(lattice: ArrayLattice, directory: str):
+    """_summary_
+
+    This function saves the arrays of a lattice as .npy files in a lattice directory, created if needed.
+
+    Args:
+        lattice (ArrayLattice): the lattice
+        directory (str): the lattice directory
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    for name, dtype in LATTICE_ARRAYS.items():
+        np.save(os.path.join(directory, f"{name}.npy"), getattr(lattice, name).astype(dtype, copy=False))
+
+    # the metadata is written last, so that a directory with metadata.json always contains a complete lattice
+    metadata = {
+        "format_version": LATTICE_FORMAT_VERSION,
+        "n_sites": lattice.n_sites,
+        "next_cell_id": lattice.cell_id_allocator.next_cell_id,
+        "arrays": {name: np.dtype(dtype).str for name, dtype in LATTICE_ARRAYS.items()}
+    }
+    with open(os.path.join(directory, "metadata.json"), "w") as json_file:
+        json.dump(metadata, json_file, indent=4)
+
+def load_lattice(path: str, mmap_mode: str='r') -> ArrayLattice:
+    """_summary_
+
+    This function loads a lattice from a lattice directory (see save_lattice), or from a lattice CSV file.
+
+    Args:
+        path (str): the path to a lattice directory, or to a lattice CSV file as files/lattice_with_CVs_PTs_2025-06-23_annotated_without_tumour.csv
+        mmap_mode (str, optional): the mmap_mode of np.load for the arrays not updated during a simulation. Defaults to 'r', i.e. read-only memory maps.
+            None loads them into memory.
+
+    Returns:
+        ArrayLattice: the lattice, whose site_type, cell_id and cell_state arrays are writable copies
+    """
+
+    if not is_lattice_directory(path):
+        if os.path.isfile(path):
+            return ArrayLattice.from_dataframe(pd.read_csv(path))
+        raise FileNotFoundError(f"{path} is neither a lattice directory nor a lattice CSV file")
+
+    with open(os.path.join(path, "metadata.json")) as json_file:
+        metadata = json.load(json_file)
+    if metadata["format_version"] > LATTICE_FORMAT_VERSION:
+        raise ValueError(f"lattice format version {metadata['format_version']} is not supported")
+
+    arrays = {}
+    for name, dtype in LATTICE_ARRAYS.items():
+        array = np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode if name in READ_ONLY_ARRAY_NAMES else None)
+        shape = (metadata["n_sites"], N_ADJACENT_SITES) if name == "adjacent_site_ids" else (metadata["n_sites"],)
+        if array.shape != shape or array.dtype != dtype:
+            raise ValueError(f"{name}.npy should contain an array of shape {shape} and dtype {np.dtype(dtype)}, got {array.shape} and {array.dtype}")
+        arrays[name] = array
+
+    return ArrayLattice(**arrays, next_cell_id=metadata["next_cell_id"])
+
+def convert_lattice_csv(path_to_csv: str, directory: str) -> ArrayLattice:
+    """_summary_
+
+    This function converts a lattice CSV file into a lattice directory, parsing adjacent_site_ids_str once.
+
+    Args:
+        path_to_csv (str): the path to the lattice CSV file
+        directory (str): the lattice directory
+
+    Returns:
+        ArrayLattice: the converted lattice
+    """
+
+    lattice = ArrayLattice.from_dataframe(pd.read_csv(path_to_csv))
+    save_lattice(lattice, directory)
+    return lattice
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Convert a lattice CSV file into a lattice directory of .npy files")
+    parser.add_argument("csv", help="path to the lattice CSV file")
+    parser.add_argument("directory", help="path to the lattice directory")
+    args = parser.parse_args()
+
+    lattice = convert_lattice_csv(args.csv, args.directory)
+    print(f"> {lattice.n_sites} sites saved to {args.directory}")
@@ -0,0 +1,234 @@
+"""_summary_
+
+This Python script contains streaming metrics of simulations, computed inside the step loop instead of from stored snapshots:
+    - MetricsRecorder records, at chosen times of a run, the number of tumours, the histogram of tumour sizes, the largest tumour,
+      the cancer burden, the fractions of apoptotic hepatocytes and ECM sites by zonation type and, with tracked lineages, the number of
+      living lineages, the largest clone, the histogram of lineage sizes and the sizes of all lineages
+    - MetricsSummary accumulates the metrics per time as counts and moments (Moments), which merge in any order, so that the metrics of
+      replicates are reduced to condition-level means, standard deviations and extremes as runs finish, without keeping the runs
+
+"""
+
+import numpy as np
+import pandas as pd
+
+from classes_and_functions.lattice_classes import ArrayLattice, ZONATION_TYPES, ZONATION_TYPE_NA
+from classes_and_functions.cell_classes import LineageTable
+from classes_and_functions.analysis_functions import get_connected_components
+
+from typing import Dict, List
+
+SIZE_BIN_EDGES = np.concatenate([2 ** np.arange(21, dtype=np.float64), [np.inf]]) # sizes in [1, 2), [2, 4), ..., [2^20, inf)
+
+def get_zonation_metric_names(prefix: str) -> List[str]:
+    # e.g. apoptotic_fraction_peri_central, apoptotic_fraction_other
+    return [f"{prefix}_{ZONATION_TYPES[code].replace('-', '_')}" for code in sorted(ZONATION_TYPES) if code != ZONATION_TYPE_NA]
+
+def get_metric_names(track_lineages: bool=False) -> List[str]:
+    # the scalar metrics recorded by MetricsRecorder
+    metric_names = ["n_cancer_cells", "n_tumours", "largest_tumour", "mean_tumour_size"] \
+        + get_zonation_metric_names("apoptotic_fraction") + get_zonation_metric_names("ecm_fraction")
+    if track_lineages:
+        metric_names += ["n_lineages", "largest_clone"]
+    return metric_names
+
+def get_size_histogram(sizes: np.ndarray, bin_edges: np.ndarray=SIZE_BIN_EDGES) -> np.ndarray:
+    # the number of sizes in each bin [bin_edges[i], bin_edges[i+1]), sizes below bin_edges[0] not counted
+    bins = np.searchsorted(bin_edges, sizes, side='right') - 1
+    return np.bincount(bins[bins >= 0], minlength=bin_edges.size - 1).astype(np.float64)
+
+class Moments:
+    """_summary_
+
+    The count, mean, sum of squared deviations from the mean, minimum and maximum of values added one array at a time, elementwise over
+    arrays of a fixed shape. Two Moments merge exactly (Chan et al.), in any order, so that they can be accumulated separately, e.g. per
+    replicate or per worker process, and reduced afterwards.
+    """
+
+    def __init__(self, shape: tuple=()):
+        self.count = 0
+        self.mean = np.zeros(shape, dtype=np.float64)
+        self.m2 = np.zeros(shape, dtype=np.float64)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+
+    def add(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        self.count += 1
+        delta = values - self.mean
+        self.mean = self.mean + delta / self.count
+        self.m2 = self.m2 + delta * (values - self.mean)
+        self.min = np.minimum(self.min, values)
+        self.max = np.maximum(self.max, values)
+
+    def merge(self, other: "Moments"):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.count / count)
+        self.m2 = self.m2 + other.m2 + delta ** 2 * (self.count * other.count / count)
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        self.count = count
+
+    def get_std(self) -> np.ndarray:
+        # the sample standard deviation, NaN for fewer than 2 values
+        if self.count < 2:
+            return np.full(self.mean.shape, np.nan)
+        return np.sqrt(self.m2 / (self.count - 1))
+
+class MetricsSummary:
+    """_summary_
+
+    The scalar metrics and size histograms of runs (see MetricsRecorder), accumulated per time as Moments:
+    one value per time and run added by MetricsRecorder, and the summaries of runs merged with merge.
+    """
+
+    def __init__(self, metric_names: List[str], histogram_names: List[str], bin_edges: np.ndarray=SIZE_BIN_EDGES):
+        self.metric_names = list(metric_names)
+        self.histogram_names = list(histogram_names)
+        self.bin_edges = np.asarray(bin_edges, dtype=np.float64)
+        self.moments = {} # time -> name -> Moments, with name "metrics" for the scalar metrics in order of metric_names
+
+    def get_moments(self, t: float) -> Dict[str, Moments]:
+        if t not in self.moments:
+            self.moments[t] = {"metrics": Moments(len(self.metric_names))}
+            self.moments[t].update({name: Moments(self.bin_edges.size - 1) for name in self.histogram_names})
+        return self.moments[t]
+
+    def add(self, t: float, metrics: Dict[str, float], histograms: Dict[str, np.ndarray]):
+        # the metrics and histograms of one run at time t
+        moments = self.get_moments(t)
+        moments["metrics"].add([metrics[name] for name in self.metric_names])
+        for name in self.histogram_names:
+            moments[name].add(histograms[name])
+
+    def merge(self, other: "MetricsSummary"):
+        """_summary_
+
+        This function adds the runs of another summary to this summary, e.g. the summary of a replicate to the summary of its model condition.
+
+        Args:
+            other (MetricsSummary): a summary of the same metrics, histograms and bins
+        """
+
+        if other.metric_names != self.metric_names or other.histogram_names != self.histogram_names \
+                or not np.array_equal(other.bin_edges, self.bin_edges):
+            raise ValueError("only summaries of the same metrics, histograms and bins can be merged")
+        for t, other_moments in other.moments.items():
+            moments = self.get_moments(t)
+            for name, other_moments_of_name in other_moments.items():
+                moments[name].merge(other_moments_of_name)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """_summary_
+
+        This function returns the summary as a tidy table, one row per time and scalar metric, and per time, histogram and bin.
+
+        Returns:
+            pd.DataFrame: a DataFrame containing time, metric, bin_start and bin_end (NaN for scalar metrics), count (the number of runs),
+                mean, std (NaN for fewer than 2 runs), min and max
+        """
+
+        tables = []
+        for t in sorted(self.moments):
+            for name, moments in self.moments[t].items():
+                if name == "metrics":
+                    metric, bin_start, bin_end = self.metric_names, np.nan, np.nan
+                else:
+                    metric, bin_start, bin_end = name, self.bin_edges[:-1], self.bin_edges[1:]
+                tables.append(pd.DataFrame({
+                    "time": t, "metric": metric, "bin_start": bin_start, "bin_end": bin_end, "count": moments.count,
+                    "mean": moments.mean, "std": moments.get_std(), "min": moments.min, "max": moments.max
+                }))
+        columns = ["time", "metric", "bin_start", "bin_end", "count", "mean", "std", "min", "max"]
+        return pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(columns=columns)
+
+class MetricsRecorder:
+    """_summary_
+
+    Records the metrics of one run at chosen times, from the lattice (and the lineages of cancer cells if tracked) as the simulation proceeds,
+    into a MetricsSummary of the run, at a cost of one pass over the lattice arrays and connected components of the tumour sites per time.
+    """
+
+    def __init__(self, times: List[float]=None, track_lineages: bool=False, bin_edges: np.ndarray=SIZE_BIN_EDGES):
+        """_summary_
+
+        Args:
+            times (List[float], optional): the times at which metrics are recorded. Defaults to None, i.e. every time record is called.
+            track_lineages (bool, optional): whether to record the metrics of the lineages of cancer cells, see LineageTable. Defaults to False.
+            bin_edges (np.ndarray, optional): the edges of the bins of the size histograms. Defaults to SIZE_BIN_EDGES.
+        """
+
+        self.times = None if times is None else set(times)
+        self.track_lineages = track_lineages
+        histogram_names = ["tumour_sizes"] + (["lineage_sizes"] if track_lineages else [])
+        self.summary = MetricsSummary(get_metric_names(track_lineages), histogram_names, bin_edges)
+        self.lineages = None # the lineages recorded into, see LineageTable.record
+        self.n_sites_of_zonation_type = None
+
+    def record(self, t: float, lattice: ArrayLattice, lineages: LineageTable=None):
+        """_summary_
+
+        This function records the metrics at time t, if t is one of the times of the recorder.
+
+        Args:
+            t (float): the time
+            lattice (ArrayLattice): the lattice at time t
+            lineages (LineageTable, optional): the lineages of cancer cells, required with track_lineages. Defaults to None.
+        """
+
+        if self.times is not None and t not in self.times:
+            return
+        if self.track_lineages and lineages is None:
+            raise ValueError("the recorder tracks lineages; pass the lineages of cancer cells, see init_cell_dictionaries(..., track_lineages=True)")
+
+        n_zonation_types = max(ZONATION_TYPES) + 1
+        if self.n_sites_of_zonation_type is None:
+            self.n_sites_of_zonation_type = np.bincount(lattice.zonation_type, minlength=n_zonation_types).astype(np.float64)
+
+        tumour_site_ids = np.flatnonzero(lattice.site_type == 4)
+        labels = get_connected_components(tumour_site_ids, lattice.adjacent_site_ids[tumour_site_ids])
+        tumour_sizes = np.bincount(labels)
+
+        metrics = {
+            "n_cancer_cells": tumour_site_ids.size,
+            "n_tumours": tumour_sizes.size,
+            "largest_tumour": tumour_sizes.max() if tumour_sizes.size else 0,
+            "mean_tumour_size": tumour_sizes.mean() if tumour_sizes.size else 0.
+        }
+
+        # fractions of the sites of each zonation type
+        with np.errstate(invalid='ignore', divide='ignore'):
+            is_apoptotic = (lattice.site_type == 2) & (lattice.cell_state == 2)
+            for prefix, is_counted in [("apoptotic_fraction", is_apoptotic), ("ecm_fraction", lattice.site_type == 5)]:
+                fractions = np.bincount(lattice.zonation_type[is_counted], minlength=n_zonation_types) / self.n_sites_of_zonation_type
+                codes = [code for code in sorted(ZONATION_TYPES) if code != ZONATION_TYPE_NA]
+                metrics.update(zip(get_zonation_metric_names(prefix), fractions[codes]))
+
+        histograms = {"tumour_sizes": get_size_histogram(tumour_sizes, self.summary.bin_edges)}
+
+        if self.track_lineages:
+            lineage_n_cells = lineages.n_cells
+            living_lineage_n_cells = lineage_n_cells[lineage_n_cells > 0]
+            metrics["n_lineages"] = living_lineage_n_cells.size
+            metrics["largest_clone"] = living_lineage_n_cells.max() if living_lineage_n_cells.size else 0
+            histograms["lineage_sizes"] = get_size_histogram(living_lineage_n_cells, self.summary.bin_edges)
+            lineages.record(t)
+            self.lineages = lineages
+
+        self.summary.add(t, metrics, histograms)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        # the metrics of the run, one row per time, one column per scalar metric
+        times = sorted(self.summary.moments)
+        table = pd.DataFrame([self.summary.moments[t]["metrics"].mean for t in times], columns=self.summary.metric_names)
+        table.insert(0, "time", times)
+        return table
+
+    def get_lineage_counts(self) -> pd.DataFrame:
+        # the sizes of all lineages at the recorded times, one row per time and lineage founded by then, see LineageTable.get_trajectories
+        if self.lineages is None:
+            return pd.DataFrame({"time": np.zeros(0), "lineage_id": np.zeros(0, dtype=np.int64), "n_cells": np.zeros(0, dtype=np.int64)})
+        return pd.DataFrame(self.lineages.get_trajectories()).rename(columns={"t": "time"})
@@ -0,0 +1,463 @@
+"""_summary_
+
+This Python script contains an optional backend of update_cell_states and implicit_immune_predation, selected with engine="numba",
+whose per-cell loops over the arrays of an ArrayLattice are compiled with numba. The kernels follow the rules of the loop engine:
+    - cancer cells on the active frontier are visited one by one in order of cell_id, updating the lattice as they go: each proliferative
+      cancer cell tries to grow into each of its adjacent NO sites with probability P_CC_GROW (in model_4, moving into it otherwise)
+    - hepatocytes are then processed once per adjacent proliferative cancer cell, as in update_cell_states
+    - in implicit_immune_predation, K of the N sites are attacked, K being the number of cancer cells, by selection sampling over the tumour sites,
+      and each cancer cell under attack is killed with probability P_CC_KILLED
+Random numbers are drawn inside the kernels, from the Mersenne Twister of np.random seeded once per call with a seed drawn from rng,
+so that a step only draws one number from rng. run_replicates_numba advances independent replicates in parallel, in a prange loop,
+each with the same results as running it alone with engine="numba".
+
+numba is optional: without it, the kernels run as pure Python functions, on the global np.random state (restored afterwards),
+with the same results, only slower.
+
+"""
+
+import contextlib
+import heapq
+
+import numpy as np
+
+from classes_and_functions.cell_classes import CancerCell, Hepatocyte, copy_cell_dictionary
+from classes_and_functions.lattice_classes import ArrayLattice, NO_CELL_ID, NO_CELL_STATE, ZONATION_TYPE_PERI_CENTRAL
+from classes_and_functions.vectorized_functions import add_cells, move_cells, set_cell_states, remove_cells, get_tumour_site_ids, \
+    get_lineage_ids, get_kill_probabilities
+from classes_and_functions.random_functions import get_rng
+from classes_and_functions.profiling_functions import mark_stage
+
+from typing import Dict, List, Tuple
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+NUMBA_AVAILABLE = numba is not None
+
+prange = numba.prange if NUMBA_AVAILABLE else range
+
+def jit(parallel: bool=False):
+    # compiles a kernel with numba if available, and leaves it as a pure Python function otherwise
+    def decorator(function):
+        if not NUMBA_AVAILABLE:
+            return function
+        return numba.njit(cache=True, parallel=parallel)(function)
+    return decorator
+
+@contextlib.contextmanager
+def kernel_random_state():
+    # kernels seed np.random, i.e. the global np.random state without numba, which is restored afterwards
+    if NUMBA_AVAILABLE:
+        yield
+        return
+    state = np.random.get_state()
+    try:
+        yield
+    finally:
+        np.random.set_state(state)
+
+def draw_kernel_seeds(rng: np.random.Generator=None, size=None):
+    # seeds of np.random.seed, drawn as uniform random numbers so that any generator (or the global np.random state) can draw them
+    if size is None:
+        return int(get_rng(rng).random() * 2**32)
+    return (get_rng(rng).random(size) * 2**32).astype(np.int64)
+
+@jit()
+def to_array(values) -> np.ndarray:
+    array = np.empty(len(values), dtype=np.int64)
+    for i in range(len(values)):
+        array[i] = values[i]
+    return array
+
+@jit()
+def update_cell_states_kernel(
+    site_type, cell_id, cell_state, zonation_type, adjacent_site_ids,
+    cancer_cell_ids, cancer_cell_site_ids, next_cell_id,
+    p_cc_grow, p_hep_damaged, p_hep_cleared, is_model_2, is_model_4, seed
+):
+    """_summary_
+
+    This function updates the lattice arrays in place for one step, visiting the given cancer cells in order of cell_id as update_cell_states does.
+
+    Args:
+        site_type, cell_id, cell_state, zonation_type, adjacent_site_ids (np.ndarray): the arrays of the lattice
+        cancer_cell_ids, cancer_cell_site_ids (np.ndarray): the cancer cells on the active frontier and their sites, in order of cell_id
+        next_cell_id (int): the id of the next cell born
+        p_cc_grow, p_hep_damaged, p_hep_cleared (float): parameters of the simulation (see settings.py)
+        is_model_2, is_model_4 (bool): whether fibrosis is considered, whether cancer cells move
+        seed (int): the seed of np.random
+
+    Returns:
+        Tuple[np.ndarray, ...]: the sites of the cancer cells born (with ids next_cell_id, next_cell_id+1, ...) and the ids of their parents,
+            the ids and new sites of the cancer cells moved,
+            the ids of the hepatocytes damaged, the ids of the hepatocytes removed (cleared or ECM deposited), and the sites whose site_type changed
+    """
+
+    np.random.seed(seed)
+    next_cell_id_at_start = next_cell_id
+
+    born_site_ids = [np.int64(0) for _ in range(0)]
+    born_parent_cell_ids = [np.int64(0) for _ in range(0)]
+    moved_cell_ids = [np.int64(0) for _ in range(0)]
+    moved_site_ids = [np.int64(0) for _ in range(0)]
+    damaged_cell_ids = [np.int64(0) for _ in range(0)]
+    removed_cell_ids = [np.int64(0) for _ in range(0)]
+    changed_site_ids = [np.int64(0) for _ in range(0)]
+    hep_site_ids = [np.int64(0) for _ in range(0)]
+
+    # a sorted list is a heap; in model_4, cancer cells next to a site emptied by a move join it during the step
+    cancer_cells_to_process = [(cancer_cell_ids[i], cancer_cell_site_ids[i]) for i in range(cancer_cell_ids.size)]
+    cancer_cell_ids_queued = set([cancer_cell_ids[i] for i in range(cancer_cell_ids.size)])
+
+    # update states of cancer cells
+    while len(cancer_cells_to_process) > 0:
+        cancer_cell_id, cancer_cell_site_id = heapq.heappop(cancer_cells_to_process)
+        if cell_state[cancer_cell_site_id] != 1: # only proliferative cancer cells grow
+            continue
+
+        site_id = cancer_cell_site_id
+        for k in range(adjacent_site_ids.shape[1]):
+            adjacent_site_id = np.int64(adjacent_site_ids[cancer_cell_site_id, k])
+            if adjacent_site_id < 0:
+                continue
+
+            if site_type[adjacent_site_id] == 3: # grow into NO "Not Occupied" adjacent site
+                if np.random.random() < p_cc_grow:
+                    site_type[adjacent_site_id] = 4
+                    cell_id[adjacent_site_id] = next_cell_id
+                    cell_state[adjacent_site_id] = 1
+                    next_cell_id += 1
+                    born_site_ids.append(adjacent_site_id)
+                    born_parent_cell_ids.append(cancer_cell_id)
+                    changed_site_ids.append(adjacent_site_id)
+
+                elif is_model_4: # move to the adjacent site
+                    site_type[site_id] = 3
+                    cell_id[site_id] = NO_CELL_ID
+                    cell_state[site_id] = NO_CELL_STATE
+                    site_type[adjacent_site_id] = 4
+                    cell_id[adjacent_site_id] = cancer_cell_id
+                    cell_state[adjacent_site_id] = 1
+                    changed_site_ids.append(site_id)
+                    changed_site_ids.append(adjacent_site_id)
+
+                    # cancer cells present at the start of the step, next to the emptied site and not processed yet, can now act
+                    for j in range(adjacent_site_ids.shape[1]):
+                        other_site_id = np.int64(adjacent_site_ids[site_id, j])
+                        if other_site_id < 0 or site_type[other_site_id] != 4:
+                            continue
+                        other_cell_id = cell_id[other_site_id]
+                        if cancer_cell_id < other_cell_id < next_cell_id_at_start and other_cell_id not in cancer_cell_ids_queued:
+                            heapq.heappush(cancer_cells_to_process, (other_cell_id, other_site_id))
+                            cancer_cell_ids_queued.add(other_cell_id)
+
+                    site_id = adjacent_site_id
+
+            elif site_type[adjacent_site_id] == 2:
+                hep_site_ids.append(adjacent_site_id)
+
+        if site_id != cancer_cell_site_id:
+            moved_cell_ids.append(cancer_cell_id)
+            moved_site_ids.append(site_id)
+
+    # update states of hepatocytes, once per adjacent proliferative cancer cell
+    for hep_site_id in hep_site_ids:
+        if site_type[hep_site_id] != 2: # cleared or ECM deposited earlier in the step
+            continue
+
+        if cell_state[hep_site_id] == 0: # quiescent hepatocytes turn apoptotic
+            is_damaged = False
+            for k in range(adjacent_site_ids.shape[1]):
+                adjacent_site_id = adjacent_site_ids[hep_site_id, k]
+                if adjacent_site_id >= 0 and site_type[adjacent_site_id] == 4:
+                    if np.random.random() < p_hep_damaged:
+                        is_damaged = True
+            if is_damaged:
+                cell_state[hep_site_id] = 2
+                damaged_cell_ids.append(cell_id[hep_site_id])
+
+        elif cell_state[hep_site_id] == 2: # apoptotic hepatocytes get cleared, or turn ECM deposited
+            if np.random.random() < p_hep_cleared:
+                new_site_type = 3
+            elif is_model_2 and zonation_type[hep_site_id] == ZONATION_TYPE_PERI_CENTRAL:
+                new_site_type = 5
+            else:
+                continue
+            removed_cell_ids.append(cell_id[hep_site_id])
+            site_type[hep_site_id] = new_site_type
+            cell_id[hep_site_id] = NO_CELL_ID
+            cell_state[hep_site_id] = NO_CELL_STATE
+            changed_site_ids.append(hep_site_id)
+
+    return to_array(born_site_ids), to_array(born_parent_cell_ids), to_array(moved_cell_ids), to_array(moved_site_ids), \
+        to_array(damaged_cell_ids), to_array(removed_cell_ids), to_array(changed_site_ids)
+
+@jit()
+def implicit_immune_predation_kernel(site_type, cell_id, cell_state, tumour_site_ids, n_sites, p_cc_killed, seed):
+    """_summary_
+
+    This function kills cancer cells under immune attack, updating the lattice arrays in place.
+    K sites out of N are attacked, K being the number of cancer cells: by selection sampling, the i-th tumour site is attacked
+    with probability (K - number of tumour sites attacked so far) / (N - i), which gives the same distribution as sampling the K sites.
+
+    Args:
+        site_type, cell_id, cell_state (np.ndarray): the arrays of the lattice
+        tumour_site_ids (np.ndarray): the K sites occupied by cancer cells
+        n_sites (int): the number N of lattice sites
+        p_cc_killed (np.ndarray): the probability of a cancer cell under attack being killed, as an array of shape (1,),
+            or the probabilities of the K cancer cells (e.g. per lineage)
+        seed (int): the seed of np.random
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: the sites and ids of the cancer cells killed
+    """
+
+    np.random.seed(seed)
+    n_tumour_sites = tumour_site_ids.size
+
+    killed_site_ids = [np.int64(0) for _ in range(0)]
+    killed_cell_ids = [np.int64(0) for _ in range(0)]
+    n_attacked = 0
+    for i in range(n_tumour_sites):
+        if n_attacked == n_tumour_sites:
+            break
+        if np.random.random() * (n_sites - i) < n_tumour_sites - n_attacked:
+            n_attacked += 1
+            if np.random.random() < p_cc_killed[i if p_cc_killed.size == n_tumour_sites else 0]:
+                site_id = np.int64(tumour_site_ids[i])
+                killed_site_ids.append(site_id)
+                killed_cell_ids.append(cell_id[site_id])
+                site_type[site_id] = 3
+                cell_id[site_id] = NO_CELL_ID
+                cell_state[site_id] = NO_CELL_STATE
+
+    return to_array(killed_site_ids), to_array(killed_cell_ids)
+
+@jit()
+def get_frontier_kernel(site_type, cell_id, adjacent_site_ids):
+    # the cancer cells with an adjacent HEP or NO site and their sites, in order of cell_id, as ActiveFrontier, from a scan of all sites
+    site_ids = [np.int64(0) for _ in range(0)]
+    for site_id in range(site_type.size):
+        if site_type[site_id] != 4:
+            continue
+        for k in range(adjacent_site_ids.shape[1]):
+            adjacent_site_id = adjacent_site_ids[site_id, k]
+            if adjacent_site_id >= 0 and (site_type[adjacent_site_id] == 2 or site_type[adjacent_site_id] == 3):
+                site_ids.append(site_id)
+                break
+    cancer_cell_site_ids = to_array(site_ids)
+    cancer_cell_ids = cell_id[cancer_cell_site_ids]
+    order = np.argsort(cancer_cell_ids)
+    return cancer_cell_ids[order], cancer_cell_site_ids[order]
+
+@jit(parallel=True)
+def run_replicates_kernel(
+    site_type, cell_id, cell_state, next_cell_ids, zonation_type, adjacent_site_ids,
+    p_cc_grow, p_hep_damaged, p_hep_cleared, p_cc_killed, is_model_2, is_model_3, is_model_4,
+    seeds, snapshot_times, snapshot_site_type, snapshot_cell_id
+):
+    # advances the replicates (rows of site_type, cell_id, cell_state) for T = seeds.shape[1] steps, in parallel,
+    # copying site_type and cell_id at snapshot times; the seeds of the step t of replicate r are seeds[r, t]
+    n_replicates, T = seeds.shape[0], seeds.shape[1]
+    for r in prange(n_replicates):
+        i_snapshot = 0
+        for t in range(T+1):
+            if i_snapshot < snapshot_times.size and snapshot_times[i_snapshot] == t:
+                snapshot_site_type[r, i_snapshot] = site_type[r]
+                snapshot_cell_id[r, i_snapshot] = cell_id[r]
+                i_snapshot += 1
+            if t == T:
+                break
+
+            cancer_cell_ids, cancer_cell_site_ids = get_frontier_kernel(site_type[r], cell_id[r], adjacent_site_ids)
+            born_site_ids, _, _, _, _, _, _ = update_cell_states_kernel(
+                site_type[r], cell_id[r], cell_state[r], zonation_type, adjacent_site_ids,
+                cancer_cell_ids, cancer_cell_site_ids, next_cell_ids[r],
+                p_cc_grow, p_hep_damaged, p_hep_cleared, is_model_2, is_model_4, seeds[r, t, 0]
+            )
+            next_cell_ids[r] += born_site_ids.size
+
+            if is_model_3:
+                tumour_site_ids = np.flatnonzero(site_type[r] == 4)
+                implicit_immune_predation_kernel(
+                    site_type[r], cell_id[r], cell_state[r], tumour_site_ids, site_type.shape[1], np.full(1, p_cc_killed), seeds[r, t, 1]
+                )
+
+def update_cell_states_numba(
+    cell_dictionaries: Dict[str, Dict],
+    lattice: ArrayLattice,
+    parameters: Dict[str, float],
+    CancerCell: CancerCell,
+    Hepatocyte: Hepatocyte,
+    model_type: str="model_1",
+    rng: np.random.Generator=None
+) -> Tuple[Dict, ArrayLattice]:
+    """_summary_
+
+    This function simulates cancer cell proliferation and migration, hepatocyte death, with cell_dictionaries and lattice updated accordingly,
+    updating cells one by one in a compiled kernel (see update_cell_states_kernel).
+
+    Args:
+        cell_dictionaries (Dict[str, Dict]): a Dict of Dict containing the CancerCell and Hepatocyte objects
+        lattice (ArrayLattice): the lattice following initialisation of CancerCell objects
+        parameters (Dict[str, float]): parameters to be used in the simulation (see settings.py)
+        CancerCell (CancerCell): the CancerCell class used for creating new CancerCell objects
+        Hepatocyte (Hepatocyte): the Hepatocyte class used for creating new Hepatocyte objects
+        model_type (str, optional): model type to implement in the simulation. Defaults to "model_1".
+        rng (np.random.Generator, optional): the random number generator of the simulation, drawing the seed of the kernel. Defaults to None, i.e. the global np.random state.
+
+    Returns:
+        Tuple[Dict, ArrayLattice]: an updated Dict of Dict containing the CancerCell and Hepatocyte objects (with updated attributes; newly created and deleted objects), and the updated lattice
+    """
+
+    seed = draw_kernel_seeds(rng)
+
+    dict_of_cancer_cells, dict_of_hepatocytes = \
+        cell_dictionaries['CancerCell'], cell_dictionaries['Hepatocyte']
+
+    new_dict_of_cancer_cells = copy_cell_dictionary(dict_of_cancer_cells)
+    new_dict_of_hepatocytes  = copy_cell_dictionary(dict_of_hepatocytes)
+    mark_stage("copy")
+
+    frontier = lattice.get_frontier()
+    cancer_cell_site_ids = frontier.get_site_ids()
+    cancer_cell_ids = lattice.cell_id[cancer_cell_site_ids]
+    order = np.argsort(cancer_cell_ids)
+
+    with kernel_random_state():
+        born_site_ids, born_parent_cell_ids, moved_cell_ids, moved_site_ids, damaged_cell_ids, removed_cell_ids, changed_site_ids = \
+            update_cell_states_kernel(
+                lattice.site_type, lattice.cell_id, lattice.cell_state, np.asarray(lattice.zonation_type), np.asarray(lattice.adjacent_site_ids),
+                cancer_cell_ids[order], cancer_cell_site_ids[order], lattice.cell_id_allocator.next_cell_id,
+                parameters['P_CC_GROW'], parameters['P_HEP_DAMAGED'], parameters['P_HEP_CLEARED'],
+                model_type == "model_2", model_type == "model_4", seed
+            )
+    mark_stage("kernel")
+
+    move_cells(new_dict_of_cancer_cells, moved_cell_ids, moved_site_ids, lattice)
+    born_cell_ids = lattice.cell_id_allocator.allocate_many(born_site_ids.size)
+    add_cells(
+        new_dict_of_cancer_cells, CancerCell, born_cell_ids, born_site_ids, 1, lattice, # proliferative
+        lineage_ids=get_lineage_ids(new_dict_of_cancer_cells, born_parent_cell_ids) # of their parents
+    )
+    set_cell_states(new_dict_of_hepatocytes, damaged_cell_ids, 2) # apoptotic
+    remove_cells(new_dict_of_hepatocytes, removed_cell_ids)
+    mark_stage("cells")
+
+    frontier.update(lattice, changed_site_ids)
+    mark_stage("frontier")
+
+    new_cell_dictionaries = {
+        "CancerCell": new_dict_of_cancer_cells, "Hepatocyte": new_dict_of_hepatocytes
+    }
+
+    return new_cell_dictionaries, lattice
+
+def implicit_immune_predation_numba(
+    cell_dictionaries: Dict[str, Dict],
+    lattice: ArrayLattice,
+    parameters: Dict[str, float],
+    rng: np.random.Generator=None
+) -> Tuple[Dict, ArrayLattice]:
+    """_summary_
+
+    This function simulates cancer cell death (implicitly killed by cytotoxic immune cells), with cell_dictionaries and lattice updated accordingly,
+    killing cells in a compiled kernel (see implicit_immune_predation_kernel).
+
+    Args:
+        cell_dictionaries (Dict[str, Dict]): a Dict of Dict containing the CancerCell and Hepatocyte objects
+        lattice (ArrayLattice): the lattice following initialisation of CancerCell objects
+        parameters (Dict[str, float]): parameters to be used in the simulation (see settings.py)
+        rng (np.random.Generator, optional): the random number generator of the simulation, drawing the seed of the kernel. Defaults to None, i.e. the global np.random state.
+
+    Returns:
+        Tuple[Dict, ArrayLattice]: an updated Dict of Dict containing the CancerCell and Hepatocyte objects (with updated attributes; newly created and deleted objects), and the updated lattice
+    """
+
+    seed = draw_kernel_seeds(rng)
+
+    dict_of_cancer_cells, dict_of_hepatocytes = \
+        cell_dictionaries['CancerCell'], cell_dictionaries['Hepatocyte']
+
+    new_dict_of_cancer_cells = copy_cell_dictionary(dict_of_cancer_cells)
+    new_dict_of_hepatocytes  = copy_cell_dictionary(dict_of_hepatocytes)
+
+    tumour_site_ids = get_tumour_site_ids(dict_of_cancer_cells, lattice)
+    p_cc_killed = get_kill_probabilities(dict_of_cancer_cells, lattice, tumour_site_ids, parameters['P_CC_KILLED'])
+    with kernel_random_state():
+        killed_site_ids, killed_cell_ids = implicit_immune_predation_kernel(
+            lattice.site_type, lattice.cell_id, lattice.cell_state, tumour_site_ids, lattice.n_sites,
+            np.atleast_1d(np.asarray(p_cc_killed, dtype=np.float64)), seed
+        )
+    mark_stage("kill")
+
+    remove_cells(new_dict_of_cancer_cells, killed_cell_ids)
+    lattice.update_frontier(killed_site_ids)
+    mark_stage("frontier")
+
+    new_cell_dictionaries = {
+        "CancerCell": new_dict_of_cancer_cells, "Hepatocyte": new_dict_of_hepatocytes
+    }
+
+    return new_cell_dictionaries, lattice
+
+def run_replicates_numba(
+    lattices: List[ArrayLattice],
+    parameters: Dict[str, float],
+    model_type: str,
+    T: int,
+    rngs: List[np.random.Generator],
+    snapshot_times: List[int]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """_summary_
+
+    This function advances replicates of a simulation from their lattices for T steps, in parallel over the replicates (prange).
+    Every replicate gives the same lattices as T steps of update_cell_states (and implicit_immune_predation in model_3) with engine="numba"
+    and the same rng, but only the lattices are updated, not the cells.
+
+    Args:
+        lattices (List[ArrayLattice]): the lattices of the R replicates, after init_cell_dictionaries, with the same geometry; updated in place
+        parameters (Dict[str, float]): parameters to be used in the simulation (see settings.py)
+        model_type (str): model type to implement in the simulation
+        T (int): the number of time steps
+        rngs (List[np.random.Generator]): the random number generators of the replicates
+        snapshot_times (List[int]): the times at which the lattices are recorded
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: the site_type and cell_id arrays of the replicates at snapshot times, of shape (R, number of snapshot times, N)
+    """
+
+    snapshot_times = np.array(sorted(set(t for t in snapshot_times if 0 <= t <= T)), dtype=np.int64)
+    n_replicates, n_sites = len(lattices), lattices[0].n_sites
+
+    # the seeds of every step, in the order update_cell_states and implicit_immune_predation draw them
+    n_seeds_per_step = 2 if model_type == "model_3" else 1
+    seeds = np.zeros((n_replicates, T, 2), dtype=np.int64)
+    for r, rng in enumerate(rngs):
+        seeds[r, :, :n_seeds_per_step] = draw_kernel_seeds(rng, (T, n_seeds_per_step))
+
+    site_type = np.stack([lattice.site_type for lattice in lattices])
+    cell_id = np.stack([lattice.cell_id for lattice in lattices])
+    cell_state = np.stack([lattice.cell_state for lattice in lattices])
+    next_cell_ids = np.array([lattice.cell_id_allocator.next_cell_id for lattice in lattices], dtype=np.int64)
+    snapshot_site_type = np.empty((n_replicates, snapshot_times.size, n_sites), dtype=site_type.dtype)
+    snapshot_cell_id = np.empty((n_replicates, snapshot_times.size, n_sites), dtype=cell_id.dtype)
+
+    with kernel_random_state():
+        run_replicates_kernel(
+            site_type, cell_id, cell_state, next_cell_ids,
+            np.asarray(lattices[0].zonation_type), np.asarray(lattices[0].adjacent_site_ids),
+            parameters['P_CC_GROW'], parameters['P_HEP_DAMAGED'], parameters['P_HEP_CLEARED'], parameters.get('P_CC_KILLED', 0.0),
+            model_type == "model_2", model_type == "model_3", model_type == "model_4",
+            seeds, snapshot_times, snapshot_site_type, snapshot_cell_id
+        )
+
+    for r, lattice in enumerate(lattices):
+        lattice.site_type[:], lattice.cell_id[:], lattice.cell_state[:] = site_type[r], cell_id[r], cell_state[r]
+        lattice.cell_id_allocator.set_state({"next_cell_id": next_cell_ids[r]})
+        lattice.frontier = None # rebuilt on first use
+
+    return snapshot_site_type, snapshot_cell_id
@@ -0,0 +1,188 @@
+"""_summary_
+
+This Python script contains an opt-in profiler of simulations, recording for every call of a profiled stage
+(update_cell_states, implicit_immune_predation, get_tumour_sizes, SnapshotWriter.write, GillespieSimulation.run_until)
+    - the wall time of the stage, and of its sub-stages marked with mark_stage (e.g. cancer_cells and hepatocytes in update_cell_states)
+    - the events of the stage, counted from the lattice before and after it: births, moves, apoptosis, clearances, ECM conversions, kills
+    - the peak resident memory of the process so far, and, with trace_memory=True, the peak memory allocated during the stage
+as a tidy table, one row per stage call, with step the number of calls of update_cell_states (or run_until) before it.
+
+Profiling is enabled within a `with Profiler() as profiler:` block. Without an active profiler, a profiled function only checks
+a global variable before running, and mark_stage returns at once.
+
+"""
+
+import functools
+import inspect
+import resource
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from typing import Callable, Dict
+
+EVENT_NAMES = ["births", "moves", "apoptosis", "clearances", "ecm_conversions", "kills"]
+STEP_STAGES = ["update_cell_states", "run_until"] # the stages that advance the step
+
+ACTIVE_PROFILER = None
+
+def get_lattice_state(lattice) -> Dict:
+    # copies of the arrays of an ArrayLattice that events change, None for other lattices (e.g. DataFrames)
+    if not hasattr(lattice, "cell_id_allocator"):
+        return None
+    return {
+        "site_type": lattice.site_type.copy(), "cell_id": lattice.cell_id.copy(), "cell_state": lattice.cell_state.copy(),
+        "next_cell_id": lattice.cell_id_allocator.next_cell_id
+    }
+
+def count_events(before: Dict, after: Dict) -> Dict[str, int]:
+    """_summary_
+
+    This function counts the events between two states of a lattice.
+
+    Args:
+        before (Dict): the state of the lattice before the stage, see get_lattice_state
+        after (Dict): the state of the lattice after the stage
+
+    Returns:
+        Dict[str, int]: the numbers of births, moves, apoptosis, clearances, ecm_conversions and kills
+    """
+
+    was_hep, is_hep = before["site_type"] == 2, after["site_type"] == 2
+    was_quiescent = was_hep & (before["cell_state"] == 0)
+
+    # cancer cells are matched by cell_id, to tell moves and kills apart
+    was_cancer_cell, is_cancer_cell = before["site_type"] == 4, after["site_type"] == 4
+    cancer_cell_ids_before, cancer_cell_ids_after = before["cell_id"][was_cancer_cell], after["cell_id"][is_cancer_cell]
+    _, i_before, i_after = np.intersect1d(cancer_cell_ids_before, cancer_cell_ids_after, assume_unique=True, return_indices=True)
+    site_ids_before, site_ids_after = np.flatnonzero(was_cancer_cell), np.flatnonzero(is_cancer_cell)
+
+    return {
+        "births": int(after["next_cell_id"] - before["next_cell_id"]),
+        "moves": int(np.count_nonzero(site_ids_before[i_before] != site_ids_after[i_after])),
+        # quiescent hepatocytes can only leave their state by turning apoptotic, possibly cleared in the same step
+        "apoptosis": int(np.count_nonzero(was_quiescent & ~(is_hep & (after["cell_state"] == 0)))),
+        "clearances": int(np.count_nonzero(was_hep & (after["site_type"] == 3))),
+        "ecm_conversions": int(np.count_nonzero(was_hep & (after["site_type"] == 5))),
+        "kills": int(cancer_cell_ids_before.size - i_before.size)
+    }
+
+def get_peak_rss_MB() -> float:
+    # the peak resident set size of the process, in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+class Profiler:
+    """_summary_
+
+    Collects the wall time, events and memory of the profiled stages called within a `with Profiler() as profiler:` block.
+    """
+
+    def __init__(self, trace_memory: bool=False):
+        """_summary_
+
+        Args:
+            trace_memory (bool, optional): whether to trace the peak memory allocated during every stage with tracemalloc,
+                which slows down allocations. Defaults to False.
+        """
+
+        self.trace_memory = trace_memory
+        self.records = []
+        self.step = 0
+        self.active_stages = [] # the stages being profiled, outermost first
+        self.last_mark_time = None
+        self.previous_profiler = None
+        self.is_tracing_memory = False # whether this profiler started tracemalloc, and stops it on exit
+
+    def __enter__(self) -> "Profiler":
+        global ACTIVE_PROFILER
+        self.previous_profiler, ACTIVE_PROFILER = ACTIVE_PROFILER, self
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.is_tracing_memory = True
+        return self
+
+    def __exit__(self, *args):
+        global ACTIVE_PROFILER
+        ACTIVE_PROFILER = self.previous_profiler
+        if self.is_tracing_memory:
+            tracemalloc.stop()
+            self.is_tracing_memory = False
+
+    def run_stage(self, stage: str, function: Callable, signature: inspect.Signature, args: tuple, kwargs: dict):
+        # calls the function of a stage, and records its wall time, events and memory
+        lattice = signature.bind_partial(*args, **kwargs).arguments.get("lattice")
+        before = get_lattice_state(lattice)
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+
+        self.active_stages.append(stage)
+        start = self.last_mark_time = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            wall_time = time.perf_counter() - start
+            self.active_stages.pop()
+
+        record = {"step": self.step, "stage": stage, "wall_time_s": wall_time}
+        record.update(count_events(before, get_lattice_state(lattice)) if before is not None else {name: np.nan for name in EVENT_NAMES})
+        record["peak_rss_MB"] = get_peak_rss_MB()
+        if self.trace_memory:
+            record["peak_traced_MB"] = tracemalloc.get_traced_memory()[1] / 2**20
+        self.records.append(record)
+
+        if stage in STEP_STAGES:
+            self.step += 1
+        return result
+
+    def mark(self, name: str):
+        # the time since the start of the stage, or since the previous mark, as a sub-stage of the innermost stage
+        now = time.perf_counter()
+        self.records.append({"step": self.step, "stage": f"{self.active_stages[-1]}.{name}", "wall_time_s": now - self.last_mark_time})
+        self.last_mark_time = now
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """_summary_
+
+        This function returns the records as a tidy table.
+
+        Returns:
+            pd.DataFrame: a DataFrame containing step, stage, wall_time_s, births, moves, apoptosis, clearances, ecm_conversions, kills,
+                peak_rss_MB (and peak_traced_MB with trace_memory=True), one row per stage call, sub-stages without events and memory
+        """
+
+        columns = ["step", "stage", "wall_time_s"] + EVENT_NAMES + ["peak_rss_MB"] + (["peak_traced_MB"] if self.trace_memory else [])
+        return pd.DataFrame(self.records, columns=columns)
+
+    def summarise(self) -> pd.DataFrame:
+        # per stage: number of calls, total, mean and maximum wall time, total events
+        profile = self.to_dataframe()
+        summary = profile.groupby("stage", sort=False).agg(
+            n_calls=("wall_time_s", "size"), total_time_s=("wall_time_s", "sum"),
+            mean_time_s=("wall_time_s", "mean"), max_time_s=("wall_time_s", "max"),
+            **{name: (name, "sum") for name in EVENT_NAMES}
+        )
+        return summary.reset_index()
+
+def profiled(stage: str) -> Callable:
+    # a decorator profiling the calls of a function as the given stage; nested calls of the same stage are profiled once
+    def decorator(function: Callable) -> Callable:
+        signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def profiled_function(*args, **kwargs):
+            profiler = ACTIVE_PROFILER
+            if profiler is None or stage in profiler.active_stages:
+                return function(*args, **kwargs)
+            return profiler.run_stage(stage, function, signature, args, kwargs)
+
+        return profiled_function
+
+    return decorator
+
+def mark_stage(name: str):
+    # marks the end of a sub-stage of the stage being profiled, if any
+    profiler = ACTIVE_PROFILER
+    if profiler is not None and profiler.active_stages:
+        profiler.mark(name)
@@ -0,0 +1,57 @@
+"""_summary_
+
+This Python script contains functions to create the random number generators of simulations.
+
+Every simulation draws its random numbers from its own numpy.random.Generator, passed as rng to the functions that need one.
+Replicates get independent streams, spawned from one SeedSequence, so that replicate i of a sweep of seed s can be replayed
+alone with get_replicate_rng(s, i). Without rng, the functions draw from the global np.random state, as before.
+
+"""
+
+import numpy as np
+
+from typing import List, Union
+
+def get_rng(rng: Union[np.random.Generator, None]=None):
+    # the given generator, or the global np.random state (which has the same random, choice and permutation methods)
+    return np.random if rng is None else rng
+
+def get_replicate_rngs(seed: int, n_replicates: int) -> List[np.random.Generator]:
+    """_summary_
+
+    This function creates independent generators for n replicates, spawned from the SeedSequence of the seed.
+
+    Args:
+        seed (int): the entropy of the root SeedSequence
+        n_replicates (int): the number of replicates
+
+    Returns:
+        List[np.random.Generator]: the generators of replicates 0, 1, ..., n_replicates-1
+    """
+
+    return [np.random.default_rng(seed_sequence) for seed_sequence in np.random.SeedSequence(seed).spawn(n_replicates)]
+
+def get_replicate_rng(seed: int, replicate: int) -> np.random.Generator:
+    # the generator of one replicate, the same as get_replicate_rngs(seed, n)[replicate] for any n > replicate
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(replicate,)))
+
+class RandomNumberBuffer:
+    """_summary_
+
+    Hands out uniform random numbers one at a time from batches drawn from a generator,
+    so that loops drawing one number per neighbour do not pay for one generator call per number.
+    """
+
+    def __init__(self, rng: Union[np.random.Generator, None]=None, batch_size: int=1024):
+        self.rng = get_rng(rng)
+        self.batch_size = batch_size
+        self.random_numbers = []
+        self.i = 0
+
+    def random(self) -> float:
+        if self.i == len(self.random_numbers):
+            self.random_numbers = self.rng.random(self.batch_size).tolist()
+            self.i = 0
+        random_number = self.random_numbers[self.i]
+        self.i += 1
+        return random_number
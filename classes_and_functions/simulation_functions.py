@@ -4,52 +4,119 @@ This Python script contains functions to simulate tumour growth and liver damage
 
 """
 
+import heapq
 import pandas as pd
-from classes_and_functions.cell_classes import CancerCell, Hepatocyte
+from classes_and_functions.cell_classes import CancerCell, Hepatocyte, copy_cell_dictionary
+from classes_and_functions.lattice_classes import ArrayLattice, NO_CELL_ID, NO_CELL_STATE, ZONATION_TYPE_PERI_CENTRAL
+from classes_and_functions.vectorized_functions import update_cell_states_vectorized, implicit_immune_predation_vectorized, \
+    get_tumour_site_ids, get_kill_probabilities, sample_killed_site_ids
+from classes_and_functions.numba_functions import update_cell_states_numba, implicit_immune_predation_numba
+from classes_and_functions.random_functions import RandomNumberBuffer
+from classes_and_functions.profiling_functions import profiled, mark_stage
 import numpy as np
 
-from typing import Dict, Tuple
+from typing import Dict, Tuple, Union
 
+ENGINES = ["loop", "vectorized", "numba"]
+
+@profiled("update_cell_states")
 def update_cell_states(
     cell_dictionaries: Dict[str, Dict],
-    lattice: pd.DataFrame,
+    lattice: Union[pd.DataFrame, ArrayLattice],
     parameters: Dict[str, float],
     CancerCell: CancerCell, 
     Hepatocyte: Hepatocyte,
-    model_type: str="model_1"
-) -> Tuple[Dict, pd.DataFrame]:
+    model_type: str="model_1",
+    engine: str="loop",
+    rng: np.random.Generator=None
+) -> Tuple[Dict, Union[pd.DataFrame, ArrayLattice]]:
     """_summary_
     
     This function simulates cancer cell proliferation and migration, hepatocyte death, with cell_dictionaries and lattice updated accordingly.
 
     Args:
         cell_dictionaries (Dict[str, Dict]): a Dict of Dict containing the CancerCell and Hepatocyte objects
-        lattice (pd.DataFrame): a DataFrame containing information following initialisation of CancerCell objects
+        lattice (Union[pd.DataFrame, ArrayLattice]): a DataFrame (or the equivalent ArrayLattice) containing information following initialisation of CancerCell objects
         parameters (Dict[str, float]): parameters to be used in the simulation (see settings.py)
         CancerCell (CancerCell): the CancerCell class used for creating new CancerCell objects
         Hepatocyte (Hepatocyte): the Hepatocyte class used for creating new Hepatocyte objects
         model_type (str, optional): model type to implement in the simulation. Defaults to "model_1".
+        engine (str, optional): "loop" to update cells one by one, "vectorized" to update all cells synchronously with batched array operations (see vectorized_functions.py),
+            or "numba" to update cells one by one in a compiled kernel (see numba_functions.py). Defaults to "loop".
+        rng (np.random.Generator, optional): the random number generator of the simulation (see random_functions.py). Defaults to None, i.e. the global np.random state.
 
     Returns:
-        Tuple[Dict, pd.DataFrame]: an updated Dict of Dict containing the CancerCell and Hepatocyte objects (with updated attributes; newly created and deleted objects)
+        Tuple[Dict, Union[pd.DataFrame, ArrayLattice]]: an updated Dict of Dict containing the CancerCell and Hepatocyte objects (with updated attributes; newly created and deleted objects), and the updated lattice
     """
     
+    if engine not in ENGINES:
+        raise ValueError(f"engine should be one of {ENGINES}, got {engine}")
+    
+    # a DataFrame lattice is converted to an ArrayLattice for O(1) site lookups (once, then cached in lattice.attrs), and updated in place afterwards
+    if isinstance(lattice, pd.DataFrame):
+        new_cell_dictionaries, array_lattice = update_cell_states(
+            cell_dictionaries=cell_dictionaries,
+            lattice=ArrayLattice.from_dataframe_cached(lattice).set_cell_states_from_cell_dictionaries(cell_dictionaries),
+            parameters=parameters,
+            CancerCell=CancerCell,
+            Hepatocyte=Hepatocyte,
+            model_type=model_type,
+            engine=engine,
+            rng=rng
+        )
+        return new_cell_dictionaries, array_lattice.update_dataframe(lattice)
+    
+    if engine == "vectorized":
+        return update_cell_states_vectorized(
+            cell_dictionaries=cell_dictionaries,
+            lattice=lattice,
+            parameters=parameters,
+            CancerCell=CancerCell,
+            Hepatocyte=Hepatocyte,
+            model_type=model_type,
+            rng=rng
+        )
+    
+    if engine == "numba":
+        return update_cell_states_numba(
+            cell_dictionaries=cell_dictionaries,
+            lattice=lattice,
+            parameters=parameters,
+            CancerCell=CancerCell,
+            Hepatocyte=Hepatocyte,
+            model_type=model_type,
+            rng=rng
+        )
     
     p_cc_grow = parameters['P_CC_GROW']
     p_hep_damaged = parameters['P_HEP_DAMAGED']
     p_hep_cleared = parameters['P_HEP_CLEARED']
+    
+    # uniform random numbers drawn in batches, one per Bernoulli trial
+    random_numbers = RandomNumberBuffer(rng)
 
     dict_of_cancer_cells, dict_of_hepatocytes = \
         cell_dictionaries['CancerCell'], cell_dictionaries['Hepatocyte']
         
-    new_dict_of_cancer_cells = dict_of_cancer_cells.copy()
-    new_dict_of_hepatocytes  = dict_of_hepatocytes.copy()
+    new_dict_of_cancer_cells = copy_cell_dictionary(dict_of_cancer_cells)
+    new_dict_of_hepatocytes  = copy_cell_dictionary(dict_of_hepatocytes)
+    mark_stage("copy")
         
     # ASSUME for now: only those hepatocytes adjacent to proliferative cancer cells need to be processed
     list_of_hep_ids_to_process = []
+    
+    # only cancer cells on the active frontier can act (see ActiveFrontier), visited in order of cell_id as in dict_of_cancer_cells;
+    # in model_4, cancer cells next to a site emptied by a move join the frontier during the step
+    frontier = lattice.get_frontier()
+    cancer_cell_ids_to_process = np.sort(lattice.cell_id[frontier.get_site_ids()]).tolist() # a sorted list is a heap
+    cancer_cell_ids_queued = set(cancer_cell_ids_to_process)
+    next_cell_id_at_start = lattice.cell_id_allocator.next_cell_id
+    changed_site_ids = [] # sites whose site_type changes, to update the frontier
         
     # update states of cancer cells  
-    for cancer_cell_id, cancer_cell in dict_of_cancer_cells.items():
+    while cancer_cell_ids_to_process:
+        cancer_cell_id = heapq.heappop(cancer_cell_ids_to_process)
+        cancer_cell = dict_of_cancer_cells[cancer_cell_id]
         # cancer_cell_attributes = cancer_cell.attributes
         cancer_cell_attributes = cancer_cell.get_attributes()
         
@@ -59,31 +126,24 @@ def update_cell_states(
         cancer_cell_position = cancer_cell_attributes['cell_position']
         
         # get adjacent site ids
-        adjacent_site_ids_str = lattice.loc[
-            lattice.site_id==cancer_cell_site_id,
-            "adjacent_site_ids_str"
-        ].values[0]
-        adjacent_site_ids = [
-            int(str) for str in adjacent_site_ids_str.split(',')
-        ]
+        adjacent_site_ids = lattice.get_adjacent_site_ids(cancer_cell_site_id)
         
         # proliferative cancer cells grow
         if cancer_cell_state == 1:
             
             # interate over adjacent sites
             for adjacent_site_id in adjacent_site_ids:
-                adjacent_site_type, adjacent_site_x, adjacent_site_y, adjacent_site_cell_id = lattice.loc[
-                    lattice.site_id==adjacent_site_id, 
-                    ["site_type", 'x', 'y', 'cell_id']
-                ].values[0]
+                adjacent_site_type = lattice.site_type[adjacent_site_id]
+                adjacent_site_x, adjacent_site_y = lattice.x[adjacent_site_id], lattice.y[adjacent_site_id]
+                adjacent_site_cell_id = lattice.cell_id[adjacent_site_id]
                 
                 # grow into NO "Not Occupied" adjacent site
                 if adjacent_site_type == 3: # site type = "NO"
-                    if np.random.random() < p_cc_grow: # grow to the adjacent site
+                    if random_numbers.random() < p_cc_grow: # grow to the adjacent site
                         
                         # add a new CancerCell
-                        new_cancer_cell_id = int(lattice.cell_id.max() + 1)
-                        new_cancer_cell_site_id = adjacent_site_id
+                        new_cancer_cell_id = lattice.cell_id_allocator.allocate()
+                        new_cancer_cell_site_id = int(adjacent_site_id)
                         
                         new_cancer_cell_xy = (adjacent_site_x, adjacent_site_y)
 
@@ -92,6 +152,8 @@ def update_cell_states(
                             "cell_position": new_cancer_cell_xy,
                             "cell_state": 1 # proliferative 
                         }
+                        if "lineage_id" in cancer_cell_attributes: # the lineage of the parent, if tracked
+                            new_cancer_cell_attributes["lineage_id"] = cancer_cell_attributes["lineage_id"]
 
                         ## [1] create cancer cell object
                         new_cancer_cell = CancerCell(cell_attributes=new_cancer_cell_attributes)
@@ -99,10 +161,10 @@ def update_cell_states(
                         new_dict_of_cancer_cells |= {new_cancer_cell_id: new_cancer_cell}
                         
                         ## [2] update lattice
-                        lattice.loc[
-                            lattice.site_id==adjacent_site_id, 
-                            ["site_type", "cell_id"]
-                        ] = (4, new_cancer_cell_id) # sitetype = cancer cell
+                        lattice.site_type[adjacent_site_id] = 4 # sitetype = cancer cell
+                        lattice.cell_id[adjacent_site_id] = new_cancer_cell_id
+                        lattice.cell_state[adjacent_site_id] = 1
+                        changed_site_ids.append(new_cancer_cell_site_id)
                         
                     else:
                         if model_type=="model_4": # move to the adjacent site
@@ -110,7 +172,7 @@ def update_cell_states(
                             # update the attributes
                             # ... site id
                             # ... xy position
-                            cancer_cell_site_id_new = adjacent_site_id
+                            cancer_cell_site_id_new = int(adjacent_site_id)
                             cancer_cell_xy_new = (adjacent_site_x, adjacent_site_y)
                             updated_cancer_cell_attributes = {
                                 "cell_id": cancer_cell_id, "site_id": cancer_cell_site_id_new,
@@ -122,20 +184,32 @@ def update_cell_states(
                             # update the lattice site
                             # ... previous site to be emptied 
                             # ... new site to be filled 
-                            lattice.loc[
-                                lattice.site_id==cancer_cell_site_id, 
-                                ["site_type", "cell_id"]
-                            ] = (3, np.nan) # sitetype = not occupied 
-                            lattice.loc[
-                                lattice.site_id==cancer_cell_site_id_new, 
-                                ["site_type", "cell_id"]
-                            ] = (4, cancer_cell_id) # sitetype = cancer cell
+                            lattice.site_type[cancer_cell_site_id] = 3 # sitetype = not occupied 
+                            lattice.cell_id[cancer_cell_site_id] = NO_CELL_ID
+                            lattice.cell_state[cancer_cell_site_id] = NO_CELL_STATE
+                            lattice.site_type[cancer_cell_site_id_new] = 4 # sitetype = cancer cell
+                            lattice.cell_id[cancer_cell_site_id_new] = cancer_cell_id
+                            lattice.cell_state[cancer_cell_site_id_new] = 1
+                            changed_site_ids.extend([cancer_cell_site_id, cancer_cell_site_id_new])
+                            
+                            # cancer cells present at the start of the step, next to the emptied site and not processed yet, can now act
+                            for site_id in lattice.get_adjacent_site_ids(cancer_cell_site_id).tolist():
+                                cell_id = int(lattice.cell_id[site_id])
+                                if lattice.site_type[site_id] == 4 and cancer_cell_id < cell_id < next_cell_id_at_start \
+                                    and cell_id not in cancer_cell_ids_queued:
+                                    heapq.heappush(cancer_cell_ids_to_process, cell_id)
+                                    cancer_cell_ids_queued.add(cell_id)
+                            
+                            # the cell now occupies the new site, which is emptied instead if it moves again
+                            cancer_cell_site_id = cancer_cell_site_id_new
                         
                 elif adjacent_site_type == 2: # site type = "HEP"
-                    list_of_hep_ids_to_process.append(adjacent_site_cell_id)
+                    list_of_hep_ids_to_process.append(int(adjacent_site_cell_id))
                 
                 # (more conditions...)
         
+    mark_stage("cancer_cells")
+    
     # update states of hepatocytes
     # list_of_hep_ids_to_process = list(dict_of_hepatocytes.keys())
     
@@ -162,44 +236,36 @@ def update_cell_states(
         hep_site_id = hep_attributes['site_id']
         
         # get adjacent site ids
-        adjacent_site_ids_str = lattice.loc[
-            lattice.site_id==hep_site_id,
-            "adjacent_site_ids_str"
-        ].values[0]
-        adjacent_site_ids = [
-            int(str) for str in adjacent_site_ids_str.split(',')
-        ]
+        adjacent_site_ids = lattice.get_adjacent_site_ids(hep_site_id)
         
         # quiescent hepatocytes change cell states
         if hep_state == 0:
         
             # interate over adjacent sites
             for adjacent_site_id in adjacent_site_ids:
-                adjacent_site_type, adjacent_site_x, adjacent_site_y = lattice.loc[
-                    lattice.site_id==adjacent_site_id, 
-                    ["site_type", 'x', 'y']
-                ].values[0]
+                adjacent_site_type = lattice.site_type[adjacent_site_id]
                 
                 # turn into apoptotic state if a proliferative cancer cell is adjacent
                 if adjacent_site_type == 4: # site type = "CC"
-                    if np.random.random() < p_hep_damaged:
+                    if random_numbers.random() < p_hep_damaged:
                         updated_hep_attributes = hep_attributes.copy()
                         updated_hep_attributes['cell_state'] = 2
                         hep.attributes = updated_hep_attributes
                         new_dict_of_hepatocytes[hep_id] = hep
+                        lattice.cell_state[hep_site_id] = 2
                     
         # apoptotic hepatocytes get cleared
         elif hep_state == 2:
-            if np.random.random() < p_hep_cleared: # get cleared
+            if random_numbers.random() < p_hep_cleared: # get cleared
                 
                 # [1] delete this hepatocyte 
                 del new_dict_of_hepatocytes[hep_id]
                 
                 # [2] update lattice site type
-                lattice.loc[
-                    lattice.site_id==hep_site_id, 
-                    ["site_type", "cell_id"]
-                ] = (3, np.nan) # change to Not Occupied
+                lattice.site_type[hep_site_id] = 3 # change to Not Occupied
+                lattice.cell_id[hep_site_id] = NO_CELL_ID
+                lattice.cell_state[hep_site_id] = NO_CELL_STATE
+                changed_site_ids.append(hep_site_id)
                 
             else: # not get cleared
                 
@@ -208,24 +274,27 @@ def update_cell_states(
                 
                 elif model_type=="model_2": # fibrosis is considered; for simplicity, for apoptotic hepatocytes not cleared, they turn ECM deposited
                     
-                    if lattice.loc[
-                        lattice.site_id==hep_site_id
-                    ].zonation_type.values[0]=="peri-central": # check if this hepatocyte is located in peri-zonal zonation
+                    if lattice.zonation_type[hep_site_id]==ZONATION_TYPE_PERI_CENTRAL: # check if this hepatocyte is located in peri-zonal zonation
                     
                         # [1] delete this hepatocyte 
                         del new_dict_of_hepatocytes[hep_id]
                         
                         # [2] update lattice site type
-                        lattice.loc[
-                            lattice.site_id==hep_site_id, 
-                            ["site_type", "cell_id"]
-                        ] = (5, np.nan) # change to ECM
+                        lattice.site_type[hep_site_id] = 5 # change to ECM
+                        lattice.cell_id[hep_site_id] = NO_CELL_ID
+                        lattice.cell_state[hep_site_id] = NO_CELL_STATE
+                        changed_site_ids.append(hep_site_id)
                     
                     # (to be considered) whether or not to introduce ECM as a class
 
             # (more actions)
 
         # (more conditions)
+    
+    mark_stage("hepatocytes")
+    
+    frontier.update(lattice, changed_site_ids)
+    mark_stage("frontier")
                 
     new_cell_dictionaries = {
         "CancerCell": new_dict_of_cancer_cells, "Hepatocyte": new_dict_of_hepatocytes
@@ -233,69 +302,97 @@ def update_cell_states(
     
     return new_cell_dictionaries, lattice
 
+@profiled("implicit_immune_predation")
 def implicit_immune_predation(
     cell_dictionaries: Dict[str, Dict],
-    lattice: pd.DataFrame,
+    lattice: Union[pd.DataFrame, ArrayLattice],
     parameters: Dict[str, float],
-    model_type: str="model_3"
-) -> Tuple[Dict, pd.DataFrame]:
+    model_type: str="model_3",
+    engine: str="loop",
+    rng: np.random.Generator=None
+) -> Tuple[Dict, Union[pd.DataFrame, ArrayLattice]]:
     """_summary_
     
     This function simulates cancer cell death (implicitly killed by cytotoxic immune cells), with cell_dictionaries and lattice updated accordingly
 
     Args:
         cell_dictionaries (Dict[str, Dict]): a Dict of Dict containing the CancerCell and Hepatocyte objects
-        lattice (pd.DataFrame): a DataFrame containing information following initialisation of CancerCell objects
+        lattice (Union[pd.DataFrame, ArrayLattice]): a DataFrame (or the equivalent ArrayLattice) containing information following initialisation of CancerCell objects
         parameters (Dict[str, float]): parameters to be used in the simulation (see settings.py)
         model_type (str, optional): model type to implement in the simulation. Defaults to "model_3".
+        engine (str, optional): "loop" to kill cells one by one, "vectorized" to kill all cells in one batch (see vectorized_functions.py),
+            or "numba" to kill cells one by one in a compiled kernel (see numba_functions.py). Defaults to "loop".
+        rng (np.random.Generator, optional): the random number generator of the simulation (see random_functions.py). Defaults to None, i.e. the global np.random state.
 
     Returns:
-        Tuple[Dict, pd.DataFrame]: an updated Dict of Dict containing the CancerCell and Hepatocyte objects (with updated attributes; newly created and deleted objects)
+        Tuple[Dict, Union[pd.DataFrame, ArrayLattice]]: an updated Dict of Dict containing the CancerCell and Hepatocyte objects (with updated attributes; newly created and deleted objects), and the updated lattice
     """
     
     if model_type not in ["model_3"]:
         print("model type is wrong! this function shouldn't be called!")
         return None
     
+    if engine not in ENGINES:
+        raise ValueError(f"engine should be one of {ENGINES}, got {engine}")
+    
+    # a DataFrame lattice is converted to an ArrayLattice for O(1) site lookups (once, then cached in lattice.attrs), and updated in place afterwards
+    if isinstance(lattice, pd.DataFrame):
+        new_cell_dictionaries, array_lattice = implicit_immune_predation(
+            cell_dictionaries=cell_dictionaries,
+            lattice=ArrayLattice.from_dataframe_cached(lattice).set_cell_states_from_cell_dictionaries(cell_dictionaries),
+            parameters=parameters,
+            model_type=model_type,
+            engine=engine,
+            rng=rng
+        )
+        return new_cell_dictionaries, array_lattice.update_dataframe(lattice)
+    
+    if engine == "vectorized":
+        return implicit_immune_predation_vectorized(
+            cell_dictionaries=cell_dictionaries,
+            lattice=lattice,
+            parameters=parameters,
+            rng=rng
+        )
+    
+    if engine == "numba":
+        return implicit_immune_predation_numba(
+            cell_dictionaries=cell_dictionaries,
+            lattice=lattice,
+            parameters=parameters,
+            rng=rng
+        )
+    
     p_cc_killed = parameters['P_CC_KILLED']
     
     dict_of_cancer_cells, dict_of_hepatocytes = \
         cell_dictionaries['CancerCell'], cell_dictionaries['Hepatocyte']
     
-    new_dict_of_cancer_cells = dict_of_cancer_cells.copy()
-    new_dict_of_hepatocytes  = dict_of_hepatocytes.copy()
+    new_dict_of_cancer_cells = copy_cell_dictionary(dict_of_cancer_cells)
+    new_dict_of_hepatocytes  = copy_cell_dictionary(dict_of_hepatocytes)
     
-    n_lattice_sites = lattice.shape[0]
-    n_lattice_sites_by_tumour = lattice.loc[lattice.site_type==4].shape[0]
-    lattice_tumour = lattice.loc[lattice.site_type==4].copy()
+    lattice_tumour_site_ids = get_tumour_site_ids(dict_of_cancer_cells, lattice)
     
-    # randomly sample K sites as being immune infiltrated/attacked
-    lattice_site_ids_immune_attack = np.random.choice(lattice.site_id.values, size=n_lattice_sites_by_tumour, replace=False)
+    # randomly sample K sites as being immune infiltrated/attacked, K being the number of sites occupied by cancer cells,
+    # and kill the cancer cells under attack with a probability (of their lineage, if set), drawing from the tumour sites only (see sample_killed_site_ids)
+    p_cc_killed = get_kill_probabilities(dict_of_cancer_cells, lattice, lattice_tumour_site_ids, p_cc_killed)
+    killed_site_ids = sample_killed_site_ids(lattice_tumour_site_ids, lattice.n_sites, p_cc_killed, rng=rng)
+    mark_stage("sample")
     
-    # get the list of cell ids under attack that are tumour
-    cancer_cell_ids_to_be_killed = lattice_tumour.loc[
-        lattice_tumour.site_id.isin(lattice_site_ids_immune_attack)
-    ].cell_id.values
-    
-    # kill cancer cells
-    for cancer_cell_id in cancer_cell_ids_to_be_killed:
-        cancer_cell = dict_of_cancer_cells[cancer_cell_id]
-        cancer_cell_attributes = cancer_cell.attributes
-        cancer_cell_site_id = cancer_cell_attributes['site_id']
-        cancer_cell_state = cancer_cell_attributes['cell_state']
-        cancer_cell_position = cancer_cell_attributes['cell_position']
+    for cancer_cell_site_id in killed_site_ids.tolist():
+        cancer_cell_id = int(lattice.cell_id[cancer_cell_site_id])
         
-        # killed with a probability
-        if np.random.random() < p_cc_killed:
-            
-            # [1] delete this hepatocyte 
-            del new_dict_of_cancer_cells[cancer_cell_id]
-            
-            # [2] update lattice site type
-            lattice.loc[
-                lattice.site_id==cancer_cell_site_id, 
-                ["site_type", "cell_id"]
-            ] = (3, np.nan) # change to Not Occupied
+        # [1] delete this cancer cell 
+        del new_dict_of_cancer_cells[cancer_cell_id]
+        
+        # [2] update lattice site type
+        lattice.site_type[cancer_cell_site_id] = 3 # change to Not Occupied
+        lattice.cell_id[cancer_cell_site_id] = NO_CELL_ID
+        lattice.cell_state[cancer_cell_site_id] = NO_CELL_STATE
+    
+    mark_stage("kill")
+    lattice.update_frontier(killed_site_ids)
+    mark_stage("frontier")
               
     new_cell_dictionaries = {
         "CancerCell": new_dict_of_cancer_cells, "Hepatocyte": new_dict_of_hepatocytes
@@ -0,0 +1,431 @@
+"""_summary_
+
+This Python script contains the SnapshotWriter and SnapshotReader classes, to record simulation snapshots on disk as the simulation proceeds,
+instead of concatenating copies of the lattice in memory, and the ChangeLogWriter and ChangeLogReader classes, to record the changes of
+the lattice between snapshots instead of full frames (see ChangeLogWriter).
+
+A snapshot directory contains
+    - metadata.json: the format version, the number of sites, the dtypes of the columns and the times of the snapshots recorded so far
+    - geometry/*.npy: the columns that do not change during a simulation (x, y, zonation_type, adjacent_site_ids), written once
+    - <column>.bin: the columns that change (site_type, cell_id, cell_state, and label if tumours are labelled), with one frame of N values
+      appended per snapshot, read back as memory-mapped arrays of shape (n_snapshots, N)
+so that the memory used while recording does not depend on the number of snapshots.
+
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from classes_and_functions.lattice_classes import ArrayLattice
+from classes_and_functions.analysis_functions import get_connected_components, NO_LABEL
+from classes_and_functions.profiling_functions import profiled
+
+from typing import Dict, List
+
+SNAPSHOT_FORMAT_VERSION = 1
+CHANGE_LOG_FORMAT_VERSION = 1
+
+GEOMETRY_COLUMNS = {
+    "x": np.float64,
+    "y": np.float64,
+    "zonation_type": np.uint8,
+    "adjacent_site_ids": np.int32
+}
+FRAME_COLUMNS = {
+    "site_type": np.uint8,
+    "cell_id": np.int64,
+    "cell_state": np.int8
+}
+LABEL_COLUMN = {"label": np.int32} # tumour labels, NO_LABEL for sites not occupied by cancer cells
+# a change of a site between two recorded times, with the cell id and cell state of the site after the change
+EVENT_DTYPE = np.dtype([
+    ("time", np.int32), ("site_id", np.int32), ("old_type", np.uint8), ("new_type", np.uint8), ("cell_id", np.int64), ("cell_state", np.int8)
+])
+# a recorded time of a change log, with the number of events up to it
+TIME_DTYPE = np.dtype([("time", np.int64), ("event_offset", np.int64)])
+
+def write_geometry(directory: str, lattice: ArrayLattice):
+    # the columns that do not change during a simulation, written once
+    os.makedirs(os.path.join(directory, "geometry"), exist_ok=True)
+    for name, dtype in GEOMETRY_COLUMNS.items():
+        np.save(os.path.join(directory, "geometry", f"{name}.npy"), getattr(lattice, name).astype(dtype, copy=False))
+
+def read_frames(directory: str, name: str, dtype: str, n_frames: int, n_sites: int) -> np.ndarray:
+    # the frames of a column appended to <name>.bin, memory-mapped, of shape (n_frames, n_sites)
+    shape = (n_frames, n_sites)
+    return np.memmap(os.path.join(directory, f"{name}.bin"), dtype=np.dtype(dtype), mode='r', shape=shape) \
+        if n_frames else np.zeros(shape, dtype=np.dtype(dtype))
+
+def get_tumour_labels_of_sites(lattice: ArrayLattice) -> np.ndarray:
+    # tumour labels of all sites, as in get_tumour_sizes, NO_LABEL for sites not occupied by cancer cells
+    tumour_site_ids = np.flatnonzero(lattice.site_type == 4)
+    labels = np.full(lattice.n_sites, NO_LABEL, dtype=np.int32)
+    labels[tumour_site_ids] = get_connected_components(tumour_site_ids, lattice.adjacent_site_ids[tumour_site_ids])
+    return labels
+
+class SnapshotWriter:
+    """_summary_
+
+    Appends snapshots of a lattice to a snapshot directory, writing the geometry once and, per snapshot,
+    only the columns that change during a simulation.
+    """
+
+    def __init__(self, directory: str, lattice: ArrayLattice, label_tumours: bool=True, overwrite: bool=False):
+        """_summary_
+
+        Args:
+            directory (str): the snapshot directory, created if needed
+            lattice (ArrayLattice): the lattice of the simulation, whose geometry is written once
+            label_tumours (bool, optional): whether to record tumour labels with every snapshot. Defaults to True.
+            overwrite (bool, optional): whether to overwrite the snapshots in an existing directory. Defaults to False.
+        """
+
+        if os.path.exists(os.path.join(directory, "metadata.json")) and not overwrite:
+            raise FileExistsError(f"{directory} already contains snapshots; pass overwrite=True to replace them")
+
+        self.directory = directory
+        self.n_sites = lattice.n_sites
+        self.columns = dict(FRAME_COLUMNS, **(LABEL_COLUMN if label_tumours else {}))
+        self.label_tumours = label_tumours
+        self.times = []
+
+        write_geometry(directory, lattice)
+
+        self.files = {name: open(os.path.join(directory, f"{name}.bin"), "wb") for name in self.columns}
+        self.write_metadata()
+
+    def write_metadata(self):
+        metadata = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "n_sites": self.n_sites,
+            "columns": {name: np.dtype(dtype).str for name, dtype in self.columns.items()},
+            "times": self.times
+        }
+        with open(os.path.join(self.directory, "metadata.json"), "w") as json_file:
+            json.dump(metadata, json_file)
+
+    @profiled("snapshot")
+    def write(self, t: int, lattice: ArrayLattice):
+        """_summary_
+
+        This function appends the snapshot of the lattice at time t.
+
+        Args:
+            t (int): the time of the snapshot
+            lattice (ArrayLattice): the lattice at time t
+        """
+
+        if lattice.n_sites != self.n_sites:
+            raise ValueError(f"the lattice should have {self.n_sites} sites, got {lattice.n_sites}")
+
+        frame = {name: getattr(lattice, name) for name in FRAME_COLUMNS}
+        if self.label_tumours:
+            frame["label"] = get_tumour_labels_of_sites(lattice)
+
+        for name, dtype in self.columns.items():
+            self.files[name].write(np.ascontiguousarray(frame[name], dtype=dtype).tobytes())
+            self.files[name].flush()
+
+        # the metadata is updated after the frame is written, so that a snapshot listed in it is always complete
+        self.times.append(int(t))
+        self.write_metadata()
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+
+    def __enter__(self) -> "SnapshotWriter":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class SnapshotReader:
+    """_summary_
+
+    Reads the snapshots of a snapshot directory, with the frames of the changing columns memory-mapped.
+    """
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, "metadata.json")) as json_file:
+            metadata = json.load(json_file)
+        if metadata["format_version"] > SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"snapshot format version {metadata['format_version']} is not supported")
+
+        self.directory = directory
+        self.n_sites = metadata["n_sites"]
+        self.times = metadata["times"]
+        self.index_of_time = {t: i for i, t in enumerate(self.times)}
+        self.columns = list(metadata["columns"])
+
+        self.geometry = {
+            name: np.load(os.path.join(directory, "geometry", f"{name}.npy"), mmap_mode='r') for name in GEOMETRY_COLUMNS
+        }
+        self.frames = {name: read_frames(directory, name, dtype, len(self.times), self.n_sites) for name, dtype in metadata["columns"].items()}
+
+    def get_frame(self, t: int) -> Dict[str, np.ndarray]:
+        # the changing columns at time t, memory-mapped
+        i = self.index_of_time[t]
+        return {name: self.frames[name][i] for name in self.columns}
+
+    def get_lattice(self, t: int) -> ArrayLattice:
+        # the lattice at time t, with copies of the changing columns
+        frame = self.get_frame(t)
+        return ArrayLattice(
+            **self.geometry,
+            **{name: np.array(frame[name]) for name in FRAME_COLUMNS}
+        )
+
+    def get_snapshots(self, times: List[int]=None) -> pd.DataFrame:
+        """_summary_
+
+        This function returns snapshots as in 1_notebook_simulation.ipynb, i.e. lattice_in_simulation DataFrames with a time column, concatenated.
+
+        Args:
+            times (List[int], optional): the times of the snapshots. Defaults to None, i.e. all snapshots.
+
+        Returns:
+            pd.DataFrame: a DataFrame containing site_id, x, y, site_type, cell_id, adjacent_site_ids_str, zonation_type, time
+        """
+
+        snapshots = []
+        for t in (self.times if times is None else times):
+            snapshot_t = self.get_lattice(t).to_dataframe()
+            snapshot_t['time'] = t
+            snapshots.append(snapshot_t)
+
+        return pd.concat(snapshots, ignore_index=True) if snapshots else pd.DataFrame()
+
+    def get_tumour_labels(self, times: List[int]=None) -> pd.DataFrame:
+        """_summary_
+
+        This function returns the sites occupied by cancer cells with their tumour labels, as tumour_t_labelled of get_tumour_sizes with a time column.
+
+        Args:
+            times (List[int], optional): the times of the snapshots. Defaults to None, i.e. all snapshots.
+
+        Returns:
+            pd.DataFrame: a DataFrame containing site_id, x, y, site_type, cell_id, label, time
+        """
+
+        if "label" not in self.columns:
+            raise ValueError("tumour labels were not recorded; use SnapshotWriter(..., label_tumours=True)")
+
+        tumour_labels = []
+        for t in (self.times if times is None else times):
+            frame = self.get_frame(t)
+            tumour_site_ids = np.flatnonzero(frame["site_type"] == 4)
+            tumour_labels.append(pd.DataFrame({
+                "site_id": tumour_site_ids,
+                "x": self.geometry["x"][tumour_site_ids],
+                "y": self.geometry["y"][tumour_site_ids],
+                "site_type": frame["site_type"][tumour_site_ids],
+                "cell_id": frame["cell_id"][tumour_site_ids],
+                "label": frame["label"][tumour_site_ids].astype(np.int64),
+                "time": t
+            }))
+
+        return pd.concat(tumour_labels, ignore_index=True) if tumour_labels else pd.DataFrame()
+
+    def get_tumour_sizes(self, times: List[int]=None) -> pd.DataFrame:
+        # label, size and time of the tumours, as tumour_t_sizes of get_tumour_sizes with a time column
+        tumour_labels = self.get_tumour_labels(times)
+        if tumour_labels.empty:
+            return pd.DataFrame(columns=["label", "size", "time"])
+        return tumour_labels.groupby(["time", "label"], as_index=False).agg(size=("cell_id", "count"))[["label", "size", "time"]]
+
+class ChangeLogWriter:
+    """_summary_
+
+    Records a lattice at every call of write (e.g. every step) as an append-only change log, i.e. the sites whose site type, cell id or
+    cell state changed since the previous call, with a full frame (a keyframe) every keyframe_interval calls. Only a small set of sites
+    changes in a step, so that the log of every step takes far less space than frames at a few times.
+
+    A change log directory contains
+        - metadata.json: the format version, the number of sites, the dtypes of the columns and the keyframe interval, written once
+        - geometry/*.npy: as in a snapshot directory
+        - events.bin: the changes, appended in order of time as records of EVENT_DTYPE (time, site_id, old_type, new_type, cell_id, cell_state)
+        - times.bin: the times recorded so far, appended as records of TIME_DTYPE (time, number of events up to the time)
+        - <column>.bin: the keyframes of the columns that change (site_type, cell_id, cell_state), as the frames of a snapshot directory,
+          at the times of index 0, keyframe_interval, 2*keyframe_interval, ...
+    read back, lazily, by ChangeLogReader. A write appends to these files only, at a cost independent of the number of times recorded.
+    """
+
+    def __init__(self, directory: str, lattice: ArrayLattice, keyframe_interval: int=50, overwrite: bool=False):
+        """_summary_
+
+        Args:
+            directory (str): the change log directory, created if needed
+            lattice (ArrayLattice): the lattice of the simulation, whose geometry is written once
+            keyframe_interval (int, optional): the number of recorded times between keyframes. Defaults to 50.
+            overwrite (bool, optional): whether to overwrite the change log in an existing directory. Defaults to False.
+        """
+
+        if os.path.exists(os.path.join(directory, "metadata.json")) and not overwrite:
+            raise FileExistsError(f"{directory} already contains a change log; pass overwrite=True to replace it")
+        if keyframe_interval < 1:
+            raise ValueError("keyframe_interval should be at least 1")
+
+        self.directory = directory
+        self.n_sites = lattice.n_sites
+        self.keyframe_interval = keyframe_interval
+        self.n_times = 0
+        self.last_time = None
+        self.n_events = 0
+        self.frame = {name: getattr(lattice, name).astype(dtype) for name, dtype in FRAME_COLUMNS.items()} # at the last recorded time
+
+        write_geometry(directory, lattice)
+
+        self.events_file = open(os.path.join(directory, "events.bin"), "wb")
+        self.times_file = open(os.path.join(directory, "times.bin"), "wb")
+        self.keyframe_files = {name: open(os.path.join(directory, f"{name}.bin"), "wb") for name in FRAME_COLUMNS}
+        self.write_metadata()
+
+    def write_metadata(self):
+        metadata = {
+            "format_version": CHANGE_LOG_FORMAT_VERSION,
+            "n_sites": self.n_sites,
+            "columns": {name: np.dtype(dtype).str for name, dtype in FRAME_COLUMNS.items()},
+            "keyframe_interval": self.keyframe_interval
+        }
+        with open(os.path.join(self.directory, "metadata.json"), "w") as json_file:
+            json.dump(metadata, json_file)
+
+    @profiled("snapshot")
+    def write(self, t: int, lattice: ArrayLattice):
+        """_summary_
+
+        This function appends the changes of the lattice since the previous recorded time (or since the lattice given to the writer), and a keyframe
+        every keyframe_interval times.
+
+        Args:
+            t (int): the time, after the previous recorded time
+            lattice (ArrayLattice): the lattice at time t
+        """
+
+        if lattice.n_sites != self.n_sites:
+            raise ValueError(f"the lattice should have {self.n_sites} sites, got {lattice.n_sites}")
+        if self.last_time is not None and t <= self.last_time:
+            raise ValueError(f"the time should be after the last recorded time {self.last_time}, got {t}")
+
+        is_changed = np.zeros(self.n_sites, dtype=bool)
+        for name in FRAME_COLUMNS:
+            is_changed |= getattr(lattice, name) != self.frame[name]
+        changed_site_ids = np.flatnonzero(is_changed)
+
+        events = np.empty(changed_site_ids.size, dtype=EVENT_DTYPE)
+        events["time"] = t
+        events["site_id"] = changed_site_ids
+        events["old_type"] = self.frame["site_type"][changed_site_ids]
+        events["new_type"] = lattice.site_type[changed_site_ids]
+        events["cell_id"] = lattice.cell_id[changed_site_ids]
+        events["cell_state"] = lattice.cell_state[changed_site_ids]
+        self.events_file.write(events.tobytes())
+        self.events_file.flush()
+
+        for name in FRAME_COLUMNS:
+            self.frame[name][changed_site_ids] = getattr(lattice, name)[changed_site_ids]
+
+        if self.n_times % self.keyframe_interval == 0:
+            for name, dtype in FRAME_COLUMNS.items():
+                self.keyframe_files[name].write(np.ascontiguousarray(self.frame[name], dtype=dtype).tobytes())
+                self.keyframe_files[name].flush()
+
+        # the time is appended after the events and keyframe are written, so that a time listed in times.bin is always complete
+        self.n_times += 1
+        self.last_time = int(t)
+        self.n_events += changed_site_ids.size
+        self.times_file.write(np.array([(self.last_time, self.n_events)], dtype=TIME_DTYPE).tobytes())
+        self.times_file.flush()
+
+    def close(self):
+        self.events_file.close()
+        self.times_file.close()
+        for file in self.keyframe_files.values():
+            file.close()
+
+    def __enter__(self) -> "ChangeLogWriter":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class ChangeLogReader(SnapshotReader):
+    """_summary_
+
+    Reads a change log directory (see ChangeLogWriter) as a SnapshotReader of every recorded time, reconstructing the frame of a time on demand
+    from the last keyframe before it, or from the last frame reconstructed if that is closer, so that scrubbing forward through time only applies
+    the events in between. Tumour labels are computed from the reconstructed frames.
+    """
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, "metadata.json")) as json_file:
+            metadata = json.load(json_file)
+        if "keyframe_interval" not in metadata:
+            raise ValueError(f"{directory} is not a change log directory; use SnapshotReader")
+        if metadata["format_version"] > CHANGE_LOG_FORMAT_VERSION:
+            raise ValueError(f"change log format version {metadata['format_version']} is not supported")
+
+        self.directory = directory
+        self.n_sites = metadata["n_sites"]
+        # the complete records of times.bin, the last one possibly being written
+        n_times = os.path.getsize(os.path.join(directory, "times.bin")) // TIME_DTYPE.itemsize
+        times = np.fromfile(os.path.join(directory, "times.bin"), dtype=TIME_DTYPE, count=n_times)
+        self.times = times["time"].tolist()
+        self.index_of_time = {t: i for i, t in enumerate(self.times)}
+        self.columns = list(FRAME_COLUMNS) + list(LABEL_COLUMN)
+
+        self.geometry = {
+            name: np.load(os.path.join(directory, "geometry", f"{name}.npy"), mmap_mode='r') for name in GEOMETRY_COLUMNS
+        }
+        self.event_offsets = np.concatenate([[0], times["event_offset"]]) # events of time i in [event_offsets[i], event_offsets[i+1])
+        self.keyframe_indices = np.arange(0, n_times, metadata["keyframe_interval"], dtype=np.int64)
+        self.events = np.memmap(os.path.join(directory, "events.bin"), dtype=EVENT_DTYPE, mode='r', shape=(self.event_offsets[-1],)) \
+            if self.event_offsets[-1] else np.zeros(0, dtype=EVENT_DTYPE)
+        self.keyframes = {
+            name: read_frames(directory, name, dtype, len(self.keyframe_indices), self.n_sites) for name, dtype in metadata["columns"].items()
+        }
+        self.frame = None # the last frame reconstructed, and its index
+        self.frame_index = None
+
+    def get_events(self, start_time: int=None, end_time: int=None) -> pd.DataFrame:
+        # the events of the times in [start_time, end_time], one row per changed site and time
+        start = 0 if start_time is None else np.searchsorted(self.times, start_time, side='left')
+        end = len(self.times) if end_time is None else np.searchsorted(self.times, end_time, side='right')
+        return pd.DataFrame(np.array(self.events[self.event_offsets[start]:self.event_offsets[end]]))
+
+    def get_frame(self, t: int) -> Dict[str, np.ndarray]:
+        """_summary_
+
+        This function reconstructs the changing columns at time t, and the tumour labels.
+
+        Args:
+            t (int): a recorded time
+
+        Returns:
+            Dict[str, np.ndarray]: site_type, cell_id, cell_state and label of all sites at time t
+        """
+
+        i = self.index_of_time[t]
+        i_keyframe = np.searchsorted(self.keyframe_indices, i, side='right') - 1
+        if self.frame is None or not (self.keyframe_indices[i_keyframe] <= self.frame_index <= i):
+            self.frame = {name: np.array(self.keyframes[name][i_keyframe]) for name in FRAME_COLUMNS}
+            self.frame_index = self.keyframe_indices[i_keyframe]
+
+        # the events after the frame, up to time t, the last event of a site giving its state
+        events = self.events[self.event_offsets[self.frame_index+1]:self.event_offsets[i+1]]
+        _, i_last = np.unique(events["site_id"][::-1], return_index=True)
+        events = events[events.size - 1 - i_last]
+        self.frame["site_type"][events["site_id"]] = events["new_type"]
+        self.frame["cell_id"][events["site_id"]] = events["cell_id"]
+        self.frame["cell_state"][events["site_id"]] = events["cell_state"]
+        self.frame_index = i
+
+        frame = {name: self.frame[name].copy() for name in FRAME_COLUMNS}
+        tumour_site_ids = np.flatnonzero(frame["site_type"] == 4)
+        frame["label"] = np.full(self.n_sites, NO_LABEL, dtype=np.int32)
+        frame["label"][tumour_site_ids] = get_connected_components(tumour_site_ids, self.geometry["adjacent_site_ids"][tumour_site_ids])
+        return frame
@@ -0,0 +1,552 @@
+"""_summary_
+
+This Python script contains functions to run replicates of simulations over a grid of model types, seeding densities, durations and parameters,
+fanned out over a pool of processes, with results streamed into one combined CSV file (as files/combined_results_tumour_sizes.csv) as runs finish.
+
+The read-only arrays of the base lattice (positions, zonation types, adjacent site ids) are saved once to a lattice directory (see lattice_io_functions.py)
+and memory-mapped by every worker,
+so that workers share them without copies; each run only copies the arrays it updates (site types, cell ids, cell states).
+
+Run from the root of the repository, e.g.:
+    python -m classes_and_functions.sweep_functions --model-types model_1 model_2 model_3 model_4 --seeding-densities 0.25 0.5 1 \
+        --T 40 --snapshot-times 10 20 30 40 --n-replicates 16 --n-workers 8 --output combined_results_tumour_sizes.csv
+
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from classes_and_functions.cell_classes import CancerCell, Hepatocyte
+from classes_and_functions.lattice_classes import ArrayLattice
+from classes_and_functions.lattice_io_functions import save_lattice, load_lattice
+from classes_and_functions.settings import get_simulation_parameters
+from classes_and_functions.initialisation_functions import init_cell_dictionaries
+from classes_and_functions.simulation_functions import update_cell_states, implicit_immune_predation
+from classes_and_functions.gillespie_functions import GillespieSimulation
+from classes_and_functions.numba_functions import run_replicates_numba
+from classes_and_functions.vectorized_functions import run_replicates_vectorized
+from classes_and_functions.analysis_functions import get_tumour_sizes
+from classes_and_functions.random_functions import get_replicate_rng
+from classes_and_functions.profiling_functions import Profiler
+from classes_and_functions.metrics_functions import MetricsRecorder, MetricsSummary
+from classes_and_functions.cell_classes import get_lineages
+
+from typing import Callable, Dict, List, Tuple
+
+WORKER_LATTICE = None # the base lattice of a worker process, see attach_lattice
+
+def get_snapshot_times(T: int) -> List[int]:
+    # the times at which 1_notebook_simulation.ipynb records snapshots
+    if T < 5:
+        return list(range(T+1))
+    return [t for t in range(T+1) if t % (T / (T//5)) == 0]
+
+def get_model_condition(model_type: str, cancer_cell_seeding_density: float) -> str:
+    return f"{model_type}_SeedDen_{cancer_cell_seeding_density:g}"
+
+def get_sweep_runs(
+    model_types: List[str],
+    cancer_cell_seeding_densities: List[float],
+    Ts: List[int],
+    parameter_grid: Dict[str, List[float]]=None,
+    n_replicates: int=16,
+    seed: int=None
+) -> List[Dict]:
+    """_summary_
+
+    This function lists the runs of a sweep, one per replicate of every combination of the grid.
+
+    Args:
+        model_types (List[str]): model types, e.g. ["model_1", "model_2"]
+        cancer_cell_seeding_densities (List[float]): numbers of cancer cells initialised per CV
+        Ts (List[int]): numbers of time steps
+        parameter_grid (Dict[str, List[float]], optional): values of the parameters of get_simulation_parameters to sweep over,
+            e.g. {"P_HEP_DAMAGED": [0.25, 0.5]}; other parameters take the values of get_simulation_parameters. Defaults to None.
+        n_replicates (int, optional): the number of replicates per combination. Defaults to 16.
+        seed (int, optional): the entropy of the SeedSequence from which the random number generators of the runs are spawned,
+            run i using get_replicate_rng(seed, i). Defaults to None, i.e. fresh entropy.
+
+    Returns:
+        List[Dict]: the runs, with run_id, model_type, model_condition, cancer_cell_seeding_density, T, parameters, replicate and seed
+    """
+
+    parameter_grid = parameter_grid or {}
+    parameter_names = list(parameter_grid.keys())
+
+    combinations = list(itertools.product(
+        model_types, cancer_cell_seeding_densities, Ts,
+        itertools.product(*[parameter_grid[name] for name in parameter_names]),
+        range(n_replicates)
+    ))
+    # a fresh seed that fits in an int64 column, recorded with the results so that any run can be replayed
+    if seed is None:
+        seed = int(np.random.SeedSequence().generate_state(1, dtype=np.uint64)[0] >> np.uint64(1))
+
+    runs = []
+    for run_id, (model_type, density, T, parameter_values, replicate) in enumerate(combinations):
+        parameters = get_simulation_parameters(model_type)
+        for name, value in zip(parameter_names, parameter_values):
+            if name not in parameters:
+                raise ValueError(f"{name} is not a parameter of {model_type}")
+            parameters[name] = value
+
+        runs.append({
+            "run_id": run_id,
+            "model_type": model_type,
+            "model_condition": get_model_condition(model_type, density),
+            "cancer_cell_seeding_density": density,
+            "T": T,
+            "parameters": parameters,
+            "replicate": replicate,
+            "seed": seed
+        })
+
+    return runs
+
+def get_snapshot_tumour_sizes(lattice: ArrayLattice, site_type: np.ndarray, cell_id: np.ndarray, t: int) -> pd.DataFrame:
+    # the tumour sizes of a snapshot of the lattice (its site types and cell ids) at time t
+    tumour_site_ids = np.flatnonzero(site_type == 4)
+    tumour_t = pd.DataFrame({
+        "site_id": tumour_site_ids,
+        "x": lattice.x[tumour_site_ids], "y": lattice.y[tumour_site_ids],
+        "cell_id": cell_id[tumour_site_ids]
+    })
+    tumour_t_sizes, _ = get_tumour_sizes(tumour_t=tumour_t, lattice=lattice)
+    tumour_t_sizes['time'] = t
+    return tumour_t_sizes
+
+def run_simulation(
+    lattice: ArrayLattice,
+    model_type: str,
+    cancer_cell_seeding_density: float,
+    T: int,
+    parameters: Dict[str, float],
+    snapshot_times: List[int]=None,
+    engine: str="numba",
+    rng: np.random.Generator=None,
+    metrics: MetricsRecorder=None,
+    stop: Callable[[int, pd.DataFrame], bool]=None
+) -> pd.DataFrame:
+    """_summary_
+
+    This function runs one simulation from a lattice without cancer cells, as in 1_notebook_simulation.ipynb, and records tumour sizes at snapshot times.
+
+    Args:
+        lattice (ArrayLattice): the lattice without cancer cells, updated in place
+        model_type (str): model type to implement in the simulation
+        cancer_cell_seeding_density (float): the number of cancer cells initialised per CV
+        T (int): the number of time steps
+        parameters (Dict[str, float]): parameters to be used in the simulation (see settings.py)
+        snapshot_times (List[int], optional): the times at which tumour sizes are recorded. Defaults to None, i.e. get_snapshot_times(T).
+        engine (str, optional): "loop", "vectorized" or "numba", see update_cell_states, or "gillespie" to simulate in continuous time,
+            see gillespie_functions.py. Defaults to "numba", which follows the rules of the loop engine cell by cell.
+        rng (np.random.Generator, optional): the random number generator of the simulation (see random_functions.py). Defaults to None, i.e. the global np.random state.
+        metrics (MetricsRecorder, optional): a recorder of the metrics of the run at its times (see metrics_functions.py), with the lineages of
+            cancer cells tracked if the recorder tracks lineages. Defaults to None, i.e. not recorded.
+        stop (Callable[[int, pd.DataFrame], bool], optional): a function called at every snapshot time t with the tumour sizes at t, that ends
+            the run early when it returns True (see inference_functions.py). Defaults to None, i.e. the run lasts T time steps.
+
+    Returns:
+        pd.DataFrame: a DataFrame containing label, size, time of the tumours at snapshot times (up to the time the run was stopped)
+    """
+
+    if snapshot_times is None:
+        snapshot_times = get_snapshot_times(T)
+    snapshot_times = set(snapshot_times)
+
+    n_CVs = int((lattice.site_type == 0).sum())
+    cell_dictionaries, lattice = init_cell_dictionaries(
+        lattice=lattice,
+        n_cancer_cells_init=int(cancer_cell_seeding_density * n_CVs),
+        CancerCell=CancerCell,
+        Hepatocyte=Hepatocyte,
+        rng=rng,
+        track_lineages=metrics is not None and metrics.track_lineages
+    )
+    if engine == "gillespie":
+        simulation = GillespieSimulation(cell_dictionaries, lattice, parameters, CancerCell, Hepatocyte, model_type=model_type, rng=rng)
+
+    tumour_sizes = []
+    for t in np.arange(T+1):
+
+        if t in snapshot_times:
+            tumour_sizes.append(get_snapshot_tumour_sizes(lattice, lattice.site_type, lattice.cell_id, t))
+
+        if metrics is not None:
+            metrics.record(t, lattice, get_lineages(cell_dictionaries['CancerCell']))
+
+        if (stop is not None and t in snapshot_times and stop(int(t), tumour_sizes[-1])) or t == T:
+            break
+
+        if engine == "gillespie":
+            cell_dictionaries, lattice = simulation.run_until(t+1)
+            continue
+
+        # cancer cell proliferating, damaging hepatocytes
+        cell_dictionaries, lattice = update_cell_states(
+            cell_dictionaries=cell_dictionaries,
+            lattice=lattice,
+            parameters=parameters,
+            CancerCell=CancerCell,
+            Hepatocyte=Hepatocyte,
+            model_type=model_type,
+            engine=engine,
+            rng=rng
+        )
+
+        # immune cell killing cancer cells
+        if model_type=='model_3':
+            cell_dictionaries, lattice = implicit_immune_predation(
+                cell_dictionaries=cell_dictionaries,
+                lattice=lattice,
+                parameters=parameters,
+                model_type=model_type,
+                engine=engine,
+                rng=rng
+            )
+
+    return pd.concat(tumour_sizes, ignore_index=True)
+
+def run_replicates(
+    lattice: ArrayLattice,
+    model_type: str,
+    cancer_cell_seeding_density: float,
+    T: int,
+    parameters: Dict[str, float],
+    rngs: List[np.random.Generator],
+    snapshot_times: List[int]=None,
+    engine: str="numba"
+) -> pd.DataFrame:
+    """_summary_
+
+    This function runs replicates of one simulation from a lattice without cancer cells, advanced together in parallel by the compiled kernel
+    of numba_functions.py, or stacked into (R, N) arrays updated in one vectorized pass per step (see run_replicates_vectorized),
+    and records tumour sizes at snapshot times. Replicate r gives the same tumour sizes as run_simulation with the same engine and rngs[r].
+
+    Args:
+        lattice (ArrayLattice): the lattice without cancer cells, not updated
+        model_type (str): model type to implement in the simulation
+        cancer_cell_seeding_density (float): the number of cancer cells initialised per CV
+        T (int): the number of time steps
+        parameters (Dict[str, float]): parameters to be used in the simulation (see settings.py)
+        rngs (List[np.random.Generator]): the random number generators of the replicates, e.g. get_replicate_rngs(seed, n_replicates)
+        snapshot_times (List[int], optional): the times at which tumour sizes are recorded. Defaults to None, i.e. get_snapshot_times(T).
+        engine (str, optional): "numba" or "vectorized". Defaults to "numba".
+
+    Returns:
+        pd.DataFrame: a DataFrame containing label, size, time and replicate (the index of the rng) of the tumours at snapshot times
+    """
+
+    run_replicates_of_engine = {"numba": run_replicates_numba, "vectorized": run_replicates_vectorized}
+    if engine not in run_replicates_of_engine:
+        raise ValueError(f"engine should be one of {list(run_replicates_of_engine)}, got {engine}")
+
+    if snapshot_times is None:
+        snapshot_times = get_snapshot_times(T)
+    snapshot_times = sorted(set(t for t in snapshot_times if 0 <= t <= T))
+
+    n_CVs = int((lattice.site_type == 0).sum())
+    lattices = []
+    for rng in rngs:
+        _, replicate_lattice = init_cell_dictionaries(
+            lattice=copy_lattice_for_run(lattice),
+            n_cancer_cells_init=int(cancer_cell_seeding_density * n_CVs),
+            CancerCell=CancerCell,
+            Hepatocyte=Hepatocyte,
+            rng=rng
+        )
+        lattices.append(replicate_lattice)
+
+    snapshot_site_type, snapshot_cell_id = run_replicates_of_engine[engine](lattices, parameters, model_type, T, rngs, snapshot_times)
+
+    tumour_sizes = []
+    for replicate, replicate_lattice in enumerate(lattices):
+        for i, t in enumerate(snapshot_times):
+            tumour_t_sizes = get_snapshot_tumour_sizes(replicate_lattice, snapshot_site_type[replicate, i], snapshot_cell_id[replicate, i], t)
+            tumour_t_sizes['replicate'] = replicate
+            tumour_sizes.append(tumour_t_sizes)
+
+    return pd.concat(tumour_sizes, ignore_index=True)
+
+def attach_lattice(directory: str):
+    # initializer of worker processes
+    global WORKER_LATTICE
+    WORKER_LATTICE = load_lattice(directory, mmap_mode='r')
+
+def copy_lattice_for_run(lattice: ArrayLattice) -> ArrayLattice:
+    # the memory-mapped read-only arrays are shared, the arrays updated during a simulation are copied
+    return ArrayLattice(
+        x=lattice.x, y=lattice.y, zonation_type=lattice.zonation_type, adjacent_site_ids=lattice.adjacent_site_ids,
+        site_type=np.array(lattice.site_type), cell_id=np.array(lattice.cell_id), cell_state=np.array(lattice.cell_state),
+        next_cell_id=lattice.cell_id_allocator.next_cell_id
+    )
+
+def get_condition_key(run: Dict) -> Tuple:
+    # the settings shared by the replicates of a run
+    return (run["model_condition"], run["model_type"], run["cancer_cell_seeding_density"], run["T"], tuple(sorted(run["parameters"].items())))
+
+def get_condition_runs(runs: List[Dict]) -> List[List[Dict]]:
+    # the runs grouped by condition, i.e. the replicates of every condition, in order of their first run
+    condition_runs = {}
+    for run in runs:
+        condition_runs.setdefault(get_condition_key(run), []).append(run)
+    return list(condition_runs.values())
+
+def add_run_settings(tumour_sizes: pd.DataFrame, run: Dict, run_time_s: float):
+    # the settings of a run as columns of its tumour sizes, in place
+    tumour_sizes["model_condition"] = run["model_condition"]
+    tumour_sizes["pid"] = run["run_id"]
+    for name in ["model_type", "cancer_cell_seeding_density", "T", "replicate", "seed"]:
+        tumour_sizes[name] = run[name]
+    for name, value in run["parameters"].items():
+        tumour_sizes[name] = value
+    tumour_sizes["run_time_s"] = run_time_s
+
+def run_sweep_task(
+    run: Dict,
+    snapshot_times: List[int]=None,
+    engine: str="numba",
+    profile: bool=False,
+    record_metrics: bool=False,
+    metrics_times: List[int]=None,
+    track_lineages: bool=False
+) -> Tuple[pd.DataFrame, pd.DataFrame, MetricsSummary]:
+    # one run of a sweep in a worker process, on a copy of the worker's base lattice, with its profile (see profiling_functions.py) if profiled
+    # and the summary of its metrics (see metrics_functions.py) if recorded
+
+    metrics = MetricsRecorder(times=metrics_times, track_lineages=track_lineages) if record_metrics else None
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), (Profiler() if profile else contextlib.nullcontext()) as profiler:
+        tumour_sizes = run_simulation(
+            lattice=copy_lattice_for_run(WORKER_LATTICE),
+            model_type=run["model_type"],
+            cancer_cell_seeding_density=run["cancer_cell_seeding_density"],
+            T=run["T"],
+            parameters=run["parameters"],
+            snapshot_times=snapshot_times,
+            engine=engine,
+            rng=get_replicate_rng(run["seed"], run["run_id"]),
+            metrics=metrics
+        )
+
+    add_run_settings(tumour_sizes, run, time.perf_counter() - start)
+
+    metrics_summary = None if metrics is None else metrics.summary
+    if not profile:
+        return tumour_sizes, None, metrics_summary
+    profile = profiler.to_dataframe()
+    profile.insert(0, "pid", run["run_id"])
+    profile.insert(1, "model_condition", run["model_condition"])
+    return tumour_sizes, profile, metrics_summary
+
+def run_sweep_batch_task(runs: List[Dict], snapshot_times: List[int]=None, engine: str="numba") -> Tuple[pd.DataFrame, None, None]:
+    # the replicates of a condition in a worker process, advanced together by run_replicates, each giving the same tumour sizes as run_sweep_task;
+    # the run time of every run is its share of the time of the batch
+
+    start = time.perf_counter()
+    run = runs[0]
+    with contextlib.redirect_stdout(io.StringIO()):
+        tumour_sizes = run_replicates(
+            lattice=WORKER_LATTICE,
+            model_type=run["model_type"],
+            cancer_cell_seeding_density=run["cancer_cell_seeding_density"],
+            T=run["T"],
+            parameters=run["parameters"],
+            rngs=[get_replicate_rng(run["seed"], run["run_id"]) for run in runs],
+            snapshot_times=snapshot_times,
+            engine=engine
+        )
+    run_time_s = (time.perf_counter() - start) / len(runs)
+
+    tumour_sizes_of_runs = []
+    for replicate, tumour_sizes_of_run in tumour_sizes.groupby("replicate", sort=True):
+        tumour_sizes_of_run = tumour_sizes_of_run.drop(columns="replicate").reset_index(drop=True)
+        add_run_settings(tumour_sizes_of_run, runs[replicate], run_time_s)
+        tumour_sizes_of_runs.append(tumour_sizes_of_run)
+
+    return pd.concat(tumour_sizes_of_runs, ignore_index=True), None, None
+
+def run_sweep(
+    lattice: ArrayLattice,
+    runs: List[Dict],
+    n_workers: int=None,
+    output: str=None,
+    snapshot_times: List[int]=None,
+    engine: str="numba",
+    profile_output: str=None,
+    metrics_output: str=None,
+    metrics_times: List[int]=None,
+    track_lineages: bool=False,
+    batch_replicates: bool=False
+) -> pd.DataFrame:
+    """_summary_
+
+    This function runs the simulations of a sweep over a pool of processes sharing the base lattice,
+    and appends the tumour sizes of every run to the output CSV file as soon as it finishes.
+
+    Args:
+        lattice (ArrayLattice): the lattice without cancer cells, not updated
+        runs (List[Dict]): the runs, see get_sweep_runs
+        n_workers (int, optional): the number of processes. Defaults to None, i.e. the number of CPUs.
+        output (str, optional): the path to the combined CSV file, appended to (with a header if new). Defaults to None, i.e. not saved.
+        snapshot_times (List[int], optional): the times at which tumour sizes are recorded. Defaults to None, i.e. get_snapshot_times(T) of each run.
+        engine (str, optional): "loop", "vectorized", "numba" or "gillespie", see run_simulation. Defaults to "numba".
+        profile_output (str, optional): the path to a CSV file to append the profiles of the runs to (see profiling_functions.py). Defaults to None, i.e. not profiled.
+        metrics_output (str, optional): the path to a CSV file to save the metrics of the runs to (see metrics_functions.py), recorded during the runs
+            and merged over the replicates of every condition (model_condition, T and parameters) as they finish. Defaults to None, i.e. not recorded.
+        metrics_times (List[int], optional): the times at which metrics are recorded. Defaults to None, i.e. every time step.
+        track_lineages (bool, optional): whether to track the lineages of cancer cells and record their metrics. Defaults to False.
+        batch_replicates (bool, optional): whether to run the replicates of every condition as one task, advanced together by run_replicates
+            with engine "vectorized" or "numba" and giving the same tumour sizes, without profiles or metrics. Defaults to False.
+
+    Returns:
+        pd.DataFrame: a DataFrame containing label, size, time, model_condition, pid (the run_id) and the settings of each run, in order of completion
+    """
+
+    if batch_replicates and (engine not in ["vectorized", "numba"] or profile_output is not None or metrics_output is not None):
+        raise ValueError("batch_replicates requires engine vectorized or numba, and neither profile_output nor metrics_output")
+
+    # the same columns for all runs, i.e. those of an existing output file, or the union of the parameters of all runs
+    parameter_names = list(dict.fromkeys(name for run in runs for name in run["parameters"]))
+    columns = ["label", "size", "time", "model_condition", "pid", "model_type", "cancer_cell_seeding_density", "T", "replicate", "seed"] \
+        + parameter_names + ["run_time_s"]
+    is_output_new = output is None or not os.path.exists(output) or os.path.getsize(output) == 0
+    if not is_output_new:
+        columns = list(pd.read_csv(output, nrows=0).columns)
+
+    results = []
+    condition_metrics = {} # condition key -> MetricsSummary of the replicates finished
+    with tempfile.TemporaryDirectory() as directory:
+        save_lattice(lattice, directory)
+
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=attach_lattice, initargs=(directory,)) as executor:
+            if batch_replicates:
+                futures = {
+                    executor.submit(run_sweep_batch_task, condition_runs, snapshot_times, engine): condition_runs
+                    for condition_runs in get_condition_runs(runs)
+                }
+            else:
+                futures = {
+                    executor.submit(
+                        run_sweep_task, run, snapshot_times, engine, profile_output is not None,
+                        metrics_output is not None, metrics_times, track_lineages
+                    ): [run] for run in runs
+                }
+
+            n_finished = 0
+            for future in as_completed(futures):
+                tumour_sizes, profile, metrics = future.result()
+                tumour_sizes = tumour_sizes.reindex(columns=columns)
+                results.append(tumour_sizes)
+                n_finished += len(futures[future])
+
+                if metrics is not None:
+                    key = get_condition_key(futures[future][0])
+                    if key in condition_metrics:
+                        condition_metrics[key].merge(metrics)
+                    else:
+                        condition_metrics[key] = metrics
+
+                if profile is not None:
+                    is_profile_output_new = not os.path.exists(profile_output) or os.path.getsize(profile_output) == 0
+                    profile.to_csv(profile_output, mode='a', header=is_profile_output_new, index=False)
+
+                if output is not None:
+                    tumour_sizes.to_csv(output, mode='a', header=is_output_new, index=False)
+                    is_output_new = False
+                print(f"> {n_finished}/{len(runs)} runs finished")
+
+    if metrics_output is not None:
+        save_condition_metrics(condition_metrics, metrics_output)
+
+    return pd.concat(results, ignore_index=True) if results else pd.DataFrame()
+
+def save_condition_metrics(condition_metrics: Dict[Tuple, MetricsSummary], path: str):
+    # the metrics summaries of the conditions of a sweep as one CSV file, with the settings and parameters of each condition
+    tables = []
+    for (model_condition, model_type, density, T, parameters), summary in condition_metrics.items():
+        table = summary.to_dataframe()
+        settings = {"model_condition": model_condition, "model_type": model_type, "cancer_cell_seeding_density": density, "T": T}
+        tables.append(table.assign(**settings, **dict(parameters)))
+    if not tables:
+        return
+    parameter_names = list(dict.fromkeys(name for key in condition_metrics for name, _ in key[4]))
+    columns = ["model_condition", "model_type", "cancer_cell_seeding_density", "T"] + parameter_names \
+        + ["time", "metric", "bin_start", "bin_end", "count", "mean", "std", "min", "max"]
+    pd.concat(tables, ignore_index=True).reindex(columns=columns).to_csv(path, index=False)
+
+def read_lattice(path_to_lattice: str=None, path_to_lattice_settings: str=None, lattice_size: int=None) -> ArrayLattice:
+    # a lattice without cancer cells, from a lattice directory or CSV file, or generated from lattice settings
+    if path_to_lattice is not None:
+        return load_lattice(path_to_lattice)
+
+    from classes_and_functions.lattice_generation_functions import generate_lattice
+    with open(path_to_lattice_settings) as json_file:
+        lattice_settings = json.load(json_file)
+    return generate_lattice(lattice_settings, lattice_size=lattice_size)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Run replicates of simulations over a grid of settings in parallel")
+    parser.add_argument("--lattice", default="./files/lattice_with_CVs_PTs_2025-06-23_annotated_without_tumour.csv",
+                        help="path to a lattice directory (see lattice_io_functions.py) or CSV file without tumour")
+    parser.add_argument("--lattice-settings", default=None, help="path to lattice settings, to generate the lattice instead of reading --lattice")
+    parser.add_argument("--lattice-size", type=int, default=None, help="lattice size of the generated lattice")
+    parser.add_argument("--model-types", nargs="+", default=["model_1", "model_2", "model_3", "model_4"])
+    parser.add_argument("--seeding-densities", type=float, nargs="+", default=[0.25, 0.5, 1])
+    parser.add_argument("--T", type=int, nargs="+", default=[40])
+    parser.add_argument("--parameter", action="append", default=[], metavar="NAME=VALUE[,VALUE...]",
+                        help="values of a parameter of get_simulation_parameters to sweep over, e.g. P_HEP_DAMAGED=0.25,0.5")
+    parser.add_argument("--n-replicates", type=int, default=16)
+    parser.add_argument("--snapshot-times", type=int, nargs="+", default=None)
+    parser.add_argument("--engine", default="numba", help="loop, vectorized, numba or gillespie")
+    parser.add_argument("--n-workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default="combined_results_tumour_sizes.csv")
+    parser.add_argument("--profile-output", default=None, help="path to a CSV file to append the per-stage profiles of the runs to")
+    parser.add_argument("--metrics-output", default=None,
+                        help="path to a CSV file to save the metrics recorded during the runs to, merged over the replicates of every condition")
+    parser.add_argument("--metrics-times", type=int, nargs="+", default=None, help="times at which metrics are recorded, every time step by default")
+    parser.add_argument("--track-lineages", action="store_true", help="record the metrics of the lineages of cancer cells")
+    parser.add_argument("--batch-replicates", action="store_true",
+                        help="advance the replicates of every condition together in one task (engine vectorized or numba)")
+    args = parser.parse_args()
+
+    parameter_grid = {}
+    for parameter in args.parameter:
+        name, values = parameter.split("=")
+        parameter_grid[name] = [float(value) for value in values.split(",")]
+
+    lattice = read_lattice(
+        path_to_lattice=None if args.lattice_settings is not None else args.lattice,
+        path_to_lattice_settings=args.lattice_settings,
+        lattice_size=args.lattice_size
+    )
+    runs = get_sweep_runs(
+        model_types=args.model_types,
+        cancer_cell_seeding_densities=args.seeding_densities,
+        Ts=args.T,
+        parameter_grid=parameter_grid,
+        n_replicates=args.n_replicates,
+        seed=args.seed
+    )
+    print(f"> {len(runs)} runs on a lattice of {lattice.n_sites} sites")
+
+    start = time.perf_counter()
+    run_sweep(
+        lattice, runs, n_workers=args.n_workers, output=args.output, snapshot_times=args.snapshot_times, engine=args.engine,
+        profile_output=args.profile_output, metrics_output=args.metrics_output, metrics_times=args.metrics_times,
+        track_lineages=args.track_lineages, batch_replicates=args.batch_replicates
+    )
+    print(f"> finished in {time.perf_counter() - start:.1f} s, results appended to {args.output}")
@@ -0,0 +1,762 @@
+"""_summary_
+
+This Python script contains functions to simulate tumour growth and liver damage with batched array operations.
+
+All cells are updated synchronously from the lattice at the beginning of the step, visiting only the cancer cells on the active frontier
+(see ActiveFrontier in lattice_classes.py):
+    - each proliferative cancer cell tries to grow into each of its adjacent NO sites with probability P_CC_GROW;
+      in model_4, a cell that fails to grow moves instead, into one of those adjacent NO sites chosen at random
+    - when several cancer cells target the same NO site, the one with the smallest cell_id gets it and the others stay put,
+      as in update_cell_states where cells act one by one in order of cell_id
+    - in model_4, the sites vacated by moves are claimed again within the step, each by the next adjacent cell in order of cell_id,
+      in rounds until no cell moves
+    - hepatocytes are then processed with the same distribution as in update_cell_states, i.e. once per adjacent proliferative
+      cancer cell: quiescent hepatocytes become apoptotic with probability 1-(1-P_HEP_DAMAGED)^k, k being the number of adjacent
+      cancer cells after growth; apoptotic hepatocytes get cleared with probability P_HEP_CLEARED, or, in model_2, turn ECM
+      deposited if peri-central
+
+"""
+
+import numpy as np
+from classes_and_functions.cell_classes import Cell, CancerCell, Hepatocyte, CellDictionary, copy_cell_dictionary, get_lineages
+from classes_and_functions.random_functions import get_rng
+from classes_and_functions.profiling_functions import mark_stage
+from classes_and_functions.lattice_classes import ArrayLattice, NO_CELL_ID, NO_CELL_STATE, NO_ADJACENT_SITE_ID, ZONATION_TYPE_PERI_CENTRAL
+
+from typing import Dict, List, Tuple, Type, Union
+
+NO_SITE_TYPE = 255 # site type of padded adjacent sites
+
+def get_adjacent_site_types(lattice: ArrayLattice, site_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """_summary_
+
+    This function gathers the adjacent site ids and types of many sites at once.
+
+    Args:
+        lattice (ArrayLattice): the lattice
+        site_ids (np.ndarray): the ids of M sites
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: arrays of shape (M, 6) including
+            adjacent_site_ids - the adjacent site ids, padded with NO_ADJACENT_SITE_ID
+            adjacent_site_types - the adjacent site types, padded with NO_SITE_TYPE
+    """
+
+    adjacent_site_ids = lattice.adjacent_site_ids[site_ids]
+    adjacent_site_types = np.where(
+        adjacent_site_ids != NO_ADJACENT_SITE_ID,
+        lattice.site_type[adjacent_site_ids],
+        NO_SITE_TYPE
+    )
+
+    return adjacent_site_ids, adjacent_site_types
+
+def resolve_conflicts(target_site_ids: np.ndarray, cell_ids: np.ndarray) -> np.ndarray:
+    """_summary_
+
+    This function picks, for every distinct target site, the claim of the cell with the smallest cell_id, as in update_cell_states
+    where cells act one by one in order of cell_id.
+
+    Args:
+        target_site_ids (np.ndarray): the target site ids of all claims
+        cell_ids (np.ndarray): the ids of the claiming cells
+
+    Returns:
+        np.ndarray: the indices of the winning claims, in order of target site id
+    """
+
+    order = np.lexsort((cell_ids, target_site_ids))
+    _, first_claims = np.unique(target_site_ids[order], return_index=True)
+
+    return order[first_claims]
+
+def add_cells(
+    dict_of_cells: Dict, cell_class: Type[Cell], cell_ids: np.ndarray, site_ids: np.ndarray, cell_state: int, lattice: ArrayLattice,
+    lineage_ids: np.ndarray=None
+):
+    # new cells on the given sites (in the given lineages, if tracked), added to the store in one batch if dict_of_cells is a CellDictionary
+    columns = {} if lineage_ids is None else {"lineage_id": lineage_ids}
+    if isinstance(dict_of_cells, CellDictionary):
+        dict_of_cells.store.add_many(cell_ids, site_id=site_ids, cell_state=cell_state, x=lattice.x[site_ids], y=lattice.y[site_ids], **columns)
+        return
+    for i, (cell_id, site_id) in enumerate(zip(cell_ids.tolist(), site_ids.tolist())):
+        dict_of_cells[cell_id] = cell_class(cell_attributes={
+            "cell_id": cell_id, "site_id": site_id,
+            "cell_position": (lattice.x[site_id], lattice.y[site_id]),
+            "cell_state": cell_state,
+            **{name: column[i] for name, column in columns.items()}
+        })
+
+def get_lineage_ids(dict_of_cells: Dict, cell_ids: np.ndarray) -> np.ndarray:
+    # the lineages of the given cells, None if lineages are not tracked (see LineageTable)
+    if get_lineages(dict_of_cells) is None:
+        return None
+    return dict_of_cells.store.get_lineage_ids(cell_ids)
+
+def move_cells(dict_of_cells: Dict, cell_ids: np.ndarray, site_ids: np.ndarray, lattice: ArrayLattice):
+    if isinstance(dict_of_cells, CellDictionary):
+        dict_of_cells.store.set_many(cell_ids, site_id=site_ids, x=lattice.x[site_ids], y=lattice.y[site_ids])
+        return
+    for cell_id, site_id in zip(cell_ids.tolist(), site_ids.tolist()):
+        updated_cell_attributes = dict_of_cells[cell_id].get_attributes().copy()
+        updated_cell_attributes['site_id'] = site_id
+        updated_cell_attributes['cell_position'] = (lattice.x[site_id], lattice.y[site_id])
+        dict_of_cells[cell_id].set_attributes(updated_cell_attributes)
+
+def set_cell_states(dict_of_cells: Dict, cell_ids: np.ndarray, cell_state: int):
+    if isinstance(dict_of_cells, CellDictionary):
+        dict_of_cells.store.set_many(cell_ids, cell_state=cell_state)
+        return
+    for cell_id in cell_ids.tolist():
+        updated_cell_attributes = dict_of_cells[cell_id].get_attributes().copy()
+        updated_cell_attributes['cell_state'] = cell_state
+        dict_of_cells[cell_id].set_attributes(updated_cell_attributes)
+
+def remove_cells(dict_of_cells: Dict, cell_ids: np.ndarray):
+    if isinstance(dict_of_cells, CellDictionary):
+        dict_of_cells.store.remove_many(cell_ids)
+        return
+    for cell_id in cell_ids.tolist():
+        del dict_of_cells[cell_id]
+
+def get_tumour_site_ids(dict_of_cancer_cells: Dict, lattice: ArrayLattice) -> np.ndarray:
+    # the sites occupied by cancer cells, in order of site_id, read from the store in O(number of cancer cells) if dict_of_cancer_cells is a CellDictionary
+    if isinstance(dict_of_cancer_cells, CellDictionary):
+        store = dict_of_cancer_cells.store
+        return np.sort(store.site_id[np.flatnonzero(store.is_alive[:store.n_rows])])
+    return np.flatnonzero(lattice.site_type == 4)
+
+def get_kill_probabilities(dict_of_cancer_cells: Dict, lattice: ArrayLattice, tumour_site_ids: np.ndarray, p_cc_killed: float) -> Union[float, np.ndarray]:
+    # P_CC_KILLED, or the kill probabilities of the cancer cells on the given sites if some of their lineages have their own (see LineageTable)
+    lineages = get_lineages(dict_of_cancer_cells)
+    if lineages is None or not lineages.has_kill_probabilities():
+        return p_cc_killed
+    return lineages.get_kill_probabilities(get_lineage_ids(dict_of_cancer_cells, lattice.cell_id[tumour_site_ids]), p_cc_killed)
+
+def sample_killed_site_ids(
+    tumour_site_ids: np.ndarray, n_sites: int, p_cc_killed: Union[float, np.ndarray], rng: np.random.Generator=None
+) -> np.ndarray:
+    """_summary_
+
+    This function draws the sites of the cancer cells killed by implicit immune predation, at a cost independent of the number of lattice sites.
+    With K sites out of N attacked, K being the number of cancer cells, the number of cancer cells attacked is hypergeometric and they are
+    a uniform sample of the cancer cells; each is killed with probability P_CC_KILLED, so the cancer cells killed are a uniform sample
+    of Binomial(Hypergeometric(K, N-K, K), P_CC_KILLED) cancer cells. With kill probabilities per cancer cell (e.g. per lineage),
+    the cancer cells attacked are sampled first, and each is killed with its own probability.
+
+    Args:
+        tumour_site_ids (np.ndarray): the K sites occupied by cancer cells
+        n_sites (int): the number N of lattice sites
+        p_cc_killed (Union[float, np.ndarray]): the probability of a cancer cell under attack being killed, or the probabilities of the K cancer cells
+        rng (np.random.Generator, optional): the random number generator. Defaults to None, i.e. the global np.random state.
+
+    Returns:
+        np.ndarray: the sites of the cancer cells killed
+    """
+
+    rng = get_rng(rng)
+    n_tumour_sites = tumour_site_ids.size
+    if n_tumour_sites == 0:
+        return tumour_site_ids[:0]
+
+    n_attacked = rng.hypergeometric(n_tumour_sites, n_sites - n_tumour_sites, n_tumour_sites)
+    if np.ndim(p_cc_killed) > 0:
+        attacked = rng.choice(n_tumour_sites, size=n_attacked, replace=False)
+        return tumour_site_ids[attacked[rng.random(n_attacked) < p_cc_killed[attacked]]]
+    n_killed = rng.binomial(n_attacked, p_cc_killed)
+
+    return tumour_site_ids[rng.choice(n_tumour_sites, size=n_killed, replace=False)]
+
+def get_growth_claims(
+    adjacent_site_types: np.ndarray,
+    p_cc_grow: float,
+    model_type: str,
+    rng: np.random.Generator=None,
+    random_numbers: np.ndarray=None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """_summary_
+
+    This function draws the adjacent NO sites that proliferative cancer cells grow into (or, in model_4, move into), before conflicts are resolved.
+
+    Args:
+        adjacent_site_types (np.ndarray): the adjacent site types of M proliferative cancer cells, of shape (M, 6), see get_adjacent_site_types
+        p_cc_grow (float): the probability of a cancer cell growing into an adjacent NO site
+        model_type (str): model type to implement in the simulation
+        rng (np.random.Generator, optional): the random number generator. Defaults to None, i.e. the global np.random state.
+        random_numbers (np.ndarray, optional): the random numbers of the adjacent NO sites, in row-major order. Defaults to None, i.e. drawn from rng.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: the claims, as
+            claim_rows, claim_cols - the indices of the claiming cancer cells and of the claimed adjacent sites in adjacent_site_types
+            claim_is_move - whether the claim is a move rather than a birth
+    """
+
+    rng = get_rng(rng)
+
+    # one Bernoulli trial per (cancer cell, adjacent NO site), with random numbers drawn for adjacent NO sites only,
+    # so that they do not depend on the cancer cells without adjacent NO sites
+    is_adjacent_site_empty = adjacent_site_types == 3
+    if random_numbers is None:
+        random_numbers = rng.random(np.count_nonzero(is_adjacent_site_empty))
+    random_numbers_of_empty_sites = random_numbers
+    random_numbers = np.ones(adjacent_site_types.shape)
+    random_numbers[is_adjacent_site_empty] = random_numbers_of_empty_sites
+    is_growing = is_adjacent_site_empty & (random_numbers < p_cc_grow)
+
+    claim_rows, claim_cols = np.nonzero(is_growing)
+    claim_is_move = np.zeros(claim_rows.size, dtype=bool)
+
+    if model_type == "model_4": # move to one of the adjacent NO sites not grown into
+        # ... failed trials have random numbers i.i.d. in [P_CC_GROW, 1), so the largest one picks a site uniformly
+        is_move_candidate = is_adjacent_site_empty & ~is_growing
+        move_rows = np.flatnonzero(is_move_candidate.any(axis=1))
+        move_cols = np.argmax(np.where(is_move_candidate, random_numbers, -1), axis=1)[move_rows]
+
+        claim_rows = np.concatenate([claim_rows, move_rows])
+        claim_cols = np.concatenate([claim_cols, move_cols])
+        claim_is_move = np.concatenate([claim_is_move, np.ones(move_rows.size, dtype=bool)])
+
+    return claim_rows, claim_cols, claim_is_move
+
+def get_vacated_site_claims(
+    vacated_site_ids: np.ndarray,
+    moved_cell_ids: np.ndarray,
+    adjacent_site_ids: np.ndarray,
+    start_site_type: np.ndarray,
+    start_cell_id: np.ndarray,
+    start_cell_state: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """_summary_
+
+    This function finds, in model_4, the cancer cells claiming the sites vacated by moves. As in update_cell_states, where cells act one by one in order
+    of cell_id, a vacated site is claimed by the proliferative cancer cell present at the start of the step, adjacent to the site, with the smallest cell_id
+    larger than that of the cell that moved out, which then grows or moves into it.
+
+    Args:
+        vacated_site_ids (np.ndarray): the sites vacated by moves
+        moved_cell_ids (np.ndarray): the ids of the cells that moved out of them
+        adjacent_site_ids (np.ndarray): the adjacent site ids of all sites, of shape (N, 6)
+        start_site_type (np.ndarray): the site types at the start of the step
+        start_cell_id (np.ndarray): the cell ids at the start of the step
+        start_cell_state (np.ndarray): the cell states at the start of the step
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: the claims of the vacated sites, sorted by the claiming cells, as
+            claiming_site_ids - the sites of the claiming cells at the start of the step
+            claiming_adjacent_site_ids - their adjacent site ids, of shape (M, 6)
+            is_claimed - whether each adjacent site is claimed, of shape (M, 6)
+    """
+
+    candidate_site_ids = adjacent_site_ids[vacated_site_ids]
+    is_candidate = candidate_site_ids != NO_ADJACENT_SITE_ID
+    candidate_cell_ids = np.where(is_candidate, start_cell_id[candidate_site_ids], NO_CELL_ID)
+    is_candidate &= (start_site_type[candidate_site_ids] == 4) & (start_cell_state[candidate_site_ids] == 1) & (candidate_cell_ids > moved_cell_ids[:, None])
+
+    is_claimed_site = is_candidate.any(axis=1)
+    candidate_cols = np.argmin(np.where(is_candidate, candidate_cell_ids, np.iinfo(np.int64).max), axis=1)[is_claimed_site]
+    vacated_site_ids, candidate_site_ids = vacated_site_ids[is_claimed_site], candidate_site_ids[is_claimed_site]
+
+    claiming_site_ids, claim_rows = np.unique(candidate_site_ids[np.arange(candidate_cols.size), candidate_cols], return_inverse=True)
+    claiming_adjacent_site_ids = adjacent_site_ids[claiming_site_ids]
+    is_claimed = np.zeros(claiming_adjacent_site_ids.shape, dtype=bool)
+    is_claimed[claim_rows.ravel(), np.argmax(claiming_adjacent_site_ids[claim_rows.ravel()] == vacated_site_ids[:, None], axis=1)] = True
+
+    return claiming_site_ids, claiming_adjacent_site_ids, is_claimed
+
+def get_hepatocyte_fates(
+    lattice: ArrayLattice,
+    hep_site_ids: np.ndarray,
+    n_rounds: np.ndarray,
+    p_hep_damaged: float,
+    p_hep_cleared: float,
+    model_type: str,
+    rng: np.random.Generator=None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """_summary_
+
+    This function draws the fates of hepatocytes processed n_rounds times, once per adjacent proliferative cancer cell, as in update_cell_states,
+    from the lattice after cancer cells have grown.
+
+    Args:
+        lattice (ArrayLattice): the lattice
+        hep_site_ids (np.ndarray): the sites of the hepatocytes
+        n_rounds (np.ndarray): the numbers of adjacent proliferative cancer cells at the start of the step
+        p_hep_damaged (float): the probability of a quiescent hepatocyte turning apoptotic, per adjacent cancer cell
+        p_hep_cleared (float): the probability of an apoptotic hepatocyte getting cleared
+        model_type (str): model type to implement in the simulation
+        rng (np.random.Generator, optional): the random number generator. Defaults to None, i.e. the global np.random state.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: whether each hepatocyte turns apoptotic (and stays), gets cleared, or turns ECM deposited
+    """
+
+    rng = get_rng(rng)
+    _, hep_adjacent_site_types = get_adjacent_site_types(lattice, hep_site_ids)
+
+    return draw_hepatocyte_fates(
+        lattice.cell_state[hep_site_ids], (hep_adjacent_site_types == 4).sum(axis=1), lattice.zonation_type[hep_site_ids],
+        n_rounds, p_hep_damaged, p_hep_cleared, model_type, rng.random((2, hep_site_ids.size))
+    )
+
+def draw_hepatocyte_fates(
+    hep_states: np.ndarray,
+    n_adjacent_cancer_cells: np.ndarray,
+    hep_zonation_types: np.ndarray,
+    n_rounds: np.ndarray,
+    p_hep_damaged: float,
+    p_hep_cleared: float,
+    model_type: str,
+    random_numbers: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # the fates of get_hepatocyte_fates, from the states, adjacent cancer cells (after growth) and zonation types of the hepatocytes,
+    # and random numbers of shape (2, number of hepatocytes)
+
+    # ... quiescent hepatocytes turn apoptotic, in the round drawn from a geometric distribution
+    p_damaged_per_round = 1 - (1 - p_hep_damaged) ** n_adjacent_cancer_cells
+    with np.errstate(divide='ignore', invalid='ignore'):
+        damage_round = np.floor(np.log1p(-random_numbers[0]) / np.log1p(-p_damaged_per_round)) + 1
+    damage_round[p_damaged_per_round == 0] = np.inf
+    is_damaged = (hep_states == 0) & (damage_round <= n_rounds)
+
+    # ... apoptotic hepatocytes get cleared in any of the remaining rounds,
+    # or turn ECM deposited at peri-central regions in model_2 when not cleared in the first remaining round
+    n_rounds_apoptotic = np.where(hep_states == 2, n_rounds, np.where(is_damaged, n_rounds - damage_round, 0))
+    is_fibrosis_considered = (model_type == "model_2") & (hep_zonation_types == ZONATION_TYPE_PERI_CENTRAL)
+    p_cleared = np.where(
+        is_fibrosis_considered,
+        np.where(n_rounds_apoptotic > 0, p_hep_cleared, 0),
+        1 - (1 - p_hep_cleared) ** n_rounds_apoptotic
+    )
+    is_cleared = random_numbers[1] < p_cleared
+    is_fibrotic = is_fibrosis_considered & (n_rounds_apoptotic > 0) & ~is_cleared
+
+    is_damaged &= ~is_cleared & ~is_fibrotic
+
+    return is_damaged, is_cleared, is_fibrotic
+
+def update_cell_states_vectorized(
+    cell_dictionaries: Dict[str, Dict],
+    lattice: ArrayLattice,
+    parameters: Dict[str, float],
+    CancerCell: CancerCell,
+    Hepatocyte: Hepatocyte,
+    model_type: str="model_1",
+    rng: np.random.Generator=None
+) -> Tuple[Dict, ArrayLattice]:
+    """_summary_
+
+    This function simulates cancer cell proliferation and migration, hepatocyte death, with cell_dictionaries and lattice updated accordingly,
+    updating all cells synchronously with batched array operations.
+
+    Args:
+        cell_dictionaries (Dict[str, Dict]): a Dict of Dict containing the CancerCell and Hepatocyte objects
+        lattice (ArrayLattice): the lattice following initialisation of CancerCell objects
+        parameters (Dict[str, float]): parameters to be used in the simulation (see settings.py)
+        CancerCell (CancerCell): the CancerCell class used for creating new CancerCell objects
+        Hepatocyte (Hepatocyte): the Hepatocyte class used for creating new Hepatocyte objects
+        model_type (str, optional): model type to implement in the simulation. Defaults to "model_1".
+        rng (np.random.Generator, optional): the random number generator of the simulation. Defaults to None, i.e. the global np.random state.
+
+    Returns:
+        Tuple[Dict, ArrayLattice]: an updated Dict of Dict containing the CancerCell and Hepatocyte objects (with updated attributes; newly created and deleted objects), and the updated lattice
+    """
+
+    p_cc_grow = parameters['P_CC_GROW']
+    p_hep_damaged = parameters['P_HEP_DAMAGED']
+    p_hep_cleared = parameters['P_HEP_CLEARED']
+    rng = get_rng(rng)
+
+    dict_of_cancer_cells, dict_of_hepatocytes = \
+        cell_dictionaries['CancerCell'], cell_dictionaries['Hepatocyte']
+
+    new_dict_of_cancer_cells = copy_cell_dictionary(dict_of_cancer_cells)
+    new_dict_of_hepatocytes  = copy_cell_dictionary(dict_of_hepatocytes)
+    mark_stage("copy")
+
+    # ===== [1] proliferative cancer cells on the active frontier (see ActiveFrontier) grow (or move, in model_4) =====
+    cancer_cell_site_ids = lattice.get_frontier().get_site_ids()
+    cancer_cell_site_ids = cancer_cell_site_ids[lattice.cell_state[cancer_cell_site_ids] == 1]
+    adjacent_site_ids, adjacent_site_types = get_adjacent_site_types(lattice, cancer_cell_site_ids)
+
+    if model_type == "model_4": # the lattice at the start of the step, to find the cells claiming the sites vacated by moves
+        start_site_type, start_cell_id, start_cell_state = lattice.site_type.copy(), lattice.cell_id.copy(), lattice.cell_state.copy()
+
+    claim_rows, claim_cols, claim_is_move = get_growth_claims(adjacent_site_types, p_cc_grow, model_type, rng=rng)
+
+    # resolve conflicts when several cells target the same NO site
+    winning_claims = resolve_conflicts(adjacent_site_ids[claim_rows, claim_cols], lattice.cell_id[cancer_cell_site_ids[claim_rows]])
+    claim_rows, claim_cols, claim_is_move = \
+        claim_rows[winning_claims], claim_cols[winning_claims], claim_is_move[winning_claims]
+
+    claiming_site_ids, claiming_adjacent_site_ids = cancer_cell_site_ids, adjacent_site_ids
+    moved_site_ids = {} # the sites of the cells that moved during the step, keyed by their sites at the start of the step
+    changed_site_ids = []
+    while True:
+        target_site_ids = claiming_adjacent_site_ids[claim_rows, claim_cols].astype(np.int64)
+        claiming_cell_site_ids = claiming_site_ids[claim_rows]
+        if moved_site_ids:
+            claiming_cell_site_ids = np.array([moved_site_ids.get(site_id, site_id) for site_id in claiming_cell_site_ids.tolist()], dtype=np.int64)
+        parent_cell_ids = lattice.cell_id[claiming_cell_site_ids[~claim_is_move]] # before cells move
+
+        # ... moves: previous sites to be emptied, new sites to be filled
+        moving_cell_site_ids = claiming_cell_site_ids[claim_is_move]
+        moving_cell_new_site_ids = target_site_ids[claim_is_move]
+        moving_cell_ids = lattice.cell_id[moving_cell_site_ids]
+
+        lattice.site_type[moving_cell_site_ids] = 3 # sitetype = not occupied
+        lattice.cell_id[moving_cell_site_ids] = NO_CELL_ID
+        lattice.cell_state[moving_cell_site_ids] = NO_CELL_STATE
+        lattice.site_type[moving_cell_new_site_ids] = 4 # sitetype = cancer cell
+        lattice.cell_id[moving_cell_new_site_ids] = moving_cell_ids
+        lattice.cell_state[moving_cell_new_site_ids] = 1
+
+        move_cells(new_dict_of_cancer_cells, moving_cell_ids, moving_cell_new_site_ids, lattice)
+        moved_site_ids.update(zip(claiming_site_ids[claim_rows[claim_is_move]].tolist(), moving_cell_new_site_ids.tolist()))
+
+        # ... births: new cancer cells on the claimed sites
+        new_cancer_cell_site_ids = target_site_ids[~claim_is_move]
+        new_cancer_cell_ids = lattice.cell_id_allocator.allocate_many(new_cancer_cell_site_ids.size)
+
+        lattice.site_type[new_cancer_cell_site_ids] = 4 # sitetype = cancer cell
+        lattice.cell_id[new_cancer_cell_site_ids] = new_cancer_cell_ids
+        lattice.cell_state[new_cancer_cell_site_ids] = 1
+
+        add_cells(
+            new_dict_of_cancer_cells, CancerCell, new_cancer_cell_ids, new_cancer_cell_site_ids, 1, lattice, # proliferative
+            lineage_ids=get_lineage_ids(new_dict_of_cancer_cells, parent_cell_ids) # of their parents
+        )
+        changed_site_ids.extend([moving_cell_site_ids, moving_cell_new_site_ids, new_cancer_cell_site_ids])
+
+        # ... in model_4, the sites vacated by moves are claimed again within the step, as in update_cell_states,
+        # with one claim per vacated site and the births in order of site_id
+        if model_type != "model_4" or moving_cell_site_ids.size == 0:
+            break
+        claiming_site_ids, claiming_adjacent_site_ids, is_claimed = get_vacated_site_claims(
+            moving_cell_site_ids, moving_cell_ids, lattice.adjacent_site_ids, start_site_type, start_cell_id, start_cell_state
+        )
+        claim_rows, claim_cols, claim_is_move = get_growth_claims(np.where(is_claimed, 3, NO_SITE_TYPE), p_cc_grow, model_type, rng=rng)
+        order = np.argsort(claiming_adjacent_site_ids[claim_rows, claim_cols], kind='stable')
+        claim_rows, claim_cols, claim_is_move = claim_rows[order], claim_cols[order], claim_is_move[order]
+
+    mark_stage("cancer_cells")
+
+    # ===== [2] hepatocytes adjacent to proliferative cancer cells change states =====
+    # ... as in update_cell_states, a hepatocyte is processed once per adjacent proliferative cancer cell (n_rounds times)
+    hep_site_ids, n_rounds = np.unique(adjacent_site_ids[adjacent_site_types == 2], return_counts=True)
+    hep_site_ids = hep_site_ids.astype(np.int64)
+    hep_ids = lattice.cell_id[hep_site_ids]
+    is_damaged, is_cleared, is_fibrotic = get_hepatocyte_fates(
+        lattice, hep_site_ids, n_rounds, p_hep_damaged, p_hep_cleared, model_type, rng=rng
+    )
+
+    lattice.cell_state[hep_site_ids[is_damaged]] = 2
+    set_cell_states(new_dict_of_hepatocytes, hep_ids[is_damaged], 2)
+
+    for is_removed, site_type in ((is_cleared, 3), (is_fibrotic, 5)): # change to Not Occupied or ECM
+        lattice.site_type[hep_site_ids[is_removed]] = site_type
+        lattice.cell_id[hep_site_ids[is_removed]] = NO_CELL_ID
+        lattice.cell_state[hep_site_ids[is_removed]] = NO_CELL_STATE
+        remove_cells(new_dict_of_hepatocytes, hep_ids[is_removed])
+
+    mark_stage("hepatocytes")
+
+    lattice.update_frontier(np.concatenate(changed_site_ids + [hep_site_ids[is_cleared | is_fibrotic]]))
+    mark_stage("frontier")
+
+    new_cell_dictionaries = {
+        "CancerCell": new_dict_of_cancer_cells, "Hepatocyte": new_dict_of_hepatocytes
+    }
+
+    return new_cell_dictionaries, lattice
+
+def implicit_immune_predation_vectorized(
+    cell_dictionaries: Dict[str, Dict],
+    lattice: ArrayLattice,
+    parameters: Dict[str, float],
+    rng: np.random.Generator=None
+) -> Tuple[Dict, ArrayLattice]:
+    """_summary_
+
+    This function simulates cancer cell death (implicitly killed by cytotoxic immune cells), with cell_dictionaries and lattice updated accordingly,
+    killing all cells in one batch.
+
+    Args:
+        cell_dictionaries (Dict[str, Dict]): a Dict of Dict containing the CancerCell and Hepatocyte objects
+        lattice (ArrayLattice): the lattice following initialisation of CancerCell objects
+        parameters (Dict[str, float]): parameters to be used in the simulation (see settings.py)
+        rng (np.random.Generator, optional): the random number generator of the simulation. Defaults to None, i.e. the global np.random state.
+
+    Returns:
+        Tuple[Dict, ArrayLattice]: an updated Dict of Dict containing the CancerCell and Hepatocyte objects (with updated attributes; newly created and deleted objects), and the updated lattice
+    """
+
+    rng = get_rng(rng)
+    p_cc_killed = parameters['P_CC_KILLED']
+
+    dict_of_cancer_cells, dict_of_hepatocytes = \
+        cell_dictionaries['CancerCell'], cell_dictionaries['Hepatocyte']
+
+    new_dict_of_cancer_cells = copy_cell_dictionary(dict_of_cancer_cells)
+    new_dict_of_hepatocytes  = copy_cell_dictionary(dict_of_hepatocytes)
+
+    # K sites are immune infiltrated/attacked, K being the number of sites occupied by cancer cells,
+    # and cancer cells under attack are killed with a probability
+    tumour_site_ids = get_tumour_site_ids(dict_of_cancer_cells, lattice)
+    p_cc_killed = get_kill_probabilities(dict_of_cancer_cells, lattice, tumour_site_ids, p_cc_killed)
+    killed_site_ids = sample_killed_site_ids(tumour_site_ids, lattice.n_sites, p_cc_killed, rng=rng)
+    mark_stage("sample")
+
+    remove_cells(new_dict_of_cancer_cells, lattice.cell_id[killed_site_ids])
+
+    lattice.site_type[killed_site_ids] = 3 # change to Not Occupied
+    lattice.cell_id[killed_site_ids] = NO_CELL_ID
+    lattice.cell_state[killed_site_ids] = NO_CELL_STATE
+    mark_stage("kill")
+    lattice.update_frontier(killed_site_ids)
+    mark_stage("frontier")
+
+    new_cell_dictionaries = {
+        "CancerCell": new_dict_of_cancer_cells, "Hepatocyte": new_dict_of_hepatocytes
+    }
+
+    return new_cell_dictionaries, lattice
+
+def get_batch_adjacent_site_ids(adjacent_site_ids: np.ndarray, n_replicates: int) -> np.ndarray:
+    # the adjacent site ids of n_replicates replicates of the N sites flattened to (R*N,), i.e. batch site id site_id + replicate*N, of shape (R*N, 6)
+    n_sites = adjacent_site_ids.shape[0]
+    adjacent_site_ids = adjacent_site_ids.astype(np.int64)
+    offsets = (np.arange(n_replicates, dtype=np.int64) * n_sites)[:, None, None]
+    return np.where(adjacent_site_ids != NO_ADJACENT_SITE_ID, adjacent_site_ids + offsets, NO_ADJACENT_SITE_ID).reshape(-1, adjacent_site_ids.shape[1])
+
+def get_is_active_batch(site_type: np.ndarray, adjacent_site_ids: np.ndarray, batch_site_ids: np.ndarray) -> np.ndarray:
+    # whether the sites of a batch (site_type of shape (R*N,), adjacent_site_ids of get_batch_adjacent_site_ids) are on the active frontier,
+    # i.e. cancer cells with an adjacent NO or HEP site
+    batch_adjacent_site_ids = adjacent_site_ids[batch_site_ids]
+    batch_adjacent_site_types = np.where(batch_adjacent_site_ids != NO_ADJACENT_SITE_ID, site_type[batch_adjacent_site_ids], NO_SITE_TYPE)
+    return (site_type[batch_site_ids] == 4) & ((batch_adjacent_site_types == 2) | (batch_adjacent_site_types == 3)).any(axis=1)
+
+def update_is_active_batch(is_active: np.ndarray, site_type: np.ndarray, adjacent_site_ids: np.ndarray, batch_site_ids: np.ndarray):
+    # updates the active frontier of a batch (is_active of shape (R*N,)) around the sites whose site_type changed, as ActiveFrontier.update
+    affected_site_ids = np.concatenate([batch_site_ids, adjacent_site_ids[batch_site_ids].ravel()])
+    affected_site_ids = np.unique(affected_site_ids[affected_site_ids != NO_ADJACENT_SITE_ID])
+    is_active[affected_site_ids] = get_is_active_batch(site_type, adjacent_site_ids, affected_site_ids)
+
+def draw_random_numbers(rngs: List[np.random.Generator], counts: np.ndarray, n_rows: int=1) -> np.ndarray:
+    # counts[r] random numbers from rngs[r] per row, concatenated over replicates, of shape (n_rows, counts.sum())
+    # as rngs[r].random((n_rows, counts[r])) would draw them
+    return np.concatenate([rng.random((n_rows, count)) for rng, count in zip(rngs, counts.tolist())], axis=1)
+
+def update_cell_states_batched(
+    site_type: np.ndarray,
+    cell_id: np.ndarray,
+    cell_state: np.ndarray,
+    next_cell_ids: np.ndarray,
+    zonation_type: np.ndarray,
+    adjacent_site_ids: np.ndarray,
+    parameters: Dict[str, float],
+    model_type: str,
+    rngs: List[np.random.Generator],
+    is_active: np.ndarray=None
+):
+    """_summary_
+
+    This function advances R replicates of a lattice by one step of update_cell_states_vectorized, in one pass over the (R, N) arrays of
+    the replicates. The random numbers of replicate r are drawn from rngs[r], in the order
+    and numbers update_cell_states_vectorized draws them, so that every replicate evolves exactly as with engine="vectorized" and its rng.
+    Only the lattices are updated, not the cells.
+
+    Args:
+        site_type (np.ndarray): the site types of the replicates, of shape (R, N), updated in place
+        cell_id (np.ndarray): the cell ids of the replicates, of shape (R, N), updated in place
+        cell_state (np.ndarray): the cell states of the replicates, of shape (R, N), updated in place
+        next_cell_ids (np.ndarray): the next cell id of every replicate (see CellIdAllocator), of shape (R,), updated in place
+        zonation_type (np.ndarray): the zonation types of the N sites
+        adjacent_site_ids (np.ndarray): the adjacent site ids of the replicates, of shape (R*N, 6), see get_batch_adjacent_site_ids
+        parameters (Dict[str, float]): parameters to be used in the simulation (see settings.py)
+        model_type (str): model type to implement in the simulation
+        rngs (List[np.random.Generator]): the random number generators of the R replicates
+        is_active (np.ndarray, optional): the active frontier of the replicates (see ActiveFrontier), of shape (R, N), updated in place.
+            Defaults to None, i.e. found from all cancer cells.
+    """
+
+    n_replicates, n_sites = site_type.shape
+    site_type, cell_id, cell_state = site_type.reshape(-1), cell_id.reshape(-1), cell_state.reshape(-1) # views, indexed by batch site ids
+
+    # ===== [1] proliferative cancer cells on the active frontier, i.e. with adjacent NO or HEP sites, grow (or move, in model_4) =====
+    if is_active is None:
+        cancer_cell_site_ids = np.flatnonzero(site_type == 4)
+        cancer_cell_site_ids = cancer_cell_site_ids[get_is_active_batch(site_type, adjacent_site_ids, cancer_cell_site_ids)]
+    else:
+        is_active = is_active.reshape(-1)
+        cancer_cell_site_ids = np.flatnonzero(is_active)
+    cancer_cell_site_ids = cancer_cell_site_ids[cell_state[cancer_cell_site_ids] == 1]
+    batch_adjacent_site_ids = adjacent_site_ids[cancer_cell_site_ids]
+    batch_adjacent_site_types = np.where(batch_adjacent_site_ids != NO_ADJACENT_SITE_ID, site_type[batch_adjacent_site_ids], NO_SITE_TYPE)
+    replicate_of_row = cancer_cell_site_ids // n_sites
+
+    if model_type == "model_4": # the lattices at the start of the step, to find the cells claiming the sites vacated by moves
+        start_site_type, start_cell_id, start_cell_state = site_type.copy(), cell_id.copy(), cell_state.copy()
+
+    # ... random numbers of the adjacent NO sites, in row-major order within each replicate
+    n_empty_sites = np.bincount(replicate_of_row, weights=(batch_adjacent_site_types == 3).sum(axis=1), minlength=n_replicates).astype(np.int64)
+    claim_rows, claim_cols, claim_is_move = get_growth_claims(
+        batch_adjacent_site_types, parameters['P_CC_GROW'], model_type, random_numbers=draw_random_numbers(rngs, n_empty_sites)[0]
+    )
+
+    # resolve conflicts when several cells target the same NO site (batch site ids of different replicates never conflict)
+    winning_claims = resolve_conflicts(batch_adjacent_site_ids[claim_rows, claim_cols], cell_id[cancer_cell_site_ids[claim_rows]])
+    claim_rows, claim_cols, claim_is_move = claim_rows[winning_claims], claim_cols[winning_claims], claim_is_move[winning_claims]
+
+    claiming_site_ids, claiming_adjacent_site_ids = cancer_cell_site_ids, batch_adjacent_site_ids
+    moved_site_ids = {} # the sites of the cells that moved during the step, keyed by their sites at the start of the step
+    changed_site_ids = []
+    while True:
+        target_site_ids = claiming_adjacent_site_ids[claim_rows, claim_cols]
+        claiming_cell_site_ids = claiming_site_ids[claim_rows]
+        if moved_site_ids:
+            claiming_cell_site_ids = np.array([moved_site_ids.get(site_id, site_id) for site_id in claiming_cell_site_ids.tolist()], dtype=np.int64)
+
+        # ... moves: previous sites to be emptied, new sites to be filled
+        moving_cell_site_ids = claiming_cell_site_ids[claim_is_move]
+        moving_cell_new_site_ids = target_site_ids[claim_is_move]
+        moving_cell_ids = cell_id[moving_cell_site_ids]
+
+        site_type[moving_cell_site_ids] = 3 # sitetype = not occupied
+        cell_id[moving_cell_site_ids] = NO_CELL_ID
+        cell_state[moving_cell_site_ids] = NO_CELL_STATE
+        site_type[moving_cell_new_site_ids] = 4 # sitetype = cancer cell
+        cell_id[moving_cell_new_site_ids] = moving_cell_ids
+        cell_state[moving_cell_new_site_ids] = 1
+        moved_site_ids.update(zip(claiming_site_ids[claim_rows[claim_is_move]].tolist(), moving_cell_new_site_ids.tolist()))
+
+        # ... births: new cancer cells on the claimed sites, with the next cell ids of their replicate in order of site_id
+        new_cancer_cell_site_ids = target_site_ids[~claim_is_move]
+        replicate_of_birth = new_cancer_cell_site_ids // n_sites
+        n_births = np.bincount(replicate_of_birth, minlength=n_replicates)
+        birth_offsets = np.concatenate([[0], np.cumsum(n_births)[:-1]])
+
+        site_type[new_cancer_cell_site_ids] = 4 # sitetype = cancer cell
+        cell_id[new_cancer_cell_site_ids] = next_cell_ids[replicate_of_birth] + np.arange(new_cancer_cell_site_ids.size) - birth_offsets[replicate_of_birth]
+        cell_state[new_cancer_cell_site_ids] = 1
+        next_cell_ids += n_births
+        changed_site_ids.extend([moving_cell_site_ids, moving_cell_new_site_ids, new_cancer_cell_site_ids])
+
+        # ... in model_4, the sites vacated by moves are claimed again within the step, as in update_cell_states_vectorized
+        if model_type != "model_4" or moving_cell_site_ids.size == 0:
+            break
+        claiming_site_ids, claiming_adjacent_site_ids, is_claimed = get_vacated_site_claims(
+            moving_cell_site_ids, moving_cell_ids, adjacent_site_ids, start_site_type, start_cell_id, start_cell_state
+        )
+        claim_rows, claim_cols, claim_is_move = get_growth_claims(
+            np.where(is_claimed, 3, NO_SITE_TYPE), parameters['P_CC_GROW'], model_type,
+            random_numbers=draw_random_numbers(rngs, np.bincount(claiming_site_ids // n_sites, weights=is_claimed.sum(axis=1), minlength=n_replicates).astype(np.int64))[0]
+        )
+        order = np.argsort(claiming_adjacent_site_ids[claim_rows, claim_cols], kind='stable')
+        claim_rows, claim_cols, claim_is_move = claim_rows[order], claim_cols[order], claim_is_move[order]
+
+    # ===== [2] hepatocytes adjacent to proliferative cancer cells change states, once per adjacent proliferative cancer cell =====
+    hep_site_ids, n_rounds = np.unique(batch_adjacent_site_ids[batch_adjacent_site_types == 2], return_counts=True)
+    hep_adjacent_site_ids = adjacent_site_ids[hep_site_ids]
+    n_adjacent_cancer_cells = ((hep_adjacent_site_ids != NO_ADJACENT_SITE_ID) & (site_type[hep_adjacent_site_ids] == 4)).sum(axis=1)
+
+    is_damaged, is_cleared, is_fibrotic = draw_hepatocyte_fates(
+        cell_state[hep_site_ids], n_adjacent_cancer_cells, zonation_type[hep_site_ids % n_sites], n_rounds,
+        parameters['P_HEP_DAMAGED'], parameters['P_HEP_CLEARED'], model_type,
+        draw_random_numbers(rngs, np.bincount(hep_site_ids // n_sites, minlength=n_replicates), n_rows=2)
+    )
+
+    cell_state[hep_site_ids[is_damaged]] = 2
+    for is_removed, removed_site_type in ((is_cleared, 3), (is_fibrotic, 5)): # change to Not Occupied or ECM
+        site_type[hep_site_ids[is_removed]] = removed_site_type
+        cell_id[hep_site_ids[is_removed]] = NO_CELL_ID
+        cell_state[hep_site_ids[is_removed]] = NO_CELL_STATE
+
+    if is_active is not None:
+        update_is_active_batch(is_active, site_type, adjacent_site_ids, np.concatenate(changed_site_ids + [hep_site_ids[is_cleared | is_fibrotic]]))
+
+def implicit_immune_predation_batched(
+    site_type: np.ndarray,
+    cell_id: np.ndarray,
+    cell_state: np.ndarray,
+    adjacent_site_ids: np.ndarray,
+    parameters: Dict[str, float],
+    rngs: List[np.random.Generator],
+    is_active: np.ndarray=None
+):
+    # one step of implicit_immune_predation_vectorized for each of R replicates, with the (R, N) arrays of update_cell_states_batched
+    n_sites = site_type.shape[1]
+    killed_site_ids = []
+    for r, rng in enumerate(rngs):
+        killed_site_ids.append(sample_killed_site_ids(np.flatnonzero(site_type[r] == 4), n_sites, parameters['P_CC_KILLED'], rng=rng) + r * n_sites)
+    killed_site_ids = np.concatenate(killed_site_ids)
+
+    site_type, cell_id, cell_state = site_type.reshape(-1), cell_id.reshape(-1), cell_state.reshape(-1)
+    site_type[killed_site_ids] = 3 # change to Not Occupied
+    cell_id[killed_site_ids] = NO_CELL_ID
+    cell_state[killed_site_ids] = NO_CELL_STATE
+    if is_active is not None:
+        update_is_active_batch(is_active.reshape(-1), site_type, adjacent_site_ids, killed_site_ids)
+
+def run_replicates_vectorized(
+    lattices: List[ArrayLattice],
+    parameters: Dict[str, float],
+    model_type: str,
+    T: int,
+    rngs: List[np.random.Generator],
+    snapshot_times: List[int]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """_summary_
+
+    This function advances replicates of a simulation from their lattices for T steps, stacked into (R, N) arrays updated together by
+    update_cell_states_batched (and implicit_immune_predation_batched in model_3), so that the Python overhead of a step is paid once for all replicates.
+    Every replicate gives the same lattices as T steps of update_cell_states (and implicit_immune_predation in model_3) with engine="vectorized"
+    and the same rng, but only the lattices are updated, not the cells.
+
+    Args:
+        lattices (List[ArrayLattice]): the lattices of the R replicates, after init_cell_dictionaries, with the same geometry; updated in place
+        parameters (Dict[str, float]): parameters to be used in the simulation (see settings.py)
+        model_type (str): model type to implement in the simulation
+        T (int): the number of time steps
+        rngs (List[np.random.Generator]): the random number generators of the replicates
+        snapshot_times (List[int]): the times at which the lattices are recorded
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: the site_type and cell_id arrays of the replicates at snapshot times, of shape (R, number of snapshot times, N)
+    """
+
+    snapshot_times = sorted(set(t for t in snapshot_times if 0 <= t <= T))
+    zonation_type = np.asarray(lattices[0].zonation_type)
+    adjacent_site_ids = get_batch_adjacent_site_ids(np.asarray(lattices[0].adjacent_site_ids), len(lattices))
+
+    site_type = np.stack([lattice.site_type for lattice in lattices])
+    cell_id = np.stack([lattice.cell_id for lattice in lattices])
+    cell_state = np.stack([lattice.cell_state for lattice in lattices])
+    next_cell_ids = np.array([lattice.cell_id_allocator.next_cell_id for lattice in lattices], dtype=np.int64)
+    snapshot_site_type = np.empty((len(lattices), len(snapshot_times), site_type.shape[1]), dtype=site_type.dtype)
+    snapshot_cell_id = np.empty((len(lattices), len(snapshot_times), site_type.shape[1]), dtype=cell_id.dtype)
+
+    is_active = np.zeros(site_type.shape, dtype=bool)
+    cancer_cell_site_ids = np.flatnonzero(site_type == 4)
+    is_active.reshape(-1)[cancer_cell_site_ids] = get_is_active_batch(site_type.reshape(-1), adjacent_site_ids, cancer_cell_site_ids)
+
+    i_snapshot = 0
+    for t in range(T+1):
+        if i_snapshot < len(snapshot_times) and snapshot_times[i_snapshot] == t:
+            snapshot_site_type[:, i_snapshot] = site_type
+            snapshot_cell_id[:, i_snapshot] = cell_id
+            i_snapshot += 1
+        if t == T:
+            break
+
+        update_cell_states_batched(
+            site_type, cell_id, cell_state, next_cell_ids, zonation_type, adjacent_site_ids, parameters, model_type, rngs, is_active=is_active
+        )
+        if model_type == "model_3":
+            implicit_immune_predation_batched(site_type, cell_id, cell_state, adjacent_site_ids, parameters, rngs, is_active=is_active)
+
+    for r, lattice in enumerate(lattices):
+        lattice.site_type[:], lattice.cell_id[:], lattice.cell_state[:] = site_type[r], cell_id[r], cell_state[r]
+        lattice.cell_id_allocator.set_state({"next_cell_id": next_cell_ids[r]})
+        lattice.frontier = None # rebuilt on first use
+
+    return snapshot_site_type, snapshot_cell_id
@@ -0,0 +1,98 @@
+"""_summary_
+
+Tests of the tumour labels of analysis_functions.py: the batch connected components and the incremental TumourLabeller
+give the same tumours as DBSCAN(eps=1.05, min_samples=1), the method of the original notebooks, over seeded simulations.
+
+"""
+
+import contextlib
+import io
+
+import numpy as np
+import pytest
+from sklearn.cluster import DBSCAN
+
+from classes_and_functions.analysis_functions import TumourLabeller, get_connected_components
+from classes_and_functions.cell_classes import CancerCell, Hepatocyte
+from classes_and_functions.initialisation_functions import init_cell_dictionaries
+from classes_and_functions.lattice_io_functions import load_lattice
+from classes_and_functions.settings import get_simulation_parameters
+from classes_and_functions.simulation_functions import update_cell_states, implicit_immune_predation
+
+PATH_TO_LATTICE = "./files/lattice_with_CVs_PTs_2025-06-23_annotated_without_tumour.csv"
+N_STEPS = 15
+
+@pytest.fixture(scope="module")
+def lattice_csv_path(request) -> str:
+    return str(request.config.rootpath / PATH_TO_LATTICE)
+
+def get_partition(site_ids: np.ndarray, labels: np.ndarray) -> set:
+    # the tumours as a set of sets of site ids, independent of the numbering of labels
+    return {frozenset(site_ids[labels == label].tolist()) for label in np.unique(labels)}
+
+def get_dbscan_partition(lattice, site_ids: np.ndarray) -> set:
+    labels = DBSCAN(eps=1.05, min_samples=1).fit(np.column_stack([lattice.x[site_ids], lattice.y[site_ids]])).labels_
+    return get_partition(site_ids, labels)
+
+def assert_same_tumours(lattice, labeller: TumourLabeller):
+    site_ids = np.flatnonzero(lattice.site_type == 4)
+    expected = get_dbscan_partition(lattice, site_ids)
+    assert get_partition(site_ids, get_connected_components(site_ids, lattice.adjacent_site_ids[site_ids])) == expected
+    labeller.update()
+    assert get_partition(site_ids, labeller.get_labels(site_ids)) == expected
+    return len(expected)
+
+@pytest.mark.parametrize("model_type, engine", [("model_3", "loop"), ("model_3", "vectorized"), ("model_4", "loop"), ("model_4", "vectorized")])
+def test_labels_match_dbscan(lattice_csv_path: str, model_type: str, engine: str):
+    parameters = get_simulation_parameters(model_type)
+    rng = np.random.default_rng(0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        cell_dictionaries, lattice = init_cell_dictionaries(
+            lattice=load_lattice(lattice_csv_path), n_cancer_cells_init=20, CancerCell=CancerCell, Hepatocyte=Hepatocyte, rng=rng
+        )
+    labeller = TumourLabeller(lattice)
+    assert_same_tumours(lattice, labeller)
+
+    n_splits = 0
+    for _ in range(N_STEPS):
+        cell_dictionaries, lattice = update_cell_states(
+            cell_dictionaries, lattice, parameters, CancerCell, Hepatocyte, model_type=model_type, engine=engine, rng=rng
+        )
+        n_tumours = assert_same_tumours(lattice, labeller)
+        if model_type == "model_3":
+            cell_dictionaries, lattice = implicit_immune_predation(
+                cell_dictionaries, lattice, parameters, model_type=model_type, engine=engine, rng=rng
+            )
+            n_splits += assert_same_tumours(lattice, labeller) > n_tumours
+
+    if model_type == "model_3": # kills split tumours, which the labeller labels again
+        assert n_splits > 0
+
+def get_row_of_hepatocytes(lattice, n_sites: int) -> np.ndarray:
+    # n_sites adjacent hepatocytes in a row along x
+    for site_id in np.flatnonzero(lattice.site_type == 2).tolist():
+        site_ids = [site_id]
+        while len(site_ids) < n_sites:
+            adjacent_site_ids = lattice.get_adjacent_site_ids(site_ids[-1])
+            is_next = np.isclose(lattice.y[adjacent_site_ids], lattice.y[site_ids[-1]]) & (lattice.x[adjacent_site_ids] > lattice.x[site_ids[-1]])
+            if not is_next.any() or lattice.site_type[adjacent_site_ids[is_next][0]] != 2:
+                break
+            site_ids.append(int(adjacent_site_ids[is_next][0]))
+        if len(site_ids) == n_sites:
+            return np.array(site_ids)
+
+def test_labeller_after_kills_splitting_a_tumour(lattice_csv_path: str):
+    # a row of cancer cells cut in the middle by a kill, and joined again by a birth
+    lattice = load_lattice(lattice_csv_path)
+    site_ids = get_row_of_hepatocytes(lattice, 5)
+    lattice.site_type[site_ids] = 4
+    labeller = TumourLabeller(lattice)
+    assert assert_same_tumours(lattice, labeller) == 1
+
+    lattice.site_type[site_ids[2]] = 3
+    labeller.update(lost_site_ids=site_ids[2:3])
+    assert assert_same_tumours(lattice, labeller) == 2
+
+    lattice.site_type[site_ids[2]] = 4
+    labeller.update(gained_site_ids=site_ids[2:3])
+    assert assert_same_tumours(lattice, labeller) == 1
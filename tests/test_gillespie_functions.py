@@ -0,0 +1,54 @@
+"""_summary_
+
+Tests of GillespieSimulation of gillespie_functions.py: it runs for every model type with the parameters of get_simulation_parameters,
+and run_simulation runs with engine="gillespie".
+
+"""
+
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+from classes_and_functions.cell_classes import CancerCell, Hepatocyte
+from classes_and_functions.gillespie_functions import GillespieSimulation
+from classes_and_functions.initialisation_functions import init_cell_dictionaries
+from classes_and_functions.lattice_io_functions import load_lattice
+from classes_and_functions.settings import get_simulation_parameters
+from classes_and_functions.sweep_functions import run_simulation
+
+PATH_TO_LATTICE = "./files/lattice_with_CVs_PTs_2025-06-23_annotated_without_tumour.csv"
+MODEL_TYPES = ["model_1", "model_2", "model_3", "model_4"]
+
+@pytest.fixture(scope="module")
+def lattice_csv_path(request) -> str:
+    return str(request.config.rootpath / PATH_TO_LATTICE)
+
+@pytest.mark.parametrize("model_type", MODEL_TYPES)
+def test_run_until(lattice_csv_path: str, model_type: str):
+    rng = np.random.default_rng(0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        cell_dictionaries, lattice = init_cell_dictionaries(
+            lattice=load_lattice(lattice_csv_path), n_cancer_cells_init=20, CancerCell=CancerCell, Hepatocyte=Hepatocyte, rng=rng
+        )
+    simulation = GillespieSimulation(
+        cell_dictionaries, lattice, get_simulation_parameters(model_type), CancerCell, Hepatocyte, model_type=model_type, rng=rng
+    )
+    for t in range(1, 6):
+        cell_dictionaries, lattice = simulation.run_until(t)
+        assert simulation.t == t
+
+    # the cells follow the lattice
+    assert simulation.n_cancer_cells == (lattice.site_type == 4).sum() == len(cell_dictionaries['CancerCell'])
+    assert len(cell_dictionaries['Hepatocyte']) == (lattice.site_type == 2).sum()
+    assert simulation.n_cancer_cells > 0
+
+@pytest.mark.parametrize("model_type", MODEL_TYPES)
+def test_run_simulation(lattice_csv_path: str, model_type: str):
+    with contextlib.redirect_stdout(io.StringIO()):
+        tumour_sizes = run_simulation(
+            load_lattice(lattice_csv_path), model_type, 0.5, 5, get_simulation_parameters(model_type),
+            engine="gillespie", rng=np.random.default_rng(0)
+        )
+    assert not tumour_sizes.empty
@@ -0,0 +1,97 @@
+"""_summary_
+
+Tests of the samplers of the cancer cells killed by implicit immune predation, sample_killed_site_ids of vectorized_functions.py and
+the selection sampling of implicit_immune_predation_kernel of numba_functions.py, against the whole-lattice sampler of the original
+implicit_immune_predation: K of the N sites attacked, K being the number of cancer cells, and each cancer cell under attack killed
+with probability P_CC_KILLED, i.e. Binomial(Hypergeometric(K, N-K, K), P_CC_KILLED) cancer cells killed, uniformly over the tumour sites.
+
+"""
+
+import numpy as np
+import pytest
+from scipy.stats import chisquare
+
+from classes_and_functions.lattice_classes import NO_CELL_STATE
+from classes_and_functions.numba_functions import implicit_immune_predation_kernel, kernel_random_state
+from classes_and_functions.vectorized_functions import sample_killed_site_ids
+
+N_SITES = 1000
+N_TUMOUR_SITES = 200
+P_CC_KILLED = 0.5
+N_SAMPLES = 20000
+
+def sample_whole_lattice(tumour_site_ids: np.ndarray, p_cc_killed: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    # the original sampler: K sites attacked out of all N sites, and the cancer cells on them killed with their probability
+    is_tumour_site = np.zeros(N_SITES, dtype=bool)
+    is_tumour_site[tumour_site_ids] = True
+    attacked_site_ids = rng.choice(N_SITES, size=tumour_site_ids.size, replace=False)
+    attacked = np.searchsorted(tumour_site_ids, attacked_site_ids[is_tumour_site[attacked_site_ids]])
+    return tumour_site_ids[attacked[rng.random(attacked.size) < p_cc_killed[attacked]]]
+
+def sample_vectorized(tumour_site_ids: np.ndarray, p_cc_killed: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    return sample_killed_site_ids(tumour_site_ids, N_SITES, p_cc_killed if np.ptp(p_cc_killed) > 0 else p_cc_killed[0], rng=rng)
+
+def sample_numba(tumour_site_ids: np.ndarray, p_cc_killed: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    site_type = np.full(N_SITES, 2, dtype=np.uint8)
+    site_type[tumour_site_ids] = 4
+    cell_id = np.arange(N_SITES, dtype=np.int64)
+    cell_state = np.ones(N_SITES, dtype=np.int8)
+    with kernel_random_state():
+        killed_site_ids, killed_cell_ids = implicit_immune_predation_kernel(
+            site_type, cell_id, cell_state, tumour_site_ids, N_SITES, p_cc_killed if np.ptp(p_cc_killed) > 0 else p_cc_killed[:1],
+            int(rng.integers(2**32))
+        )
+    # the killed cells are removed from the lattice
+    assert np.array_equal(killed_cell_ids, killed_site_ids)
+    assert (site_type[killed_site_ids] == 3).all() and (cell_state[killed_site_ids] == NO_CELL_STATE).all()
+    assert (site_type == 4).sum() == tumour_site_ids.size - killed_site_ids.size
+    return killed_site_ids
+
+SAMPLERS = {"whole_lattice": sample_whole_lattice, "vectorized": sample_vectorized, "numba": sample_numba}
+
+@pytest.fixture(scope="module")
+def tumour_site_ids() -> np.ndarray:
+    return np.sort(np.random.default_rng(0).choice(N_SITES, size=N_TUMOUR_SITES, replace=False)).astype(np.int64)
+
+def get_kill_counts(sampler, tumour_site_ids: np.ndarray, p_cc_killed: np.ndarray, seed: int) -> tuple:
+    # the number of times each tumour site is killed, and the number of cancer cells killed, over N_SAMPLES samples
+    rng = np.random.default_rng(seed)
+    kill_counts = np.zeros(N_SITES, dtype=np.int64)
+    n_killed = np.empty(N_SAMPLES, dtype=np.int64)
+    for i in range(N_SAMPLES):
+        killed_site_ids = sampler(tumour_site_ids, p_cc_killed, rng)
+        assert np.unique(killed_site_ids).size == killed_site_ids.size
+        kill_counts[killed_site_ids] += 1
+        n_killed[i] = killed_site_ids.size
+    return kill_counts, n_killed
+
+@pytest.mark.parametrize("sampler", SAMPLERS)
+def test_number_killed(tumour_site_ids: np.ndarray, sampler: str):
+    kill_counts, n_killed = get_kill_counts(SAMPLERS[sampler], tumour_site_ids, np.full(N_TUMOUR_SITES, P_CC_KILLED), seed=1)
+
+    # Binomial(Hypergeometric(K, N-K, K), p)
+    K, N, p = N_TUMOUR_SITES, N_SITES, P_CC_KILLED
+    mean_attacked = K * K / N
+    variance_attacked = K * (K / N) * ((N - K) / N) * ((N - K) / (N - 1))
+    mean = p * mean_attacked
+    variance = p * (1 - p) * mean_attacked + p**2 * variance_attacked
+
+    assert abs(n_killed.mean() - mean) < 4 * np.sqrt(variance / N_SAMPLES)
+    assert abs(n_killed.var(ddof=1) - variance) < 4 * variance * np.sqrt(2 / (N_SAMPLES - 1))
+
+    # only cancer cells are killed, uniformly over the tumour sites
+    assert kill_counts.sum() == n_killed.sum()
+    assert chisquare(kill_counts[tumour_site_ids]).pvalue > 1e-3
+
+@pytest.mark.parametrize("sampler", SAMPLERS)
+def test_kill_probabilities_per_cancer_cell(tumour_site_ids: np.ndarray, sampler: str):
+    # every cancer cell is attacked with probability K/N, and killed with its own probability
+    p_cc_killed = np.where(np.arange(N_TUMOUR_SITES) % 2 == 0, 0.2, 0.8)
+    kill_counts, _ = get_kill_counts(SAMPLERS[sampler], tumour_site_ids, p_cc_killed, seed=2)
+
+    for p in (0.2, 0.8):
+        is_of_p = p_cc_killed == p
+        expected = N_TUMOUR_SITES / N_SITES * p
+        standard_error = np.sqrt(expected * (1 - expected) / N_SAMPLES / is_of_p.sum())
+        assert abs(kill_counts[tumour_site_ids[is_of_p]].mean() / N_SAMPLES - expected) < 4 * standard_error
+        assert chisquare(kill_counts[tumour_site_ids[is_of_p]]).pvalue > 1e-3